@@ -14,7 +14,18 @@ add_to_apps_screen = [
 	}
 ]
 
-doc_events = {}
+jinja = {
+	"methods": [
+		"kaitet_taskwork.kaitet_taskwork.doctype.tw_weekly_disbursement.tw_weekly_disbursement.get_disbursement_payment_details",
+	]
+}
+
+doc_events = {
+	"Employee": {
+		"validate": "kaitet_taskwork.kaitet_taskwork.doctype.tw_payroll_number.tw_payroll_number.claim_employee_number",
+		"on_trash": "kaitet_taskwork.kaitet_taskwork.doctype.tw_payroll_number.tw_payroll_number.release_employee_number",
+	},
+}
 
 scheduler_events = {
 	"daily": [
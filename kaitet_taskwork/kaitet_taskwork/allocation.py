@@ -0,0 +1,195 @@
+# Copyright (c) 2025, Upande and contributors
+# For license information, please see license.txt
+
+"""
+Worker allocation for Task Work Assignments.
+
+A capacity matrix (worker × day, one task per worker per day) is built from
+the plan's workers, their bookings in other non-cancelled assignments and
+their weekly offs. Task demand is then filled day by day: the task with the
+most days of work left is served first (longest-processing-time first, which
+keeps the overall finish date short), and each task takes the free workers
+with the fewest days assigned so far, spreading pay evenly.
+
+Everything after the three loading queries happens in memory, so a plan of
+hundreds of workers over a couple of months and dozens of tasks is
+allocated in well under a second.
+"""
+
+import math
+from datetime import timedelta
+
+import frappe
+from frappe.utils import flt, getdate
+
+from kaitet_taskwork.kaitet_taskwork.utils import get_weekly_off_dates
+
+# Horizon used when the assignment has no expected end date
+DEFAULT_HORIZON_DAYS = 60
+
+
+def get_plan_workers(plan):
+	"""Active Task Workers listed on a Task Work Plan, with their full names."""
+	return frappe.db.sql("""
+		SELECT DISTINCT tw.name, tw.full_name
+		FROM `tabTask Plan` tp
+		INNER JOIN `tabTask Worker` tw ON tw.name = tp.task_worker
+		WHERE tp.parent = %s
+		  AND tp.parenttype = 'Task Work Plan'
+		  AND tw.status = 'Active'
+		ORDER BY tw.name
+	""", plan, as_dict=True)
+
+
+def get_plan_task_starts(plan):
+	"""``{task_name: first start date}`` of the tasks scheduled on a Task Work Plan."""
+	return dict(frappe.db.sql("""
+		SELECT tp.task_name, MIN(tp.start_date)
+		FROM `tabTask Plan` tp
+		WHERE tp.parent = %s
+		  AND tp.parenttype = 'Task Work Plan'
+		  AND tp.start_date IS NOT NULL
+		GROUP BY tp.task_name
+	""", plan))
+
+
+def build_capacity(workers, days, exclude_assignment=None):
+	"""
+	Return ``{worker: bytearray}`` where byte *i* is 1 if the worker is free
+	on ``days[i]``. Days already booked on another non-cancelled assignment
+	and weekly offs are 0.
+	"""
+	capacity = {w: bytearray(b"\x01" * len(days)) for w in workers}
+	if not workers or not days:
+		return capacity
+
+	day_index = {d: i for i, d in enumerate(days)}
+
+	booked = frappe.db.sql("""
+		SELECT DISTINCT wa.employee_name, wa.assignment_date
+		FROM `tabWorker Assignments` wa
+		INNER JOIN `tabTask Work Assignment` twa ON twa.name = wa.parent
+		WHERE wa.parenttype = 'Task Work Assignment'
+		  AND twa.docstatus < 2
+		  AND twa.name != %(exclude)s
+		  AND wa.employee_name IN %(workers)s
+		  AND wa.assignment_date BETWEEN %(start)s AND %(end)s
+	""", {
+		"exclude": exclude_assignment or "",
+		"workers": tuple(workers),
+		"start": days[0],
+		"end": days[-1],
+	})
+	for worker, day in booked:
+		i = day_index.get(getdate(day))
+		if i is not None:
+			capacity[worker][i] = 0
+
+	for worker, off_days in get_weekly_off_dates(list(workers), days[0], days[-1]).items():
+		if worker not in capacity:
+			continue
+		for day in off_days:
+			i = day_index.get(day)
+			if i is not None:
+				capacity[worker][i] = 0
+
+	return capacity
+
+
+def allocate(tasks, workers, days, capacity):
+	"""
+	Fill task demand from the capacity matrix.
+
+	*tasks* are dicts with ``task``, ``uom``, ``rate``, ``daily_target``,
+	``total_work`` and optionally ``workers`` (head count per day),
+	``days`` (planned duration) and ``start_date`` (first day the task may
+	be worked). Returns ``(rows, summary)``: Worker Assignments row dicts
+	and one summary dict per task.
+	"""
+	state = []
+	for t in tasks:
+		total = flt(t.get("total_work"))
+		if total <= 0:
+			continue
+		target = flt(t.get("daily_target")) or 1
+		if t.get("workers"):
+			per_day = int(t["workers"])
+		elif t.get("days"):
+			per_day = math.ceil(total / (int(t["days"]) * target))
+		else:
+			per_day = len(workers)
+		state.append({
+			"task": t, "target": target, "per_day": max(per_day, 1),
+			"start": getdate(t["start_date"]) if t.get("start_date") else None,
+			# Quantities are assigned to 2 decimals; so is what is left
+			"remaining": flt(total, 2), "used": set(), "days": 0,
+		})
+
+	load = dict.fromkeys(workers, 0)
+	rows = []
+
+	for i, day in enumerate(days):
+		if not any(s["remaining"] > 0 for s in state):
+			break
+		open_tasks = [s for s in state if s["remaining"] > 0 and (not s["start"] or s["start"] <= day)]
+		if not open_tasks:
+			continue
+
+		free = [w for w in workers if capacity[w][i]]
+		if not free:
+			continue
+		free.sort(key=lambda w: load[w])
+
+		# Most days of work left first
+		open_tasks.sort(key=lambda s: s["remaining"] / (s["target"] * s["per_day"]), reverse=True)
+		pos = 0
+		for s in open_tasks:
+			needed = min(s["per_day"], math.ceil(s["remaining"] / s["target"]), len(free) - pos)
+			if needed <= 0:
+				continue
+			t = s["task"]
+			rate = flt(t.get("rate"))
+			for worker in free[pos:pos + needed]:
+				qty = flt(min(s["target"], s["remaining"]), 2)
+				if qty <= 0:
+					break
+				rows.append({
+					"employee_name":       worker,
+					"task":                t.get("task"),
+					"uom":                 t.get("uom"),
+					"daily_target":        s["target"],
+					"rate":                rate,
+					"days":                1,
+					"quantity_assigned":   qty,
+					"total_assigned_cost": flt(rate * qty, 2),
+					"assignment_date":     day,
+				})
+				s["remaining"] = flt(s["remaining"] - qty, 2)
+				s["used"].add(worker)
+				load[worker] += 1
+				capacity[worker][i] = 0
+			s["days"] += 1
+			pos += needed
+			if pos >= len(free):
+				break
+
+	summary = []
+	for s in state:
+		t, total = s["task"], flt(s["task"].get("total_work"))
+		summary.append({
+			"task":           t.get("task_name") or t.get("task"),
+			"workers_needed": t.get("workers") or 1,
+			"workers_used":   len(s["used"]),
+			"total_work":     total,
+			"days_planned":   s["days"],
+			"completed":      round((total - max(s["remaining"], 0)) / total * 100),
+			"unassigned":     flt(max(s["remaining"], 0), 2),
+		})
+	return rows, summary
+
+
+def allocation_days(start_date, end_date=None):
+	"""The list of dates the allocation may use."""
+	start = getdate(start_date)
+	end = getdate(end_date) if end_date else start + timedelta(days=DEFAULT_HORIZON_DAYS - 1)
+	return [start + timedelta(days=n) for n in range((end - start).days + 1)]
@@ -0,0 +1,169 @@
+# Copyright (c) 2025, Upande and contributors
+# For license information, please see license.txt
+
+"""
+Worker availability over a planning horizon.
+
+Every booking that overlaps the horizon (the days of submitted
+assignments from the TW Worker Occupancy index, and the worker rows of
+open Task Work Plans) is loaded up front and merged into sorted, disjoint
+day intervals per worker. One sweep over the interval start/end events
+then records the booked workers of each day as a bitmask. Each task
+window is then answered from memory: the free workers are the candidates
+minus the days' masks, minus the workers for whom every day of the window
+is a company holiday or one of their weekly offs.
+"""
+
+from datetime import date
+
+import frappe
+from frappe.utils import getdate
+
+from kaitet_taskwork.kaitet_taskwork.doctype.tw_worker_occupancy.tw_worker_occupancy import LOOKUP_BATCH
+from kaitet_taskwork.kaitet_taskwork.utils import get_weekly_off_dates, get_worker_unit_field
+
+
+def _ordinal(value):
+	return getdate(value).toordinal()
+
+
+def merge_intervals(intervals):
+	"""Sorted, disjoint ``(start, end)`` covering *intervals*; adjacent ones are joined."""
+	merged = []
+	for start, end in sorted(intervals):
+		if merged and start <= merged[-1][1] + 1:
+			merged[-1][1] = max(merged[-1][1], end)
+		else:
+			merged.append([start, end])
+	return [tuple(interval) for interval in merged]
+
+
+class WorkerAvailability:
+	"""
+	Availability of the active Task Workers between *from_date* and
+	*to_date* (inclusive), limited to *unit* when Task Worker has a unit
+	field (``unit_filtered`` says whether it was applied). Workers on the
+	plan being staffed count as booked for its overlapping tasks, like any
+	other plan's. Days off are *company*'s default holiday list and each
+	worker's weekly offs.
+	"""
+
+	def __init__(self, from_date, to_date, unit=None, company=None):
+		self.first, self.last = sorted((_ordinal(from_date), _ordinal(to_date)))
+		self.workers = self._load_workers(unit)
+		self.bits = {worker.name: 1 << i for i, worker in enumerate(self.workers)}
+		self.everyone = (1 << len(self.workers)) - 1
+		self.bookings = self._load_bookings()
+		self.day_masks = self._sweep()
+		self._load_days_off(company)
+
+	def _load_workers(self, unit):
+		filters = {"status": "Active"}
+		unit_field = get_worker_unit_field(unit)
+		if unit_field:
+			filters[unit_field] = unit
+		self.unit_filtered = bool(unit_field)
+		return frappe.get_all("Task Worker", filters=filters, fields=["name"], order_by="name")
+
+	def _load_bookings(self):
+		"""Merged booked intervals per candidate worker, clipped to the horizon."""
+		if not self.workers:
+			return {}
+		values = {"from_date": date.fromordinal(self.first), "to_date": date.fromordinal(self.last)}
+		intervals = {}
+
+		# Submitted assignments, one occupancy row per worker and day
+		names = list(self.bits)
+		for i in range(0, len(names), LOOKUP_BATCH):
+			for worker, day in frappe.db.sql("""
+				SELECT worker, work_date FROM `tabTW Worker Occupancy`
+				WHERE worker IN %(workers)s AND work_date BETWEEN %(from_date)s AND %(to_date)s
+			""", dict(values, workers=tuple(names[i:i + LOOKUP_BATCH]))):
+				day = _ordinal(day)
+				intervals.setdefault(worker, []).append((day, day))
+
+		# Workers named on open plans, this one included
+		for worker, start, end in frappe.db.sql("""
+			SELECT tp.task_worker, tp.start_date, IFNULL(tp.end_date, tp.start_date)
+			FROM `tabTask Plan` tp
+			INNER JOIN `tabTask Work Plan` twp ON twp.name = tp.parent
+			WHERE tp.parenttype = 'Task Work Plan'
+			  AND twp.docstatus < 2
+			  AND IFNULL(tp.task_worker, '') != ''
+			  AND tp.start_date <= %(to_date)s
+			  AND IFNULL(tp.end_date, tp.start_date) >= %(from_date)s
+		""", values):
+			if worker in self.bits:
+				intervals.setdefault(worker, []).append(
+					(max(_ordinal(start), self.first), min(_ordinal(end), self.last))
+				)
+
+		return {worker: merge_intervals(spans) for worker, spans in intervals.items()}
+
+	def _sweep(self):
+		"""Bitmask of the booked workers for each day of the horizon."""
+		# A worker's intervals are disjoint, so its bit flips on at each
+		# start and off the day after each end
+		toggles = {}
+		for worker, intervals in self.bookings.items():
+			bit = self.bits[worker]
+			for start, end in intervals:
+				toggles[start] = toggles.get(start, 0) ^ bit
+				toggles[end + 1] = toggles.get(end + 1, 0) ^ bit
+
+		masks, booked = [], 0
+		for day in range(self.first, self.last + 1):
+			booked ^= toggles.get(day, 0)
+			masks.append(booked)
+		return masks
+
+	def _load_days_off(self, company):
+		"""Company holidays, and the workers sharing each set of weekly offs."""
+		horizon = (date.fromordinal(self.first), date.fromordinal(self.last))
+		default = frappe.get_cached_value("Company", company, "default_holiday_list") if company else None
+		self.holidays = {
+			_ordinal(day) for day in frappe.get_all(
+				"Holiday",
+				filters={"parent": default, "holiday_date": ["between", horizon]},
+				pluck="holiday_date",
+			)
+		} if default else set()
+
+		# Weekly off lists are shared, so few distinct sets of days come back
+		self.off_members = {}
+		names = list(self.bits)
+		for i in range(0, len(names), LOOKUP_BATCH):
+			for worker, days in get_weekly_off_dates(names[i:i + LOOKUP_BATCH], *horizon).items():
+				if worker in self.bits:
+					key = frozenset(_ordinal(day) for day in days)
+					self.off_members[key] = self.off_members.get(key, 0) | self.bits[worker]
+
+	def _window(self, start, end):
+		start, end = sorted((_ordinal(start), _ordinal(end)))
+		return max(start, self.first), min(end, self.last)
+
+	def available_mask(self, start, end):
+		"""Bitmask of the workers free on every day of start..end with at least one working day in it."""
+		start, end = self._window(start, end)
+		if start > end:
+			return self.everyone
+
+		booked = 0
+		for day in range(start - self.first, end - self.first + 1):
+			booked |= self.day_masks[day]
+		free = self.everyone & ~booked
+
+		working = set(range(start, end + 1)) - self.holidays
+		if not working:
+			return 0
+		for days, members in self.off_members.items():
+			if working <= days:
+				free &= ~members
+		return free
+
+	def count(self, start, end):
+		return bin(self.available_mask(start, end)).count("1")
+
+	def available_workers(self, start, end):
+		free = self.available_mask(start, end)
+		return [worker.name for worker in self.workers if free & self.bits[worker.name]]
@@ -0,0 +1,213 @@
+# Copyright (c) 2025, Upande and contributors
+# For license information, please see license.txt
+
+"""
+Batched child-table writes.
+
+Saving a document rewrites every child row with its own UPDATE, which is
+too slow for the very large tables produced by weekly payroll and harvest
+assignments. These helpers write many rows per statement instead. They
+skip document hooks, so callers are responsible for validation and totals.
+"""
+
+import frappe
+from frappe.model import numeric_fieldtypes
+from frappe.utils import cint, cstr, flt, get_datetime, getdate, now
+
+BATCH_SIZE = 1000
+
+_STANDARD_CHILD_COLUMNS = (
+	"name", "owner", "creation", "modified", "modified_by",
+	"parent", "parenttype", "parentfield", "idx", "docstatus",
+)
+
+# Set on every row by each save; not a change in themselves
+_AUDIT_COLUMNS = ("owner", "creation", "modified", "modified_by")
+
+
+def _batches(items, size=BATCH_SIZE):
+	for i in range(0, len(items), size):
+		yield items[i:i + size]
+
+
+def _numeric_defaults(doctype):
+	"""``{fieldname: default}`` of the numeric fields of *doctype*, as Document.insert would store them."""
+	defaults = {}
+	for df in frappe.get_meta(doctype).fields:
+		if df.fieldtype in numeric_fieldtypes:
+			cast = cint if df.fieldtype in ("Int", "Long Int", "Check") else flt
+			defaults[df.fieldname] = cast(df.default) if df.default else 0
+	return defaults
+
+
+def insert_child_rows(parent_doctype, parent, parentfield, child_doctype, rows, start_idx=1, docstatus=0):
+	"""
+	Insert *rows* (a list of dicts) as children of *parent* using multi-row INSERTs.
+
+	Rows without a ``name`` get a random one. Numeric fields missing from a
+	row, or None, get their default (0 unless the doctype sets one), as they
+	would on a normal insert. Returns the inserted row names in order.
+	"""
+	if not rows:
+		return []
+
+	timestamp = now()
+	user = frappe.session.user
+	numeric = _numeric_defaults(child_doctype)
+	data_fields = sorted(
+		{key for row in rows for key in row if key not in _STANDARD_CHILD_COLUMNS} | set(numeric)
+	)
+	columns = list(_STANDARD_CHILD_COLUMNS) + data_fields
+
+	names = []
+	values = []
+	for idx, row in enumerate(rows, start=start_idx):
+		name = row.get("name") or frappe.generate_hash(length=10)
+		names.append(name)
+		values.append(
+			[name, user, timestamp, timestamp, user, parent, parent_doctype, parentfield, idx, docstatus]
+			+ [
+				numeric[field] if field in numeric and row.get(field) is None else row.get(field)
+				for field in data_fields
+			]
+		)
+
+	frappe.db.bulk_insert(child_doctype, columns, values, chunk_size=BATCH_SIZE)
+	return names
+
+
+def replace_child_rows(parent_doctype, parent, parentfield, child_doctype, rows, docstatus=0):
+	"""Delete every row of *parentfield* on *parent* and insert *rows* in their place."""
+	frappe.db.delete(child_doctype, {
+		"parent": parent,
+		"parenttype": parent_doctype,
+		"parentfield": parentfield,
+	})
+	return insert_child_rows(parent_doctype, parent, parentfield, child_doctype, rows, docstatus=docstatus)
+
+
+def update_rows(doctype, updates, update_modified=True):
+	"""
+	Apply ``{row name: {field: value}}`` with one UPDATE per batch of rows.
+
+	Each field is set through a ``CASE name WHEN ... END`` expression, so rows
+	in the same batch may change different fields.
+	"""
+	if not updates:
+		return
+
+	timestamp = now()
+	user = frappe.session.user
+
+	for batch in _batches(list(updates)):
+		fields = sorted({field for name in batch for field in updates[name]})
+		assignments = []
+		values = []
+		for field in fields:
+			cases = []
+			for name in batch:
+				if field in updates[name]:
+					cases.append("WHEN %s THEN %s")
+					values.extend([name, updates[name][field]])
+			assignments.append(f"`{field}` = CASE `name` {' '.join(cases)} ELSE `{field}` END")
+
+		if update_modified:
+			assignments.append("`modified` = %s")
+			assignments.append("`modified_by` = %s")
+			values.extend([timestamp, user])
+
+		placeholders = ", ".join(["%s"] * len(batch))
+		frappe.db.sql(
+			f"UPDATE `tab{doctype}` SET {', '.join(assignments)} WHERE `name` IN ({placeholders})",
+			values + list(batch),
+		)
+
+
+def delete_rows(doctype, names):
+	"""Delete rows of *doctype* by name, a batch per statement."""
+	for batch in _batches(list(names)):
+		frappe.db.delete(doctype, {"name": ["in", batch]})
+
+
+def _normalizer(meta, column):
+	"""Return a function that maps stored and in-memory values of *column* to one form."""
+	if column in ("idx", "docstatus"):
+		return lambda value: int(value or 0)
+	df = meta.get_field(column)
+	fieldtype = df.fieldtype if df else None
+	if fieldtype in numeric_fieldtypes:
+		return flt
+	if fieldtype == "Date":
+		return lambda value: str(getdate(value)) if value else ""
+	if fieldtype == "Datetime":
+		return lambda value: str(get_datetime(value)) if value else ""
+	return lambda value: cstr(value)
+
+
+def save_child_table(doc, fieldname):
+	"""
+	Persist child table *fieldname* of a saved *doc* by diffing it against
+	the stored rows, in place of Document.update_child_table.
+
+	New and changed rows are written with multi-row
+	``INSERT ... ON DUPLICATE KEY UPDATE`` statements and removed rows with
+	batched DELETEs; unchanged rows are not touched. Returns the names of
+	the ``(written, deleted)`` rows.
+	"""
+	df = doc.meta.get_field(fieldname)
+	child_doctype = df.options
+	rows = doc.get(fieldname)
+
+	stored = {
+		row.name: row
+		for row in frappe.db.sql(f"""
+			SELECT * FROM `tab{child_doctype}`
+			WHERE parent = %s AND parenttype = %s AND parentfield = %s
+		""", (doc.name, doc.doctype, fieldname), as_dict=True)
+	}
+
+	for row in rows:
+		if not row.name:
+			row.name = frappe.generate_hash(length=10)
+
+	deleted = []
+	if child_doctype not in (doc.flags.ignore_children_type or ()):
+		keep = {row.name for row in rows}
+		deleted = [name for name in stored if name not in keep]
+		delete_rows(child_doctype, deleted)
+
+	meta = frappe.get_meta(child_doctype)
+	normalizers = {}
+	changed = []
+	for row in rows:
+		values = row.get_valid_dict(convert_dates_to_str=True, ignore_nulls=False)
+		before = stored.get(row.name)
+		if before is not None and not row.is_new():
+			for column, value in values.items():
+				if column in _AUDIT_COLUMNS or column not in before:
+					continue
+				normalize = normalizers.get(column) or normalizers.setdefault(column, _normalizer(meta, column))
+				if normalize(value) != normalize(before[column]):
+					break
+			else:
+				continue
+		changed.append(values)
+
+	for batch in _batches(changed):
+		columns = sorted({column for values in batch for column in values})
+		updates = ", ".join(
+			f"`{column}` = VALUES(`{column}`)"
+			for column in columns
+			if column not in ("name", "owner", "creation")
+		)
+		placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+		frappe.db.sql(
+			f"""INSERT INTO `tab{child_doctype}` ({", ".join(f"`{c}`" for c in columns)})
+			VALUES {", ".join([placeholders] * len(batch))}
+			ON DUPLICATE KEY UPDATE {updates}""",
+			[values.get(column) for values in batch for column in columns],
+		)
+
+	for row in rows:
+		row.set("__islocal", False)
+	return [values["name"] for values in changed], deleted
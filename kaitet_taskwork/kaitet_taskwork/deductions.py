@@ -0,0 +1,156 @@
+# Copyright (c) 2025, Upande and contributors
+# For license information, please see license.txt
+
+"""
+Deduction rules engine for TW Weekly Disbursement entries.
+
+Enabled TW Deduction Rules for a company and year are compiled once into
+plain lists (band edges, rates and cumulative band totals) and cached.
+Each rule is then evaluated over a whole column of gross amounts at a time,
+using bisect to find an entry's band, so thousands of entries cost one pass
+per rule instead of a document load per entry.
+"""
+
+from bisect import bisect_right
+
+import frappe
+from frappe.utils import flt
+
+CACHE_KEY = "tw_deduction_rules"
+
+
+def clear_deduction_rules_cache():
+	frappe.cache().delete_keys(CACHE_KEY)
+
+
+def _compile_rule(rule, bands):
+	bands = sorted(bands, key=lambda b: flt(b.from_amount))
+	lowers = [flt(b.from_amount) for b in bands]
+	uppers = [flt(b.to_amount) or None for b in bands]
+	rates = [flt(b.rate) / 100 for b in bands]
+
+	# Banded total owed on everything below each band's lower edge
+	cumulative = []
+	total = 0.0
+	for i, lower in enumerate(lowers):
+		cumulative.append(total)
+		if uppers[i] is not None:
+			total += (uppers[i] - lower) * rates[i]
+
+	return {
+		"name":              rule.name,
+		"type":              rule.deduction_type,
+		"payment_method":    (rule.payment_method or "").strip().lower(),
+		"amount":            flt(rule.amount),
+		"rate":              flt(rule.percentage) / 100,
+		"minimum_gross":     flt(rule.minimum_gross),
+		"maximum_deduction": flt(rule.maximum_deduction),
+		"lowers":            lowers,
+		"uppers":            uppers,
+		"rates":             rates,
+		"fixed":             [flt(b.fixed_amount) for b in bands],
+		"cumulative":        cumulative,
+	}
+
+
+def get_deduction_rules(company, year):
+	"""Return the compiled enabled rules for *company* and *year*, cached until a rule changes."""
+	key = f"{CACHE_KEY}:{company or ''}:{year or 0}"
+	rules = frappe.cache().get_value(key)
+	if rules is not None:
+		return rules
+
+	rule_rows = frappe.get_all(
+		"TW Deduction Rule",
+		filters={"enabled": 1},
+		fields=["name", "deduction_type", "company", "year", "payment_method",
+		        "amount", "percentage", "minimum_gross", "maximum_deduction"],
+		order_by="name asc",
+	)
+	rule_rows = [
+		r for r in rule_rows
+		if (not r.company or r.company == company) and (not r.year or r.year == int(year or 0))
+	]
+
+	bands_by_rule = {}
+	if rule_rows:
+		for band in frappe.get_all(
+			"TW Deduction Band",
+			filters={"parenttype": "TW Deduction Rule", "parent": ["in", [r.name for r in rule_rows]]},
+			fields=["parent", "from_amount", "to_amount", "rate", "fixed_amount"],
+		):
+			bands_by_rule.setdefault(band.parent, []).append(band)
+
+	rules = [_compile_rule(r, bands_by_rule.get(r.name, [])) for r in rule_rows]
+	frappe.cache().set_value(key, rules)
+	return rules
+
+
+def _rule_column(rule, gross, methods):
+	"""Evaluate one compiled rule over every entry; returns a list of deductions."""
+	kind = rule["type"]
+	lowers, uppers, rates = rule["lowers"], rule["uppers"], rule["rates"]
+	out = [0.0] * len(gross)
+
+	for i, g in enumerate(gross):
+		if g <= 0 or g < rule["minimum_gross"]:
+			continue
+		if rule["payment_method"] and rule["payment_method"] != methods[i]:
+			continue
+
+		if kind == "Fixed":
+			value = rule["amount"]
+		elif kind == "Percentage":
+			value = g * rule["rate"]
+		else:
+			b = bisect_right(lowers, g) - 1
+			if kind == "Banded":
+				if b < 0:
+					continue
+				top = g if uppers[b] is None else min(g, uppers[b])
+				value = rule["cumulative"][b] + (top - lowers[b]) * rates[b]
+			else:
+				# Payment Method Fee: flat charge of the band the amount falls in
+				in_band = b >= 0 and (uppers[b] is None or g <= uppers[b])
+				value = rule["fixed"][b] + g * rates[b] if in_band else rule["amount"]
+
+		if rule["maximum_deduction"]:
+			value = min(value, rule["maximum_deduction"])
+		out[i] = value
+
+	return out
+
+
+def compute_deductions(gross_amounts, payment_methods, rules):
+	"""
+	Return the total deduction for each entry. A deduction never exceeds the
+	entry's gross amount.
+	"""
+	gross = [flt(g) for g in gross_amounts]
+	methods = [(m or "").strip().lower() for m in payment_methods]
+	totals = [0.0] * len(gross)
+
+	for rule in rules:
+		for i, value in enumerate(_rule_column(rule, gross, methods)):
+			totals[i] += value
+
+	return [flt(min(t, g), 2) if g > 0 else 0.0 for t, g in zip(totals, gross)]
+
+
+def apply_deduction_rules(rows, company, year):
+	"""
+	Set ``deductions`` and ``net_amount`` on TW Disbursement Entry *rows*
+	(dicts with ``gross_amount`` and ``payment_method``) in place.
+	"""
+	if not rows:
+		return rows
+	rules = get_deduction_rules(company, year)
+	deductions = compute_deductions(
+		[row["gross_amount"] for row in rows],
+		[row.get("payment_method") for row in rows],
+		rules,
+	)
+	for row, deduction in zip(rows, deductions):
+		row["deductions"] = deduction
+		row["net_amount"] = flt(row["gross_amount"]) - deduction
+	return rows
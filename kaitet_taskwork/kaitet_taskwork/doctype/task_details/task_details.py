@@ -1,5 +1,123 @@
 import frappe
 from frappe.model.document import Document
+from frappe.utils import ceil, flt, getdate, today
+
+from kaitet_taskwork.kaitet_taskwork.bulk import update_rows
+
+# Task Details rollup -> the Worker Assignments field it sums, stored on
+# every Task Details row of the task
+ROW_SUMS = {
+	"completed_work": "actual_quantity",
+	"total_assigned": "quantity_assigned",
+	"assigned_cost":  "total_assigned_cost",
+	"actual_cost":    "actual_cost",
+}
+DERIVED_FIELDS = ("progress", "remaining_work", "remaining_days", "status")
 
 class TaskDetails(Document):
 	pass
+
+
+def set_progress(detail):
+	"""Derive progress, remaining work and days, and status from the stored sums."""
+	total, done, target = flt(detail.total_work), flt(detail.completed_work), flt(detail.daily_target)
+	detail.progress = done / total * 100 if total else 0
+	detail.remaining_work = total - done
+	detail.remaining_days = ceil(detail.remaining_work / target) if target else 0
+	if detail.progress >= 100:
+		detail.status = "Completed"
+	elif detail.progress > 0:
+		detail.status = "In Progress"
+	else:
+		detail.status = "Pending"
+
+
+def assignment_totals(details):
+	"""Assignment-level totals from its Task Details rollups."""
+	total_work = sum(flt(d.total_work) for d in details)
+	# Repeated tasks carry the same sums; count each task once
+	per_task = {d.task: d for d in details}.values()
+	completed = sum(flt(d.completed_work) for d in per_task)
+	return {
+		"total_completed_work": completed,
+		"total_actual_cost":    sum(flt(d.actual_cost) for d in per_task),
+		"overall_progress":     completed / total_work * 100 if total_work else 0,
+	}
+
+
+def get_stage(completion_date, start_date, statuses):
+	"""Assignment stage from its dates and the status of each task."""
+	if completion_date:
+		return "Completed"
+	if start_date and getdate(start_date) <= getdate(today()):
+		return "Completed" if all(status == "Completed" for status in statuses) else "In Progress"
+	return "Pending"
+
+
+def refresh_progress_rollups(assignments, tasks=None):
+	"""
+	Recompute the Task Details rollups of *assignments* (limited to *tasks*
+	when given) from their Worker Assignments with one grouped UPDATE, then
+	the assignment totals and stage.
+
+	For writes that bypass the document; saving the form maintains the
+	rollups incrementally in TaskWorkAssignment.validate.
+	"""
+	if isinstance(assignments, str):
+		assignments = [assignments]
+	if not assignments or (tasks is not None and not tasks):
+		return
+
+	values = {"parents": tuple(assignments), "tasks": tuple(tasks or ())}
+	row_condition = "AND task IN %(tasks)s" if tasks else ""
+	detail_condition = "AND td.task IN %(tasks)s" if tasks else ""
+	frappe.db.sql(f"""
+		UPDATE `tabTask Details` td
+		LEFT JOIN (
+			SELECT parent, task,
+			       SUM(actual_quantity) AS completed_work,
+			       SUM(quantity_assigned) AS total_assigned,
+			       SUM(total_assigned_cost) AS assigned_cost,
+			       SUM(actual_cost) AS actual_cost,
+			       COUNT(DISTINCT employee_name) AS workers_assigned
+			FROM `tabWorker Assignments`
+			WHERE parent IN %(parents)s AND parenttype = 'Task Work Assignment' {row_condition}
+			GROUP BY parent, task
+		) wa ON wa.parent = td.parent AND wa.task = td.task
+		SET td.completed_work = IFNULL(wa.completed_work, 0),
+		    td.total_assigned = IFNULL(wa.total_assigned, 0),
+		    td.assigned_cost = IFNULL(wa.assigned_cost, 0),
+		    td.actual_cost = IFNULL(wa.actual_cost, 0),
+		    td.workers_assigned = IFNULL(wa.workers_assigned, 0)
+		WHERE td.parent IN %(parents)s AND td.parenttype = 'Task Work Assignment' {detail_condition}
+	""", values)
+
+	details = frappe.db.sql(f"""
+		SELECT name, parent, task, total_work, daily_target, completed_work, actual_cost,
+		       {", ".join(DERIVED_FIELDS)}
+		FROM `tabTask Details`
+		WHERE parent IN %(parents)s AND parenttype = 'Task Work Assignment'
+	""", values, as_dict=True)
+
+	updates, by_assignment = {}, {}
+	for detail in details:
+		before = tuple(detail[f] for f in DERIVED_FIELDS)
+		set_progress(detail)
+		if tuple(detail[f] for f in DERIVED_FIELDS) != before:
+			updates[detail.name] = {f: detail[f] for f in DERIVED_FIELDS}
+		by_assignment.setdefault(detail.parent, []).append(detail)
+	update_rows("Task Details", updates, update_modified=False)
+
+	dates = frappe.get_all(
+		"Task Work Assignment",
+		filters={"name": ["in", list(assignments)]},
+		fields=["name", "docstatus", "completion_date", "start_date"],
+	)
+	for assignment in dates:
+		rows = by_assignment.get(assignment.name, [])
+		totals = assignment_totals(rows)
+		if assignment.docstatus < 2:
+			totals["stage"] = get_stage(
+				assignment.completion_date, assignment.start_date, [d.status for d in rows]
+			)
+		frappe.db.set_value("Task Work Assignment", assignment.name, totals, update_modified=False)
@@ -244,19 +244,18 @@ function set_child_queries(frm) {
     // Worker Assignments → employee_name
     // Only show workers from the plan that are not currently assigned elsewhere.
     // Workers whose current_assignment is this document are also included
-    // so existing rows remain valid while editing.
+    // so existing rows remain valid while editing. The server query pages
+    // and prefix-searches the plan's workers.
     frm.set_query('employee_name', 'worker_assignments', function() {
-        const worker_list = frm._worker_list || [];
-        if (!worker_list.length) {
+        if (!frm.doc.task_work_plan) {
             return { filters: [['Task Worker', 'name', '=', '']] };
         }
-        // free = no current_assignment, OR current_assignment is this document
-        const allowed_assignments = ['', frm.doc.name || ''];
         return {
-            filters: [
-                ['Task Worker', 'name', 'in', worker_list],
-                ['Task Worker', 'current_assignment', 'in', allowed_assignments]
-            ]
+            query: 'kaitet_taskwork.kaitet_taskwork.doctype.task_worker.task_worker.task_worker_query',
+            filters: {
+                plan: frm.doc.task_work_plan,
+                assignment: frm.doc.name || ''
+            }
         };
     });
 
@@ -342,7 +341,24 @@ function auto_assign_workers(frm) {
     frappe.confirm(
         __('Auto-assign {0} workers to tasks? This will clear all existing assignments.', [workers.length]),
         function() {
-            perform_auto_assignment(frm, workers);
+            if (frm.is_new() || frm.is_dirty()) {
+                perform_auto_assignment(frm, workers);
+                return;
+            }
+            // Saved draft: allocate on the server against other bookings and weekly offs
+            frappe.call({
+                method: 'kaitet_taskwork.kaitet_taskwork.doctype.task_work_assignment.task_work_assignment.auto_assign_workers',
+                args: { assignment_name: frm.doc.name },
+                freeze: true,
+                freeze_message: __('Allocating workers…'),
+                callback: function(r) {
+                    if (!r.message) return;
+                    frm.reload_doc().then(() => {
+                        show_assignment_summary(frm, r.message.plan);
+                        frappe.show_alert({ message: r.message.message, indicator: 'green' });
+                    });
+                }
+            });
         }
     );
 }
@@ -615,6 +631,25 @@ function validate_worker_schedule(frm, cdt, cdn) {
         
         return false;
     }
+
+    // Bookings on other submitted assignments (any farm)
+    frappe.call({
+        method: 'kaitet_taskwork.kaitet_taskwork.doctype.tw_worker_occupancy.tw_worker_occupancy.check_double_booking',
+        args: {
+            pairs: [[row.employee_name, row.assignment_date]],
+            exclude_assignment: frm.is_new() ? null : frm.doc.name
+        },
+        callback: function(r) {
+            if (!r.message || !r.message.has_conflict) return;
+            let c = r.message.conflicts[0];
+            frappe.msgprint({
+                title: __('⚠️ Scheduling Conflict'),
+                indicator: 'orange',
+                message: __('Worker {0} is already booked on {1} in {2} ({3})',
+                    [row.employee_name, row.assignment_date, c.assignment, c.unit || c.tasks || ''])
+            });
+        }
+    });
     return true;
 }
 
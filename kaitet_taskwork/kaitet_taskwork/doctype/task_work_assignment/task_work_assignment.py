@@ -4,11 +4,69 @@
 import frappe
 from frappe import _
 from frappe.model.document import Document
-from frappe.utils import flt, today, getdate, add_days, date_diff, now_datetime
+from frappe.utils import cint, flt, today, getdate, add_days, date_diff, now_datetime
 import json
 
+from kaitet_taskwork.kaitet_taskwork.allocation import (
+    allocate,
+    allocation_days,
+    build_capacity,
+    get_plan_task_starts,
+    get_plan_workers,
+)
+from kaitet_taskwork.kaitet_taskwork.bulk import replace_child_rows, save_child_table, update_rows
+from kaitet_taskwork.kaitet_taskwork.doctype.task_details.task_details import (
+    ROW_SUMS,
+    assignment_totals,
+    get_stage,
+    refresh_progress_rollups,
+    set_progress,
+)
+from kaitet_taskwork.kaitet_taskwork.doctype.task_worker.task_worker import refresh_busy_state
+from kaitet_taskwork.kaitet_taskwork.doctype.tw_earnings_ledger.tw_earnings_ledger import (
+    sync_assignment_earnings,
+    sync_row_earnings,
+)
+from kaitet_taskwork.kaitet_taskwork.doctype.tw_worker_occupancy.tw_worker_occupancy import (
+    find_bookings,
+    sync_assignment_occupancy,
+)
+from kaitet_taskwork.kaitet_taskwork.utils import get_worker_unit_field
+
+def _row_signature(row):
+    """
+    Normalised values of the worker row fields that feed achievements,
+    totals and date checks, for change detection.
+    """
+    return (
+        row.task or "",
+        row.employee_name or "",
+        str(getdate(row.assignment_date)) if row.assignment_date else "",
+        flt(row.quantity_assigned),
+        flt(row.actual_quantity),
+        flt(row.rate),
+        flt(row.total_assigned_cost),
+        flt(row.achievement),
+        flt(row.actual_cost),
+    )
+
+
 class TaskWorkAssignment(Document):
     def validate(self):
+        self.set_header_defaults()
+
+        # On large assignments only the rows edited since load are recomputed
+        changes = self.get_worker_row_changes()
+        self.calculate_worker_achievements(changes)
+        self.validate_achievement_totals(changes)
+        self.validate_dates(changes)
+        self.calculate_totals(changes)
+        self.update_progress_rollups(changes)
+
+        self.update_stage()
+
+    def set_header_defaults(self):
+        """Title from the request; business unit and cost centre from the plan if not set."""
         if self.task_work_request:
             self.title = self.task_work_request
 
@@ -24,11 +82,38 @@ class TaskWorkAssignment(Document):
                 if not self.cost_centre and plan.cost_centre:
                     self.cost_centre = plan.cost_centre
 
-        self.update_stage()
-        self.calculate_worker_achievements()
-        self.validate_achievement_totals()
-        self.validate_dates()
-        self.calculate_totals()
+    def update_child_table(self, fieldname, df=None):
+        # Harvest assignments carry tens of thousands of worker rows; write only
+        # the rows that changed, in batches, instead of one UPDATE per row.
+        if fieldname == "worker_assignments":
+            self.flags.saved_worker_rows = save_child_table(self, fieldname)
+            return
+        super().update_child_table(fieldname, df)
+
+    def on_update(self):
+        # Also runs on submit, before on_submit
+        self.sync_earnings()
+        if self.docstatus == 1:
+            sync_assignment_occupancy(self.name)
+
+    def sync_earnings(self):
+        """
+        Bring the earnings ledger up to date after a save. Submission, and
+        changes to the header fields the ledger copies, rewrite the whole
+        assignment; other saves only the worker rows written or deleted.
+        """
+        before = self.get_doc_before_save()
+        saved = self.flags.pop("saved_worker_rows", None)
+        if self._action == "submit" or (before and any(
+            self.get(f) != before.get(f) for f in ("company", "unitdivision", "cost_centre")
+        )):
+            sync_assignment_earnings(self.name)
+        elif saved is not None:
+            written, deleted = saved
+            sync_row_earnings(written + deleted)
+        else:
+            # Inserted: every row is new
+            sync_row_earnings([row.name for row in self.get("worker_assignments", [])])
 
     def on_submit(self):
         if self.task_work_request:
@@ -44,49 +129,82 @@ class TaskWorkAssignment(Document):
 
     def on_cancel(self):
         self.db_set("stage", "Cancelled")
+        sync_assignment_earnings(self.name)
+        sync_assignment_occupancy(self.name)
         self._free_workers()
 
+    def on_trash(self):
+        frappe.db.delete("TW Earnings Ledger", {"task_work_assignment": self.name})
+        frappe.db.delete("TW Worker Occupancy", {"task_work_assignment": self.name})
+
+    def _worker_names(self):
+        return {row.employee_name for row in self.get("worker_assignments", []) if row.employee_name}
+
     def _mark_workers_busy(self):
-        """Set current_assignment on every Task Worker in this assignment."""
-        workers = list({row.employee_name for row in self.worker_assignments if row.employee_name})
-        for worker in workers:
-            frappe.db.set_value("Task Worker", worker, "current_assignment", self.name)
+        """
+        Count this assignment against every Task Worker in it, from the
+        occupancy rows written in on_update. Returns the workers that became
+        busy or free.
+        """
+        return refresh_busy_state(self._worker_names(), prefer=self.name)
 
     def _free_workers(self):
-        """Clear current_assignment for all Task Workers linked to this assignment."""
-        busy = frappe.get_all(
+        """Release the Task Workers of this assignment once its occupancy is removed."""
+        workers = self._worker_names()
+        workers.update(frappe.get_all(
             "Task Worker",
             filters={"current_assignment": self.name},
             pluck="name",
-        )
-        for worker in busy:
-            frappe.db.set_value("Task Worker", worker, "current_assignment", None)
+        ))
+        return refresh_busy_state(workers)
         
     def on_update_after_submit(self):
         self.update_stage()
+        self.sync_earnings()
+        sync_assignment_occupancy(self.name)
+        # Workers added to or removed from the rows since submit
+        before = self.get_doc_before_save()
+        moved = self._worker_names() ^ (before._worker_names() if before else set())
+        if moved:
+            refresh_busy_state(moved, prefer=self.name)
         
     def update_stage(self):
-        """Update stage based on dates and progress"""
-        if self.completion_date:
-            self.stage = "Completed"
-        elif self.start_date and getdate(self.start_date) <= getdate(today()):
-            # Check if all tasks are completed
-            all_completed = True
-            for task in self.get("task_details", []):
-                if task.status != "Completed":
-                    all_completed = False
-                    break
-            
-            if all_completed:
-                self.stage = "Completed"
-            else:
-                self.stage = "In Progress"
-        else:
-            self.stage = "Pending"
+        """Update stage based on dates and the task statuses kept by the rollups"""
+        self.stage = get_stage(
+            self.completion_date,
+            self.start_date,
+            [task.status for task in self.get("task_details", [])],
+        )
+
+    def get_worker_row_changes(self):
+        """
+        Compare worker rows with the stored document. Returns a dict with
+        ``changed`` (new or edited rows, paired with their stored version or
+        None) and ``removed`` (stored rows no longer present), or None when
+        everything has to be recomputed (new document, or forced with
+        ``flags.full_recalculation``).
+        """
+        before = self.get_doc_before_save()
+        if not before or self.is_new() or self.flags.full_recalculation:
+            return None
 
-    def calculate_worker_achievements(self):
-        """Auto-calculate achievement % and actual_cost for each worker row."""
+        before_rows = {row.name: row for row in before.get("worker_assignments", [])}
+        changed = []
         for row in self.get("worker_assignments", []):
+            old = before_rows.pop(row.name, None) if row.name else None
+            if old is None or _row_signature(row) != _row_signature(old):
+                changed.append((row, old))
+
+        return {
+            "before": before,
+            "changed": changed,
+            "removed": list(before_rows.values()),
+        }
+
+    def calculate_worker_achievements(self, changes=None):
+        """Auto-calculate achievement % and actual_cost for each (changed) worker row."""
+        rows = self.get("worker_assignments", []) if changes is None else [row for row, _ in changes["changed"]]
+        for row in rows:
             qty_assigned = flt(row.quantity_assigned)
             actual_qty = flt(row.actual_quantity)
             rate = flt(row.rate)
@@ -99,11 +217,14 @@ class TaskWorkAssignment(Document):
             if not row.total_assigned_cost and qty_assigned and rate:
                 row.total_assigned_cost = round(qty_assigned * rate, 2)
 
-    def validate_achievement_totals(self):
+    def validate_achievement_totals(self, changes=None):
         """
         Individual workers may exceed their own allocation (>100% achievement is fine).
         However, the SUM of actual_quantity across all workers for a task must not
         exceed that task's total_work — if someone did extra, others must have done less.
+
+        With *changes*, the stored per-task sums are adjusted by the edited rows
+        and only tasks whose sum or total work moved are checked.
         """
         if not self.worker_assignments or not self.task_details:
             return
@@ -111,47 +232,148 @@ class TaskWorkAssignment(Document):
         total_work_map = {row.task: flt(row.total_work) for row in self.task_details}
 
         actual_by_task = {}
-        for row in self.worker_assignments:
+        if changes is None:
+            rows = self.worker_assignments
+            touched = None
+        else:
+            rows = changes["before"].get("worker_assignments", [])
+            touched = set()
+        for row in rows:
             if row.task and row.actual_quantity:
                 actual_by_task[row.task] = (
                     actual_by_task.get(row.task, 0) + flt(row.actual_quantity)
                 )
 
-        errors = []
+        if changes is not None:
+            for new, old in changes["changed"]:
+                for row, sign in ((old, -1), (new, 1)):
+                    if row is not None and row.task:
+                        actual_by_task[row.task] = actual_by_task.get(row.task, 0) + sign * flt(row.actual_quantity)
+                        touched.add(row.task)
+            for old in changes["removed"]:
+                if old.task:
+                    actual_by_task[old.task] = actual_by_task.get(old.task, 0) - flt(old.actual_quantity)
+            before_totals = {row.task: flt(row.total_work) for row in changes["before"].get("task_details", [])}
+            touched.update(task for task, total in total_work_map.items() if before_totals.get(task) != total)
+
+        over = []
         for task_id, actual in actual_by_task.items():
+            if touched is not None and task_id not in touched:
+                continue
             total = total_work_map.get(task_id, 0)
-            if total > 0 and actual > total:
-                task_name = frappe.db.get_value("Task", task_id, "subject") or task_id
-                errors.append(
-                    f"Task <b>{task_name}</b>: total actual quantity "
-                    f"({actual:.2f}) exceeds total work ({total:.2f}). "
-                    f"Reduce work from over-performing workers so the sum stays within the allocation."
-                )
+            if total > 0 and actual > total + 1e-9:
+                over.append((task_id, actual, total))
+
+        if not over:
+            return
+
+        subjects = dict(frappe.get_all(
+            "Task",
+            filters={"name": ["in", [task_id for task_id, _, _ in over]]},
+            fields=["name", "subject"],
+            as_list=True,
+        ))
+        errors = []
+        for task_id, actual, total in over:
+            task_name = subjects.get(task_id) or task_id
+            errors.append(
+                f"Task <b>{task_name}</b>: total actual quantity "
+                f"({actual:.2f}) exceeds total work ({total:.2f}). "
+                f"Reduce work from over-performing workers so the sum stays within the allocation."
+            )
 
-        if errors:
-            frappe.throw("<br><br>".join(errors), title="Total Work Exceeded")
+        frappe.throw("<br><br>".join(errors), title="Total Work Exceeded")
     
-    def validate_dates(self):
+    def validate_dates(self, changes=None):
         """Validate assignment dates"""
         if self.start_date and self.expected_end_date:
             if getdate(self.expected_end_date) < getdate(self.start_date):
                 frappe.throw(_("Expected end date cannot be before start date"))
+
+        rows = self.get("worker_assignments", [])
+        if changes is not None:
+            before = changes["before"]
+            if (str(before.start_date or "") == str(self.start_date or "")
+                    and str(before.expected_end_date or "") == str(self.expected_end_date or "")):
+                rows = [row for row, _ in changes["changed"]]
         
         # Validate worker assignment dates
-        for row in self.get("worker_assignments", []):
+        for row in rows:
             if row.assignment_date:
                 if self.start_date and getdate(row.assignment_date) < getdate(self.start_date):
                     frappe.throw(_("Row #{0}: Assignment date cannot be before start date").format(row.idx))
                 if self.expected_end_date and getdate(row.assignment_date) > getdate(self.expected_end_date):
                     frappe.msgprint(_("Row #{0}: Assignment date is after expected end date").format(row.idx))
     
-    def calculate_totals(self):
+    def calculate_totals(self, changes=None):
         """Calculate total estimated cost"""
-        total = 0
-        for row in self.get("worker_assignments", []):
-            total += flt(row.total_assigned_cost) or 0
+        if changes is None:
+            total = 0
+            for row in self.get("worker_assignments", []):
+                total += flt(row.total_assigned_cost) or 0
+        else:
+            # Stored total adjusted by the edited and removed rows
+            total = flt(changes["before"].total_estimated_cost)
+            for new, old in changes["changed"]:
+                total += flt(new.total_assigned_cost) - (flt(old.total_assigned_cost) if old else 0)
+            for old in changes["removed"]:
+                total -= flt(old.total_assigned_cost)
         self.total_estimated_cost = total
     
+    def update_progress_rollups(self, changes=None):
+        """
+        Maintain the progress rollups on Task Details and the assignment
+        totals. With *changes*, the stored per-task sums are adjusted by the
+        edited and removed rows, and distinct workers are recounted only for
+        the tasks those rows touch.
+        """
+        details = self.get("task_details", [])
+
+        sums = {}
+
+        def add(row, sign):
+            task_sums = sums.setdefault(row.task, dict.fromkeys(ROW_SUMS, 0))
+            for rollup, field in ROW_SUMS.items():
+                task_sums[rollup] += sign * flt(row.get(field))
+
+        if changes is None:
+            touched = None
+            for row in self.get("worker_assignments", []):
+                if row.task:
+                    add(row, 1)
+        else:
+            before_details = changes["before"].get("task_details", [])
+            for task in before_details:
+                sums.setdefault(task.task, {rollup: flt(task.get(rollup)) for rollup in ROW_SUMS})
+            touched = set()
+            for new, old in changes["changed"]:
+                for row, sign in ((old, -1), (new, 1)):
+                    if row is not None and row.task:
+                        add(row, sign)
+                        touched.add(row.task)
+            for old in changes["removed"]:
+                if old.task:
+                    add(old, -1)
+                    touched.add(old.task)
+            # Tasks added to the table since load have no stored worker count
+            stored = {task.task for task in before_details}
+            touched.update(task.task for task in details if task.task not in stored)
+
+        workers = {}
+        for row in self.get("worker_assignments", []):
+            if row.task and row.employee_name and (touched is None or row.task in touched):
+                workers.setdefault(row.task, set()).add(row.employee_name)
+
+        for task in details:
+            task_sums = sums.get(task.task) or dict.fromkeys(ROW_SUMS, 0)
+            for rollup, value in task_sums.items():
+                task.set(rollup, flt(value, 6))
+            if touched is None or task.task in touched:
+                task.workers_assigned = len(workers.get(task.task, ()))
+            set_progress(task)
+
+        self.update(assignment_totals(details))
+
     def create_notification(self, action):
         """Create notification for assignment action"""
         subject = f"Task Work Assignment {self.name} {action}"
@@ -176,71 +398,97 @@ class TaskWorkAssignment(Document):
 
 
 @frappe.whitelist()
-def get_workers_for_task(task_name, start_date, end_date, unit=None):
-    """Get available workers for a specific task"""
-    
-    filters = {"status": "Active"}
-    if unit:
-        filters["custom_unit"] = unit
-    
-    # Get all active workers
-    workers = frappe.get_all("Task Worker", 
-        filters=filters,
-        fields=["name", "employee_name", "custom_daily_rate as daily_rate", "custom_skill_level as skill_level"]
-    )
-    
-    # Check existing assignments during this period
-    for worker in workers:
-        assignments = frappe.db.sql("""
-            SELECT COUNT(*) as count,
-                   SUM(quantity_assigned) as total_quantity
+def get_workers_for_task(task_name, start_date, end_date, unit=None, search=None,
+                         start=0, page_length=50, only_available=0):
+    """
+    Get active workers for a task with their bookings in the period, in one
+    grouped query. Available workers come first, then by skill level.
+    Supports search on ID, name and payroll number, and paging. Workers are
+    only limited to *unit* when Task Worker has a unit field; the user is
+    told when it has none.
+    """
+    meta = frappe.get_meta("Task Worker")
+    skill = "IFNULL(tw.custom_skill_level, 0)" if meta.has_field("custom_skill_level") else "0"
+    daily_rate = "tw.custom_daily_rate" if meta.has_field("custom_daily_rate") else "NULL"
+    # Same employee_name as before when the site has the field
+    employee_name = "tw.employee_name" if meta.has_field("employee_name") else "tw.full_name"
+
+    conditions = ["tw.status = 'Active'"]
+    values = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "start": cint(start),
+        "page_length": min(cint(page_length) or 50, 500),
+    }
+    unit_field = get_worker_unit_field(unit)
+    if unit_field:
+        conditions.append(f"tw.`{unit_field}` = %(unit)s")
+        values["unit"] = unit
+    if search:
+        conditions.append(
+            "(tw.name LIKE %(search)s OR tw.full_name LIKE %(search)s OR tw.payroll_number LIKE %(search)s)"
+        )
+        values["search"] = f"%{search}%"
+    if cint(only_available):
+        conditions.append("booked.worker IS NULL")
+
+    workers = frappe.db.sql(f"""
+        SELECT tw.name,
+               {employee_name} AS employee_name,
+               tw.full_name,
+               {daily_rate} AS daily_rate,
+               {skill} AS skill_level,
+               IFNULL(booked.assignment_count, 0) AS current_assignments,
+               IFNULL(booked.total_quantity, 0) AS total_quantity,
+               booked.worker IS NULL AS available
+        FROM `tabTask Worker` tw
+        LEFT JOIN (
+            SELECT employee_name AS worker,
+                   COUNT(*) AS assignment_count,
+                   SUM(quantity_assigned) AS total_quantity
             FROM `tabWorker Assignments`
-            WHERE employee_name = %s
-                AND assignment_date BETWEEN %s AND %s
+            WHERE assignment_date BETWEEN %(start_date)s AND %(end_date)s
                 AND docstatus = 1
-        """, (worker.name, start_date, end_date), as_dict=True)
-        
-        worker['current_assignments'] = assignments[0].count if assignments else 0
-        worker['total_quantity'] = assignments[0].total_quantity if assignments else 0
-        worker['available'] = assignments[0].count == 0 if assignments else True
-    
-    # Sort by availability and skill
-    workers.sort(key=lambda x: (not x['available'], -x.get('skill_level', 0)))
-    
+            GROUP BY employee_name
+        ) booked ON booked.worker = tw.name
+        WHERE {" AND ".join(conditions)}
+        ORDER BY available DESC, skill_level DESC, tw.name
+        LIMIT %(start)s, %(page_length)s
+    """, values, as_dict=True)
+
+    for worker in workers:
+        worker.available = bool(worker.available)
+
     return workers
 
 
 @frappe.whitelist()
 def get_worker_availability(worker_name, start_date, end_date):
-    """Check if a worker is available during a period"""
+    """Check if a worker is available during a period, from the occupancy index"""
     
-    assignments = frappe.db.sql("""
-        SELECT assignment_date, quantity_assigned, task
-        FROM `tabWorker Assignments`
-        WHERE employee_name = %s
-            AND assignment_date BETWEEN %s AND %s
-            AND docstatus = 1
-        ORDER BY assignment_date
-    """, (worker_name, start_date, end_date), as_dict=True)
+    bookings = frappe.get_all(
+        "TW Worker Occupancy",
+        filters={"worker": worker_name, "work_date": ["between", [start_date, end_date]]},
+        fields=["work_date", "task_work_assignment", "tasks", "quantity"],
+        order_by="work_date asc",
+    )
     
     # Group by date
     schedule = {}
     total_quantity = 0
-    for a in assignments:
-        date_str = str(a.assignment_date)
-        if date_str not in schedule:
-            schedule[date_str] = []
-        schedule[date_str].append({
-            'task': a.task,
-            'quantity': a.quantity_assigned
+    for b in bookings:
+        schedule.setdefault(str(b.work_date), []).append({
+            'task': b.tasks,
+            'assignment': b.task_work_assignment,
+            'quantity': b.quantity
         })
-        total_quantity += a.quantity_assigned
+        total_quantity += flt(b.quantity)
     
     total_days = date_diff(end_date, start_date) + 1
     
     return {
         'worker': worker_name,
-        'assignments': len(assignments),
+        'assignments': len(bookings),
         'schedule': schedule,
         'total_quantity': total_quantity,
         'assigned_days': len(schedule),
@@ -322,7 +570,10 @@ def calculate_worker_payment(assignment_name):
 
 @frappe.whitelist()
 def validate_worker_schedule(assignment_name):
-    """Validate that no worker is double-booked"""
+    """
+    Validate that no worker is double-booked, within this assignment or
+    against any other submitted assignment.
+    """
     
     assignments = frappe.db.sql("""
         SELECT 
@@ -336,16 +587,32 @@ def validate_worker_schedule(assignment_name):
         HAVING COUNT(*) > 1
     """, assignment_name, as_dict=True)
     
-    if assignments:
-        conflicts = []
-        for a in assignments:
-            conflicts.append({
-                'worker': a.employee_name,
-                'date': a.assignment_date,
-                'count': a.assignment_count,
-                'tasks': a.tasks
-            })
-        
+    conflicts = []
+    for a in assignments:
+        conflicts.append({
+            'worker': a.employee_name,
+            'date': a.assignment_date,
+            'count': a.assignment_count,
+            'tasks': a.tasks
+        })
+
+    # Bookings of the same worker-days on other assignments
+    pairs = frappe.db.sql("""
+        SELECT DISTINCT employee_name, assignment_date
+        FROM `tabWorker Assignments`
+        WHERE parent = %s AND parenttype = 'Task Work Assignment'
+    """, assignment_name)
+    for b in find_bookings(pairs, exclude_assignment=assignment_name):
+        conflicts.append({
+            'worker': b.worker,
+            'date': b.work_date,
+            'count': 1,
+            'tasks': b.tasks,
+            'assignment': b.task_work_assignment,
+            'unit': b.unitdivision
+        })
+    
+    if conflicts:
         return {
             'has_conflict': True,
             'conflicts': conflicts
@@ -357,13 +624,73 @@ def validate_worker_schedule(assignment_name):
     }
 
 
-@frappe.whitelist()
-def get_task_progress(assignment_name):
-    """Get progress for all tasks in an assignment"""
-    
-    # Get task totals
-    tasks = frappe.db.sql("""
-        SELECT 
+# Page sizes of the paginated dashboard endpoints
+DEFAULT_PAGE_LENGTH = 500
+MAX_PAGE_LENGTH = 5000
+
+
+def _page_length(page_length):
+    return min(cint(page_length) or DEFAULT_PAGE_LENGTH, MAX_PAGE_LENGTH)
+
+
+def _parse_cursor(cursor):
+    """Cursors are returned as lists and may come back as a JSON string."""
+    if isinstance(cursor, str):
+        cursor = frappe.parse_json(cursor)
+    return cursor or None
+
+
+def _date_window(field, from_date, to_date, values):
+    """SQL conditions restricting *field* to the window, filling *values*."""
+    conditions = ""
+    if from_date:
+        values["from_date"] = getdate(from_date)
+        conditions += f" AND {field} >= %(from_date)s"
+    if to_date:
+        values["to_date"] = getdate(to_date)
+        conditions += f" AND {field} <= %(to_date)s"
+    return conditions
+
+
+def _task_progress_rows(assignment_name, from_date=None, to_date=None, cursor=None, limit=None):
+    """
+    Task Details rows with their progress. Without a date window the stored
+    rollups are read; a window aggregates the worker rows in it per task in
+    one grouped pass.
+    """
+    values = {"parent": assignment_name}
+    window = _date_window("assignment_date", from_date, to_date, values)
+
+    # Rows without a task sort first and page like any other
+    conditions = ""
+    if cursor:
+        values["after_task"], values["after_name"] = cursor
+        conditions = """ AND (IFNULL(td.task, '') > %(after_task)s
+            OR (IFNULL(td.task, '') = %(after_task)s AND td.name > %(after_name)s))"""
+    if limit:
+        values["limit"] = limit + 1
+
+    join = ""
+    if window:
+        join = f"""LEFT JOIN (
+            SELECT
+                task,
+                SUM(actual_quantity) as completed_work,
+                SUM(quantity_assigned) as total_assigned,
+                COUNT(DISTINCT employee_name) as workers_assigned,
+                SUM(actual_cost) as actual_cost,
+                SUM(total_assigned_cost) as assigned_cost
+            FROM `tabWorker Assignments`
+            WHERE parent = %(parent)s AND parenttype = 'Task Work Assignment' {window}
+            GROUP BY task
+        ) wa ON wa.task = td.task"""
+
+    # Windowed sums come from the subquery, otherwise from the stored rollups
+    source = "wa" if window else "td"
+
+    tasks = frappe.db.sql(f"""
+        SELECT
+            td.name,
             td.task,
             td.task_name,
             td.total_work,
@@ -371,31 +698,47 @@ def get_task_progress(assignment_name):
             td.daily_target,
             td.rate,
             td.status,
-            SUM(wa.actual_quantity) as completed_work,
-            SUM(wa.quantity_assigned) as total_assigned,
-            COUNT(DISTINCT wa.employee_name) as workers_assigned,
-            SUM(wa.actual_cost) as actual_cost,
-            SUM(wa.total_assigned_cost) as assigned_cost
+            {source}.completed_work as completed_work,
+            {source}.total_assigned as total_assigned,
+            IFNULL({source}.workers_assigned, 0) as workers_assigned,
+            {source}.actual_cost as actual_cost,
+            {source}.assigned_cost as assigned_cost
         FROM `tabTask Details` td
-        LEFT JOIN `tabWorker Assignments` wa ON wa.task = td.task AND wa.parent = td.parent
-        WHERE td.parent = %s
-        GROUP BY td.task, td.task_name, td.total_work, td.uom, td.daily_target, td.rate, td.status
-    """, assignment_name, as_dict=True)
-    
+        {join}
+        WHERE td.parent = %(parent)s AND td.parenttype = 'Task Work Assignment' {conditions}
+        ORDER BY IFNULL(td.task, ''), td.name
+        {"LIMIT %(limit)s" if limit else ""}
+    """, values, as_dict=True)
+
+    next_cursor = None
+    if limit and len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = [tasks[-1].task or "", tasks[-1].name]
+
     for task in tasks:
-        task['progress'] = (flt(task.completed_work) / flt(task.total_work)) * 100 if task.total_work else 0
-        task['remaining'] = flt(task.total_work) - flt(task.completed_work)
-        task['remaining_days'] = frappe.utils.ceil(task['remaining'] / (task.daily_target or 1)) if task.daily_target else 0
-        
-        # Update status based on progress
-        if task['progress'] >= 100:
-            task['status'] = 'Completed'
-        elif task['progress'] > 0:
-            task['status'] = 'In Progress'
-        else:
-            task['status'] = 'Pending'
-    
-    return tasks
+        task.pop("name")
+        set_progress(task)
+        task['remaining'] = task.pop('remaining_work')
+
+    return tasks, next_cursor
+
+
+@frappe.whitelist()
+def get_task_progress(assignment_name, from_date=None, to_date=None):
+    """Get progress for all tasks in an assignment"""
+    return _task_progress_rows(assignment_name, from_date, to_date)[0]
+
+
+@frappe.whitelist()
+def get_task_progress_page(assignment_name, from_date=None, to_date=None, cursor=None, page_length=None):
+    """
+    One page of get_task_progress. Pass the returned ``next_cursor`` back
+    as *cursor* for the next page; it is None on the last page.
+    """
+    tasks, next_cursor = _task_progress_rows(
+        assignment_name, from_date, to_date, _parse_cursor(cursor), _page_length(page_length)
+    )
+    return {'tasks': tasks, 'next_cursor': next_cursor}
 
 
 @frappe.whitelist()
@@ -438,11 +781,17 @@ def create_payment_entry(assignment_name):
     return payment_entry.name
 
 
-@frappe.whitelist()
-def get_worker_performance(assignment_name):
-    """Get performance metrics for workers"""
-    
-    performance = frappe.db.sql("""
+def _worker_performance_rows(assignment_name, from_date=None, to_date=None, cursor=None, limit=None):
+    """Worker row totals per worker, optionally windowed and paged on worker."""
+    values = {"parent": assignment_name}
+    conditions = _date_window("wa.assignment_date", from_date, to_date, values)
+    if cursor:
+        values["after_worker"] = cursor[0]
+        conditions += " AND wa.employee_name > %(after_worker)s"
+    if limit:
+        values["limit"] = limit + 1
+
+    performance = frappe.db.sql(f"""
         SELECT 
             wa.employee_name,
             COUNT(DISTINCT wa.task) as tasks_completed,
@@ -452,51 +801,144 @@ def get_worker_performance(assignment_name):
             MIN(wa.assignment_date) as first_assignment,
             MAX(wa.assignment_date) as last_assignment
         FROM `tabWorker Assignments` wa
-        WHERE wa.parent = %s
+        WHERE wa.parent = %(parent)s AND wa.parenttype = 'Task Work Assignment' {conditions}
         GROUP BY wa.employee_name
-    """, assignment_name, as_dict=True)
-    
-    return performance
+        ORDER BY wa.employee_name
+        {"LIMIT %(limit)s" if limit else ""}
+    """, values, as_dict=True)
+
+    next_cursor = None
+    if limit and len(performance) > limit:
+        performance = performance[:limit]
+        next_cursor = [performance[-1].employee_name]
+    return performance, next_cursor
+
+
+@frappe.whitelist()
+def get_worker_performance(assignment_name, from_date=None, to_date=None):
+    """Get performance metrics for workers"""
+    return _worker_performance_rows(assignment_name, from_date, to_date)[0]
+
+
+@frappe.whitelist()
+def get_worker_performance_page(assignment_name, from_date=None, to_date=None, cursor=None, page_length=None):
+    """One page of get_worker_performance, ordered by worker; see get_task_progress_page."""
+    performance, next_cursor = _worker_performance_rows(
+        assignment_name, from_date, to_date, _parse_cursor(cursor), _page_length(page_length)
+    )
+    return {'workers': performance, 'next_cursor': next_cursor}
+
+
+def swap_worker_rows(assignment_name, row_names, old_worker, new_worker, reason=None):
+    """
+    Move Worker Assignments rows of a draft assignment from *old_worker* to
+    *new_worker* in place.
+
+    Worker rows cannot change after submit, so submitted assignments are
+    refused, as they are by Document.save. A swap that would book
+    *new_worker* twice on a day, in this assignment or a submitted one, is
+    refused too. One batched UPDATE keeps the row names, dates and
+    quantities and clears the actuals (the work is still to be done). Then
+    the ledger of just those rows and the rollups of their tasks are brought
+    up to date, and a comment records the change. The cost follows the
+    number of rows moved, not the size of the assignment. Returns the number
+    of rows moved.
+    """
+    docstatus = frappe.db.get_value("Task Work Assignment", assignment_name, "docstatus")
+    if docstatus is None:
+        frappe.throw(_("Task Work Assignment {0} not found").format(assignment_name))
+    if docstatus != 0:
+        frappe.throw(_("Workers can only be reassigned on a draft Task Work Assignment"))
+    if not frappe.db.exists("Task Worker", new_worker):
+        frappe.throw(_("Task Worker {0} not found").format(new_worker))
+
+    rows = frappe.db.sql("""
+        SELECT name, task, assignment_date
+        FROM `tabWorker Assignments`
+        WHERE name IN %(rows)s
+          AND parent = %(parent)s
+          AND parenttype = 'Task Work Assignment'
+          AND employee_name = %(old_worker)s
+    """, {
+        "rows": tuple(row_names) or ("",),
+        "parent": assignment_name,
+        "old_worker": old_worker,
+    }, as_dict=True)
+    if not rows:
+        return 0
+
+    # Days new_worker already works, on submitted assignments or this one
+    dates = {getdate(row.assignment_date) for row in rows if row.assignment_date}
+    conflicts = {
+        (str(b.work_date), b.task_work_assignment)
+        for b in find_bookings([(new_worker, day) for day in dates], exclude_assignment=assignment_name)
+    }
+    if dates:
+        conflicts.update((str(day), assignment_name) for day in frappe.get_all(
+            "Worker Assignments",
+            filters={
+                "parent": assignment_name,
+                "parenttype": "Task Work Assignment",
+                "employee_name": new_worker,
+                "assignment_date": ["in", list(dates)],
+            },
+            pluck="assignment_date",
+        ))
+    if conflicts:
+        frappe.throw(_("{0} is already booked on {1}").format(
+            new_worker, ", ".join(f"{day} ({name})" for day, name in sorted(conflicts))
+        ))
+
+    full_name = frappe.db.get_value("Task Worker", new_worker, "full_name")
+    update_rows("Worker Assignments", {
+        row.name: {
+            "employee_name":    new_worker,
+            "worker_full_name": full_name,
+            "actual_quantity":  0,
+            "actual_cost":      0,
+            "achievement":      0,
+        }
+        for row in rows
+    })
+    frappe.db.set_value("Task Work Assignment", assignment_name, "modified", now_datetime(), update_modified=False)
+
+    sync_row_earnings([row.name for row in rows])
+    refresh_progress_rollups(assignment_name, {row.task for row in rows if row.task})
+
+    message = _("Reassigned {0} worker row(s) from {1} to {2}").format(len(rows), old_worker, new_worker)
+    if reason:
+        message += f" ({reason})"
+    frappe.get_doc({
+        "doctype": "Comment",
+        "comment_type": "Info",
+        "reference_doctype": "Task Work Assignment",
+        "reference_name": assignment_name,
+        "content": message,
+    }).insert(ignore_permissions=True)
+
+    return len(rows)
 
 
 @frappe.whitelist()
 def reassign_worker(assignment_name, old_worker, new_worker, task=None):
     """Reassign work from one worker to another"""
-    
-    assignment = frappe.get_doc("Task Work Assignment", assignment_name)
-    
-    filters = {"employee_name": old_worker}
+    frappe.has_permission("Task Work Assignment", "write", assignment_name, throw=True)
+
+    filters = {
+        "parent": assignment_name,
+        "parenttype": "Task Work Assignment",
+        "employee_name": old_worker,
+    }
     if task:
         filters["task"] = task
     
     # Find assignments to reassign
-    to_reassign = [w for w in assignment.worker_assignments if 
-                   w.employee_name == old_worker and (not task or w.task == task)]
+    to_reassign = frappe.get_all("Worker Assignments", filters=filters, pluck="name")
     
     if not to_reassign:
         frappe.throw(_("No assignments found for worker {0}".format(old_worker)))
     
-    reassigned_count = 0
-    for old in to_reassign:
-        # Create new assignment
-        new_row = assignment.append("worker_assignments", {
-            "employee_name": new_worker,
-            "task": old.task,
-            "uom": old.uom,
-            "daily_target": old.daily_target,
-            "rate": old.rate,
-            "quantity_assigned": old.quantity_assigned,
-            "assignment_date": old.assignment_date,
-            "total_assigned_cost": old.total_assigned_cost
-        })
-        
-        # Remove old assignment
-        assignment.remove(old)
-        reassigned_count += 1
-    
-    assignment.save()
-    
-    frappe.db.commit()
+    reassigned_count = swap_worker_rows(assignment_name, to_reassign, old_worker, new_worker)
     
     return {
         'message': _("Successfully reassigned {0} tasks from {1} to {2}".format(
@@ -505,12 +947,21 @@ def reassign_worker(assignment_name, old_worker, new_worker, task=None):
     }
 
 
-@frappe.whitelist()
-def get_daily_schedule(assignment_name):
-    """Get daily schedule of assignments"""
-    
-    schedule = frappe.db.sql("""
+def _schedule_rows(assignment_name, from_date=None, to_date=None, cursor=None, limit=None):
+    """Worker rows grouped by date, keyset-paged on (date, worker, row name)."""
+    values = {"parent": assignment_name}
+    conditions = _date_window("wa.assignment_date", from_date, to_date, values)
+    if cursor:
+        values["after_date"], values["after_worker"], values["after_name"] = cursor
+        conditions += """ AND (wa.assignment_date > %(after_date)s
+            OR (wa.assignment_date = %(after_date)s AND (wa.employee_name > %(after_worker)s
+                OR (wa.employee_name = %(after_worker)s AND wa.name > %(after_name)s))))"""
+    if limit:
+        values["limit"] = limit + 1
+
+    schedule = frappe.db.sql(f"""
         SELECT 
+            wa.name,
             wa.assignment_date,
             wa.employee_name,
             wa.task,
@@ -518,10 +969,17 @@ def get_daily_schedule(assignment_name):
             wa.uom,
             wa.daily_target
         FROM `tabWorker Assignments` wa
-        WHERE wa.parent = %s
-        ORDER BY wa.assignment_date, wa.employee_name
-    """, assignment_name, as_dict=True)
-    
+        WHERE wa.parent = %(parent)s AND wa.parenttype = 'Task Work Assignment' {conditions}
+        ORDER BY wa.assignment_date, wa.employee_name, wa.name
+        {"LIMIT %(limit)s" if limit else ""}
+    """, values, as_dict=True)
+
+    next_cursor = None
+    if limit and len(schedule) > limit:
+        schedule = schedule[:limit]
+        last = schedule[-1]
+        next_cursor = [str(last.assignment_date), last.employee_name, last.name]
+
     # Group by date
     daily_schedule = {}
     for row in schedule:
@@ -537,121 +995,158 @@ def get_daily_schedule(assignment_name):
             'daily_target': row.daily_target
         })
     
-    return daily_schedule
+    return daily_schedule, next_cursor
 
 
 @frappe.whitelist()
-def get_completion_summary(assignment_name):
-    """Get completion summary for the assignment"""
-    
-    tasks = get_task_progress(assignment_name)
-    payments = calculate_worker_payment(assignment_name)
-    
-    completed_tasks = [t for t in tasks if t['progress'] >= 100]
-    in_progress_tasks = [t for t in tasks if 0 < t['progress'] < 100]
-    pending_tasks = [t for t in tasks if t['progress'] == 0]
+def get_daily_schedule(assignment_name, from_date=None, to_date=None):
+    """Get daily schedule of assignments"""
+    return _schedule_rows(assignment_name, from_date, to_date)[0]
+
+
+@frappe.whitelist()
+def get_daily_schedule_page(assignment_name, from_date=None, to_date=None, cursor=None, page_length=None):
+    """
+    One page of get_daily_schedule. A page holds *page_length* worker rows,
+    so a date may continue on the next page; see get_task_progress_page.
+    """
+    schedule, next_cursor = _schedule_rows(
+        assignment_name, from_date, to_date, _parse_cursor(cursor), _page_length(page_length)
+    )
+    return {'schedule': schedule, 'next_cursor': next_cursor}
+
+
+@frappe.whitelist()
+def get_completion_summary(assignment_name, from_date=None, to_date=None):
+    """
+    Get completion summary for the assignment from its worker rows (the
+    totals, and the actuals per task) and its Task Details. Rows without
+    a task are grouped together as one task.
+    """
+    values = {"parent": assignment_name}
+    window = _date_window("assignment_date", from_date, to_date, values)
+    rows_in_window = f"parent = %(parent)s AND parenttype = 'Task Work Assignment' {window}"
+
+    overall = frappe.db.sql(f"""
+        SELECT
+            SUM(actual_quantity) as total_actual,
+            SUM(quantity_assigned) as total_assigned,
+            SUM(IF(IFNULL(actual_cost, 0) != 0, actual_cost, IFNULL(total_assigned_cost, 0))) as total_payment,
+            COUNT(DISTINCT employee_name) as worker_count
+        FROM `tabWorker Assignments`
+        WHERE {rows_in_window}
+    """, values, as_dict=True)[0]
+
+    completed_work = dict(frappe.db.sql(f"""
+        SELECT IFNULL(task, ''), SUM(actual_quantity)
+        FROM `tabWorker Assignments`
+        WHERE {rows_in_window}
+        GROUP BY IFNULL(task, '')
+    """, values))
+
+    total_work = {}
+    for task, work in frappe.db.sql("""
+        SELECT IFNULL(task, ''), total_work FROM `tabTask Details`
+        WHERE parent = %s AND parenttype = 'Task Work Assignment'
+    """, assignment_name):
+        total_work[task] = total_work.get(task, 0) + flt(work)
+
+    progress = [
+        flt(completed_work.get(task)) / work * 100 if work else 0
+        for task, work in total_work.items()
+    ]
+    completed_tasks = len([p for p in progress if p >= 100])
     
     return {
-        'total_tasks': len(tasks),
-        'completed_tasks': len(completed_tasks),
-        'in_progress_tasks': len(in_progress_tasks),
-        'pending_tasks': len(pending_tasks),
-        'completion_percentage': (len(completed_tasks) / len(tasks)) * 100 if tasks else 0,
-        'total_payment': payments['total_payment'],
-        'total_workers': payments['worker_count'],
-        'total_work_assigned': payments['total_assigned'],
-        'total_work_completed': payments['total_actual']
+        'total_tasks': len(progress),
+        'completed_tasks': completed_tasks,
+        'in_progress_tasks': len([p for p in progress if 0 < p < 100]),
+        'pending_tasks': len([p for p in progress if p == 0]),
+        'completion_percentage': (completed_tasks / len(progress)) * 100 if progress else 0,
+        'total_payment': flt(overall.total_payment),
+        'total_workers': cint(overall.worker_count),
+        'total_work_assigned': flt(overall.total_assigned),
+        'total_work_completed': flt(overall.total_actual)
     }
 
 
 @frappe.whitelist()
 def auto_assign_workers(assignment_name):
-    """Auto-assign workers to tasks based on availability"""
-    
+    """
+    Allocate the plan's workers (every active worker when no plan is linked)
+    to the assignment's tasks with the capacity engine and write all rows in
+    bulk, replacing existing Worker Assignments. Workers already booked
+    elsewhere on a day, or off that day, are skipped; a task is not started
+    before its own start date.
+    """
     assignment = frappe.get_doc("Task Work Assignment", assignment_name)
-    
+    assignment.check_permission("write")
+
+    if assignment.docstatus != 0:
+        frappe.throw(_("Auto-assignment is only possible on a draft assignment"))
+
     if not assignment.task_details:
         frappe.throw(_("No tasks found in assignment"))
     
     if not assignment.start_date:
         frappe.throw(_("Start date is required for auto-assignment"))
-    
-    # Get available workers
-    unit = assignment.unitdivision
-    workers = frappe.get_all("Task Worker", 
-        filters={"status": "Active"},
-        fields=["name", "employee_name", "custom_daily_rate as daily_rate"]
+
+    if assignment.task_work_plan:
+        workers = get_plan_workers(assignment.task_work_plan)
+        if not workers:
+            frappe.throw(_("No active workers found in the linked Task Work Plan"))
+    else:
+        # Without a plan, every active worker may be allocated
+        workers = frappe.get_all(
+            "Task Worker", filters={"status": "Active"}, fields=["name", "full_name"], order_by="name"
+        )
+        if not workers:
+            frappe.throw(_("No active workers found"))
+
+    worker_ids = [w.name for w in workers]
+    full_names = {w.name: w.full_name for w in workers}
+    days = allocation_days(assignment.start_date, assignment.expected_end_date)
+    capacity = build_capacity(worker_ids, days, exclude_assignment=assignment.name)
+
+    # Each task starts on its planned start date, or when it actually started
+    plan_starts = get_plan_task_starts(assignment.task_work_plan) if assignment.task_work_plan else {}
+    tasks = []
+    for row in assignment.task_details:
+        task = row.as_dict()
+        task["start_date"] = (
+            plan_starts.get(row.task_name) or plan_starts.get(row.task) or row.actual_start_date
+        )
+        tasks.append(task)
+    rows, summary = allocate(tasks, worker_ids, days, capacity)
+    for row in rows:
+        row["worker_full_name"] = full_names.get(row["employee_name"])
+
+    replace_child_rows(
+        "Task Work Assignment", assignment.name, "worker_assignments", "Worker Assignments", rows
     )
-    
-    if not workers:
-        frappe.throw(_("No active workers found"))
-    
-    # Clear existing assignments
-    assignment.worker_assignments = []
-    
-    # Sort tasks by date
-    tasks = sorted(assignment.task_details, key=lambda x: (x.start_date or assignment.start_date, -x.total_work))
-    
-    current_date = getdate(assignment.start_date)
-    worker_index = 0
-    assignments_created = 0
-    
-    for task in tasks:
-        if not task.total_work:
-            continue
-            
-        total_work = flt(task.total_work)
-        daily_target = flt(task.daily_target) or 1
-        task_duration = task.days or frappe.utils.ceil(total_work / (len(workers) * daily_target))
-        
-        work_remaining = total_work
-        task_start = getdate(task.start_date) or current_date
-        
-        for day in range(task_duration):
-            if work_remaining <= 0:
-                break
-                
-            day_date = add_days(task_start, day)
-            
-            # Calculate workers needed for this day
-            workers_today = min(len(workers), frappe.utils.ceil(work_remaining / daily_target))
-            
-            for i in range(workers_today):
-                if work_remaining <= 0:
-                    break
-                    
-                worker = workers[worker_index % len(workers)]
-                worker_index += 1
-                
-                worker_qty = min(daily_target, work_remaining)
-                
-                # Create assignment
-                row = assignment.append("worker_assignments", {})
-                row.employee_name = worker.name
-                row.task = task.task
-                row.uom = task.uom
-                row.daily_target = daily_target
-                row.rate = task.rate
-                row.quantity_assigned = worker_qty
-                row.total_assigned_cost = flt(task.rate * worker_qty, 2)
-                row.assignment_date = str(day_date)
-                
-                work_remaining -= worker_qty
-                assignments_created += 1
-        
-        # Update current date for next task
-        if task_start > current_date:
-            current_date = add_days(task_start, task_duration)
-        else:
-            current_date = add_days(current_date, task_duration)
-    
-    # Set completion date
-    assignment.completion_date = str(current_date)
-    
-    assignment.save()
-    
+
+    # The rows bypass validate: derive the header fields it would have set.
+    # Rollups, progress totals and stage follow from the stored rows.
+    assignment.set_header_defaults()
+    assignment.total_estimated_cost = sum(flt(row["total_assigned_cost"]) for row in rows)
+    assignment.completion_date = max((row["assignment_date"] for row in rows), default=None)
+    frappe.db.set_value("Task Work Assignment", assignment.name, {
+        field: assignment.get(field)
+        for field in ("title", "business_unit", "cost_centre", "total_estimated_cost", "completion_date")
+    })
+    sync_assignment_earnings(assignment.name)
+    refresh_progress_rollups(assignment.name)
+
+    unassigned = [s for s in summary if s["unassigned"]]
+    message = _("Successfully created {0} assignments").format(len(rows))
+    if unassigned:
+        message += ". " + _("{0} task(s) could not be fully staffed before {1}").format(
+            len(unassigned), days[-1]
+        )
+
     return {
-        'message': _("Successfully created {0} assignments".format(assignments_created)),
-        'assignments_created': assignments_created,
-        'workers_used': len(set([w.employee_name for w in assignment.worker_assignments]))
+        'message': message,
+        'assignments_created': len(rows),
+        'workers_used': len({row["employee_name"] for row in rows}),
+        'plan': summary,
     }
\ No newline at end of file
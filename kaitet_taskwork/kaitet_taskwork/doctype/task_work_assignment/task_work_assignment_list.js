@@ -1,4 +1,31 @@
 frappe.listview_settings['Task Work Assignment'] = {
+	onload: function(listview) {
+		listview.page.add_inner_button(__('Import Actuals'), function() {
+			frappe.prompt([
+				{ fieldname: 'file_url', fieldtype: 'Attach', label: __('CSV / XLSX File'), reqd: 1,
+				  description: __('Columns: assignment, worker, date, task, actual_quantity') }
+			], function(values) {
+				frappe.call({
+					method: 'kaitet_taskwork.kaitet_taskwork.field_capture.import_actuals',
+					args: { file_url: values.file_url },
+					freeze: true,
+					freeze_message: __('Importing actuals…'),
+					callback: function(r) {
+						if (!r.message) return;
+						let msg = __('{0} worker row(s) updated across {1} assignment(s).',
+							[r.message.updated, r.message.assignments.length]);
+						if (r.message.errors.length) {
+							msg += '<br><br><b>' + __('Not imported:') + '</b><br>' + r.message.errors
+								.map(e => (e.line ? __('Line {0}', [e.line]) + ': ' : '') + e.message)
+								.join('<br>');
+						}
+						frappe.msgprint(msg, __('Import Actuals'));
+						listview.refresh();
+					}
+				});
+			}, __('Import Actuals'), __('Import'));
+		});
+	},
 	get_indicator: function(doc) {
 		const map = {
 			'Pending':     ['Pending',     'grey',   'stage,=,Pending'],
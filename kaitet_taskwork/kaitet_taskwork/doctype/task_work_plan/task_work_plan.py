@@ -7,6 +7,8 @@ from frappe.model.document import Document
 from frappe.utils import flt, today, getdate, add_days, date_diff, now_datetime
 import json
 
+from kaitet_taskwork.kaitet_taskwork.availability import WorkerAvailability
+from kaitet_taskwork.kaitet_taskwork.doctype.task_worker.task_worker import clear_plan_workers_cache
 from kaitet_taskwork.kaitet_taskwork.doctype.task_work_request.task_work_request import (
     _get_users_for_role_and_company,
     _send_to_user as _shared_send_to_user,
@@ -49,6 +51,7 @@ class TaskWorkPlan(Document):
         
     def on_update(self):
         self._send_workflow_notification()
+        clear_plan_workers_cache(self.name)
         
     def validate_dates(self):
         """Validate task dates"""
@@ -248,40 +251,45 @@ def get_cost_centre_for_manager(manager_id):
 
 @frappe.whitelist()
 def check_worker_availability(plan_name, tasks, unit=None, start_date=None):
-    """Check available workers for each task based on unit and date"""
+    """
+    Check available workers for each task based on unit and date.
+
+    A worker is available for a task when they are not booked on any day
+    of its window, by a submitted assignment or an open plan (this one
+    included, as before), and the company holidays and their weekly offs
+    leave a working day in it. All tasks are answered by one
+    WorkerAvailability built over the plan's horizon; workers are only
+    limited to the unit when Task Worker has a unit field, and the user is
+    told otherwise.
+    """
     if isinstance(tasks, str):
         tasks = json.loads(tasks)
-    
+    tasks = [task for task in tasks if task.get('task_name')]
+
+    plan = frappe.db.get_value("Task Work Plan", plan_name, ["unitdivision", "company"], as_dict=True) if plan_name else None
+    unit = unit or (plan and plan.unitdivision)
+    company = (plan and plan.company) or frappe.defaults.get_user_default("Company")
+
+    windows = [
+        (getdate(task.get('start_date') or start_date), getdate(task.get('end_date')))
+        for task in tasks
+        if (task.get('start_date') or start_date) and task.get('end_date')
+    ]
+    horizon = (min(w[0] for w in windows), max(w[1] for w in windows)) if windows else (today(), today())
+    engine = WorkerAvailability(*horizon, unit=unit, company=company)
+
     availability_data = []
-    
-    # Get total active workers in the unit
-    worker_filters = {"status": "Active"}
-    
-    total_workers = frappe.db.count("Task Worker", filters=worker_filters)
-    
     for task in tasks:
-        if not task.get('task_name'):
-            continue
-        
         task_name = task.get('task_name')
         workers_needed = task.get('workers_required') or task.get('workers', 1)
         task_start = task.get('start_date') or start_date
         task_end = task.get('end_date')
-        
-        # Get workers already assigned during this period
-        assigned_workers = 0
-        if task_start and task_end and plan_name:
-            assigned_workers = frappe.db.sql("""
-                SELECT COUNT(DISTINCT tp.task_worker)
-                FROM `tabTask Plan` tp
-                WHERE tp.parent = %s
-                    AND tp.start_date <= %s
-                    AND tp.end_date >= %s
-                    AND tp.task_worker IS NOT NULL
-            """, (plan_name, task_end, task_start))[0][0]
-        
-        workers_available = max(0, total_workers - assigned_workers)
-        
+
+        if task_start and task_end:
+            workers_available = engine.count(task_start, task_end)
+        else:
+            workers_available = len(engine.workers)
+
         # Calculate required days based on available workers
         required_days = 1
         if workers_available > 0 and task.get('total_work') and task.get('daily_target'):
@@ -290,7 +298,7 @@ def check_worker_availability(plan_name, tasks, unit=None, start_date=None):
             daily_capacity = daily_target * workers_available
             if daily_capacity > 0:
                 required_days = frappe.utils.ceil(total_work / daily_capacity)
-        
+
         availability_data.append({
             'task_name': task_name,
             'workers_needed': workers_needed,
@@ -303,7 +311,7 @@ def check_worker_availability(plan_name, tasks, unit=None, start_date=None):
             'rate': task.get('rate'),
             'required_days': required_days
         })
-    
+
     return availability_data
 
 
@@ -1,7 +1,21 @@
-import random
-
 import frappe
+from frappe.model.db_query import DatabaseQuery
 from frappe.model.document import Document
+from frappe.utils import cint
+
+from kaitet_taskwork.kaitet_taskwork.bulk import update_rows
+from kaitet_taskwork.kaitet_taskwork.doctype.tw_payroll_number.tw_payroll_number import (
+    allocate_payroll_numbers,
+    claim_payroll_number,
+    is_payroll_number,
+    release_payroll_number,
+)
+
+# Task Workers per busy-state statement
+STATE_BATCH = 1000
+# Plan worker lists are cached briefly; the plan clears its entry on save
+PLAN_WORKERS_CACHE_KEY = "tw_plan_workers"
+PLAN_WORKERS_CACHE_SECONDS = 120
 
 
 class TaskWorker(Document):
@@ -9,22 +23,19 @@ class TaskWorker(Document):
         if self.payroll_number:
             # Importing an existing worker — use the supplied number
             self.payroll_number = str(self.payroll_number).strip()
-            if not self.payroll_number.isdigit() or len(self.payroll_number) != 5:
+            if not is_payroll_number(self.payroll_number):
                 frappe.throw(frappe._("Payroll Number must be exactly 5 digits (e.g. 45677)."))
             if frappe.db.exists("Task Worker", self.payroll_number):
                 frappe.throw(frappe._("Payroll Number {0} is already in use by a Task Worker.").format(self.payroll_number))
             self._check_employee_payroll_duplicate(self.payroll_number)
         else:
-            self.payroll_number = self._generate_payroll_number()
+            self.payroll_number = allocate_payroll_numbers(1)[0]
+        # Atomic: a number taken concurrently or held by an Employee raises here
+        claim_payroll_number(self.payroll_number, "Task Worker", self.payroll_number)
         self.name = self.payroll_number
 
-    def _generate_payroll_number(self):
-        existing = set(frappe.db.sql_list("SELECT name FROM `tabTask Worker`"))
-        for _ in range(10000):
-            candidate = str(random.randint(10000, 99999))
-            if candidate not in existing:
-                return candidate
-        frappe.throw(frappe._("Could not generate a unique payroll number. Please contact the system administrator."))
+    def on_trash(self):
+        release_payroll_number(self.name, "Task Worker", self.name)
 
     def validate(self):
         self.set_full_name()
@@ -32,8 +43,7 @@ class TaskWorker(Document):
         self._check_employee_payroll_duplicate(self.payroll_number, exclude_self=True)
 
     def set_full_name(self):
-        names = [self.first_name or "", self.second_name or "", self.last_name or ""]
-        self.full_name = " ".join(n for n in names if n).strip()
+        self.full_name = build_full_name(self.first_name, self.second_name, self.last_name)
 
     def _check_employee_payroll_duplicate(self, payroll_number, exclude_self=False):
         """Raise an error if payroll_number already exists in the Employee table."""
@@ -49,23 +59,98 @@ class TaskWorker(Document):
             )
 
     def validate_payment_method(self):
-        if self.payment_method == "Bank Transfer":
-            if not self.bank_name:
-                frappe.throw(
-                    frappe._("Please enter Bank Name for Bank Transfer payment method")
-                )
-            if not self.account_number:
-                frappe.throw(
-                    frappe._("Please enter Account Number for Bank Transfer payment method")
-                )
-        elif self.payment_method == "M-Pesa":
-            if not self.mpesa_phone:
-                frappe.throw(frappe._("Please enter M-Pesa Phone Number"))
+        errors = payment_method_errors(self)
+        if errors:
+            frappe.throw(errors[0])
+
+
+def build_full_name(first_name, second_name, last_name):
+    return " ".join(n for n in (first_name or "", second_name or "", last_name or "") if n).strip()
+
+
+def payment_method_errors(worker):
+    """Missing payment details of a Task Worker doc or dict, as messages."""
+    errors = []
+    if worker.get("payment_method") == "Bank Transfer":
+        if not worker.get("bank_name"):
+            errors.append(frappe._("Please enter Bank Name for Bank Transfer payment method"))
+        if not worker.get("account_number"):
+            errors.append(frappe._("Please enter Account Number for Bank Transfer payment method"))
+    elif worker.get("payment_method") == "M-Pesa":
+        if not worker.get("mpesa_phone"):
+            errors.append(frappe._("Please enter M-Pesa Phone Number"))
+    return errors
+
+
+def on_doctype_update():
+    # Candidate searches filter on status and busy state, then order by name
+    frappe.db.add_index("Task Worker", ["status", "current_assignment"])
+    frappe.db.add_index("Task Worker", ["status", "active_assignments", "full_name"])
+    frappe.db.add_index("Task Worker", ["full_name"])
+
+
+def refresh_busy_state(workers, prefer=None):
+    """
+    Recompute ``active_assignments`` and ``current_assignment`` of *workers*
+    from the TW Worker Occupancy index, which holds the days of every
+    submitted assignment, and from the worker rows of submitted assignments
+    that have no date (and so no occupancy row). A worker may be on several
+    assignments at once; ``current_assignment`` keeps its value while still
+    active, otherwise becomes *prefer* (when the worker is on it) or another
+    active one.
+
+    Two reads of the bookings, one of Task Worker and batched CASE UPDATEs
+    per block of workers, touching only workers whose values change.
+    Returns the workers that became ``busy`` and ``free``.
+    """
+    workers = sorted({w for w in workers if w})
+    changed = {"busy": [], "free": []}
+
+    for i in range(0, len(workers), STATE_BATCH):
+        batch = tuple(workers[i:i + STATE_BATCH])
+        active = {}
+        for worker, assignment in frappe.db.sql("""
+            SELECT DISTINCT worker, task_work_assignment
+            FROM `tabTW Worker Occupancy`
+            WHERE worker IN %s
+        """, (batch,)):
+            active.setdefault(worker, set()).add(assignment)
+        # Rows without a date still put the worker on the assignment
+        for worker, assignment in frappe.db.sql("""
+            SELECT DISTINCT wa.employee_name, wa.parent
+            FROM `tabWorker Assignments` wa
+            INNER JOIN `tabTask Work Assignment` twa ON twa.name = wa.parent
+            WHERE wa.employee_name IN %s
+              AND wa.assignment_date IS NULL
+              AND wa.parenttype = 'Task Work Assignment'
+              AND twa.docstatus = 1
+        """, (batch,)):
+            active.setdefault(worker, set()).add(assignment)
+
+        updates = {}
+        for row in frappe.db.sql("""
+            SELECT name, IFNULL(active_assignments, 0) AS active_assignments, current_assignment
+            FROM `tabTask Worker`
+            WHERE name IN %s
+        """, (batch,), as_dict=True):
+            assignments = active.get(row.name, set())
+            current = row.current_assignment
+            if current not in assignments:
+                current = prefer if prefer in assignments else max(assignments, default=None)
+            if (len(assignments), current) == (row.active_assignments, row.current_assignment):
+                continue
+            updates[row.name] = {"active_assignments": len(assignments), "current_assignment": current}
+            if bool(assignments) != bool(row.active_assignments):
+                changed["busy" if assignments else "free"].append(row.name)
+
+        update_rows("Task Worker", updates, update_modified=False)
+
+    return changed
 
 
 @frappe.whitelist()
 def get_available_task_workers(plan_workers=None):
-    """Return Task Workers who are Active and have no current submitted assignment.
+    """Return Task Workers who are Active and on no submitted assignment.
 
     Args:
         plan_workers: JSON list of Task Worker names from the linked plan.
@@ -73,7 +158,7 @@ def get_available_task_workers(plan_workers=None):
     """
     import json
 
-    filters = {"status": "Active", "current_assignment": ["in", ["", None]]}
+    filters = {"status": "Active", "active_assignments": 0}
 
     if plan_workers:
         if isinstance(plan_workers, str):
@@ -87,3 +172,108 @@ def get_available_task_workers(plan_workers=None):
         fields=["name", "full_name", "payment_method", "status"],
         order_by="full_name asc",
     )
+
+
+def get_plan_worker_names(plan):
+    """Task Worker names listed on a Task Work Plan, cached for a couple of minutes."""
+    key = f"{PLAN_WORKERS_CACHE_KEY}:{plan}"
+    names = frappe.cache().get_value(key)
+    if names is None:
+        names = frappe.db.sql_list("""
+            SELECT DISTINCT task_worker FROM `tabTask Plan`
+            WHERE parent = %s AND parenttype = 'Task Work Plan' AND IFNULL(task_worker, '') != ''
+        """, plan)
+        frappe.cache().set_value(key, names, expires_in_sec=PLAN_WORKERS_CACHE_SECONDS)
+    return names
+
+
+def clear_plan_workers_cache(plan):
+    frappe.cache().delete_value(f"{PLAN_WORKERS_CACHE_KEY}:{plan}")
+
+
+def _search_workers(txt=None, plan=None, only_available=True, assignment=None,
+                    after=None, offset=0, limit=20):
+    """
+    Active Task Workers ordered by (full_name, name), matching *txt* as a
+    prefix of the full name, first or last name, or payroll number. Rows
+    come after the keyset cursor *after* (``[full_name, name]``) or skip
+    *offset* rows. Busy workers are left out with *only_available*, except
+    those whose current assignment is *assignment*. Only workers the user
+    may read are returned, as with frappe.get_list.
+    """
+    # Match conditions refer to the table by name, so it is not aliased here
+    conditions = ["status = 'Active'"]
+    match = DatabaseQuery("Task Worker").build_match_conditions()
+    if match:
+        # The query is run with named parameters
+        conditions.append("({})".format(match.replace("%", "%%")))
+    values = {"limit": limit, "offset": offset}
+
+    if plan:
+        names = get_plan_worker_names(plan)
+        if not names:
+            return []
+        conditions.append("name IN %(plan_workers)s")
+        values["plan_workers"] = tuple(names)
+
+    if cint(only_available):
+        conditions.append("(IFNULL(active_assignments, 0) = 0 OR current_assignment = %(assignment)s)")
+        values["assignment"] = assignment or ""
+
+    txt = (txt or "").strip()
+    if txt:
+        # Prefix matches can use the indexes; escape LIKE wildcards in the input
+        values["prefix"] = txt.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        conditions.append("""(full_name LIKE %(prefix)s OR name LIKE %(prefix)s
+            OR first_name LIKE %(prefix)s OR last_name LIKE %(prefix)s)""")
+
+    if after:
+        values["after_name"], values["after_id"] = after
+        conditions.append("""(full_name > %(after_name)s
+            OR (full_name = %(after_name)s AND name > %(after_id)s))""")
+
+    return frappe.db.sql(f"""
+        SELECT name, full_name, payment_method, status,
+               IFNULL(active_assignments, 0) AS active_assignments, current_assignment
+        FROM `tabTask Worker`
+        WHERE {" AND ".join(conditions)}
+        ORDER BY full_name, name
+        LIMIT %(offset)s, %(limit)s
+    """, values, as_dict=True)
+
+
+@frappe.whitelist()
+def search_task_workers(txt=None, plan=None, only_available=1, assignment=None, cursor=None, page_length=20):
+    """
+    Paged worker search for the assignment pickers. Pass the returned
+    ``next_cursor`` back as *cursor* for the next page; it is None on the
+    last page.
+    """
+    frappe.has_permission("Task Worker", "read", throw=True)
+    page_length = min(cint(page_length) or 20, 200)
+    if isinstance(cursor, str):
+        cursor = frappe.parse_json(cursor)
+
+    workers = _search_workers(txt, plan, only_available, assignment, after=cursor or None, limit=page_length + 1)
+    next_cursor = None
+    if len(workers) > page_length:
+        workers = workers[:page_length]
+        next_cursor = [workers[-1].full_name, workers[-1].name]
+    return {"workers": workers, "next_cursor": next_cursor}
+
+
+@frappe.whitelist()
+@frappe.validate_and_sanitize_search_inputs
+def task_worker_query(doctype, txt, searchfield, start, page_len, filters):
+    """Link field query: free plan workers matching *txt*, for Worker Assignments rows."""
+    frappe.has_permission("Task Worker", "read", throw=True)
+    filters = filters or {}
+    workers = _search_workers(
+        txt,
+        plan=filters.get("plan"),
+        only_available=filters.get("only_available", 1),
+        assignment=filters.get("assignment"),
+        offset=cint(start),
+        limit=cint(page_len) or 20,
+    )
+    return [(w.name, w.full_name) for w in workers]
@@ -0,0 +1,28 @@
+frappe.listview_settings['Task Worker'] = {
+	onload: function(listview) {
+		listview.page.add_inner_button(__('Bulk Onboard'), function() {
+			frappe.prompt([
+				{ fieldname: 'file_url', fieldtype: 'Attach', label: __('CSV / XLSX File'), reqd: 1,
+				  description: __('Columns: first_name, last_name, id_number and optionally payroll_number, second_name, date_of_birth, gender, phone, status, payment_method, bank_name, branch_name, account_number, account_name, mpesa_phone, mpesa_name') }
+			], function(values) {
+				frappe.call({
+					method: 'kaitet_taskwork.kaitet_taskwork.onboarding.import_task_workers',
+					args: { file_url: values.file_url },
+					freeze: true,
+					freeze_message: __('Onboarding workers…'),
+					callback: function(r) {
+						if (!r.message) return;
+						let msg = __('{0} Task Worker(s) created.', [r.message.created]);
+						if (r.message.errors.length) {
+							msg += '<br><br><b>' + __('Not imported:') + '</b><br>' + r.message.errors
+								.map(e => __('Line {0}', [e.line]) + ': ' + e.message)
+								.join('<br>');
+						}
+						frappe.msgprint(msg, __('Bulk Onboard'));
+						listview.refresh();
+					}
+				});
+			}, __('Bulk Onboard'), __('Import'));
+		});
+	}
+};
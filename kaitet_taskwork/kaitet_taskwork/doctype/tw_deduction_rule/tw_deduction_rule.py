@@ -0,0 +1,35 @@
+# Copyright (c) 2025, Upande and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import flt
+
+from kaitet_taskwork.kaitet_taskwork.deductions import clear_deduction_rules_cache
+
+
+class TWDeductionRule(Document):
+
+	def validate(self):
+		if self.deduction_type == "Banded" and not self.bands:
+			frappe.throw("Add at least one band for a Banded deduction.")
+		self.validate_bands()
+
+	def validate_bands(self):
+		"""Bands must not overlap; only the last one may be open-ended."""
+		bands = sorted(self.bands, key=lambda b: flt(b.from_amount))
+		for i, band in enumerate(bands):
+			upper = flt(band.to_amount)
+			if upper and upper <= flt(band.from_amount):
+				frappe.throw(f"Row {band.idx}: To Amount must be greater than From Amount.")
+			if i + 1 < len(bands):
+				if not upper:
+					frappe.throw(f"Row {band.idx}: only the highest band can be left without a To Amount.")
+				if flt(bands[i + 1].from_amount) < upper:
+					frappe.throw(f"Row {bands[i + 1].idx}: bands overlap.")
+
+	def on_update(self):
+		clear_deduction_rules_cache()
+
+	def on_trash(self):
+		clear_deduction_rules_cache()
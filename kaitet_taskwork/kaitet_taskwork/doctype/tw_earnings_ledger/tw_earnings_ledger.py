@@ -0,0 +1,103 @@
+# Copyright (c) 2025, Upande and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import flt, getdate, now, today
+
+
+class TWEarningsLedger(Document):
+	"""
+	One row per Worker Assignments row of a non-cancelled Task Work Assignment.
+	The ledger row shares its name with the child row it mirrors and is
+	rewritten by sync_assignment_earnings — never edit it by hand.
+	"""
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("TW Earnings Ledger", ["worker", "posting_date"])
+	# Per-assignment rewrites and lookups
+	frappe.db.add_index("TW Earnings Ledger", ["task_work_assignment", "worker"])
+
+
+def _insert_ledger_rows(condition, values):
+	"""Copy matching Worker Assignments rows into the ledger in one statement."""
+	values = dict(values, now=now(), user=frappe.session.user)
+	frappe.db.sql(f"""
+		INSERT INTO `tabTW Earnings Ledger`
+			(name, owner, creation, modified, modified_by, docstatus,
+			 worker, posting_date, task_work_assignment, task,
+			 company, unitdivision, cost_centre,
+			 quantity, amount, achievement)
+		SELECT wa.name, %(user)s, %(now)s, %(now)s, %(user)s, 0,
+		       wa.employee_name, wa.assignment_date, twa.name, wa.task,
+		       twa.company, twa.unitdivision, twa.cost_centre,
+		       IFNULL(wa.actual_quantity, 0),
+		       CASE WHEN IFNULL(wa.actual_cost, 0) != 0
+		            THEN wa.actual_cost
+		            ELSE IFNULL(wa.actual_quantity, 0) * IFNULL(wa.rate, 0)
+		       END,
+		       IFNULL(wa.achievement, 0)
+		FROM `tabWorker Assignments` wa
+		INNER JOIN `tabTask Work Assignment` twa ON twa.name = wa.parent
+		WHERE wa.parenttype = 'Task Work Assignment'
+		  AND twa.docstatus < 2
+		  AND IFNULL(wa.employee_name, '') != ''
+		  AND {condition}
+	""", values)
+
+
+def sync_assignment_earnings(assignment_name):
+	"""
+	Rewrite the ledger rows of one Task Work Assignment from its saved
+	Worker Assignments rows. Cancelled assignments end up with no rows.
+	"""
+	frappe.db.delete("TW Earnings Ledger", {"task_work_assignment": assignment_name})
+	_insert_ledger_rows("twa.name = %(assignment)s", {"assignment": assignment_name})
+
+
+def sync_row_earnings(row_names):
+	"""Rewrite the ledger rows of the given Worker Assignments rows only."""
+	if not row_names:
+		return
+	frappe.db.delete("TW Earnings Ledger", {"name": ["in", list(row_names)]})
+	_insert_ledger_rows("wa.name IN %(rows)s", {"rows": tuple(row_names)})
+
+
+def rebuild_earnings_ledger():
+	"""Rebuild the whole ledger from Worker Assignments (used by the backfill patch)."""
+	frappe.db.delete("TW Earnings Ledger")
+	_insert_ledger_rows("1 = 1", {})
+
+
+@frappe.whitelist()
+def get_worker_earnings(worker, from_date=None, to_date=None):
+	"""
+	Return a worker's earnings between two dates from the ledger.
+	Defaults to year-to-date. Needs read access to the Task Worker.
+	"""
+	frappe.has_permission("Task Worker", "read", worker, throw=True)
+
+	to_date = getdate(to_date or today())
+	from_date = getdate(from_date) if from_date else to_date.replace(month=1, day=1)
+
+	totals = frappe.db.sql("""
+		SELECT COUNT(DISTINCT posting_date) AS days_worked,
+		       COUNT(DISTINCT task_work_assignment) AS assignments,
+		       SUM(quantity) AS quantity,
+		       SUM(amount) AS amount
+		FROM `tabTW Earnings Ledger`
+		WHERE worker = %(worker)s
+		  AND posting_date BETWEEN %(from_date)s AND %(to_date)s
+	""", {"worker": worker, "from_date": from_date, "to_date": to_date}, as_dict=True)[0]
+
+	return {
+		"worker":      worker,
+		"from_date":   str(from_date),
+		"to_date":     str(to_date),
+		"days_worked": totals.days_worked or 0,
+		"assignments": totals.assignments or 0,
+		"quantity":    flt(totals.quantity),
+		"amount":      flt(totals.amount),
+	}
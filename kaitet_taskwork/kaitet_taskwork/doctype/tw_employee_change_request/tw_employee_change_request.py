@@ -8,6 +8,9 @@ import frappe
 from frappe import _
 from frappe.model.document import Document
 from frappe.utils import flt, add_days, getdate, today
+from kaitet_taskwork.kaitet_taskwork.doctype.task_work_assignment.task_work_assignment import (
+	swap_worker_rows
+)
 from kaitet_taskwork.kaitet_taskwork.doctype.task_work_request.task_work_request import (
 	_send_to_role, _send_to_user, _build_body
 )
@@ -54,18 +57,18 @@ class TWEmployeeChangeRequest(Document):
 
 	def _apply_change(self):
 		"""Apply the approved employee change to the Task Work Assignment."""
-		assignment = frappe.get_doc("Task Work Assignment", self.task_work_assignment)
-
 		if self.change_type == "Add Employee":
+			assignment = frappe.get_doc("Task Work Assignment", self.task_work_assignment)
 			self._smart_assign_remaining(assignment)
+			assignment.flags.ignore_permissions = True
+			assignment.save()
 
 		elif self.change_type == "Replace Employee":
 			if not self.old_employee:
 				frappe.throw(_("Old Employee is required for Replace Employee change type."))
-			self._replace_worker(assignment)
+			# Rows are swapped in place; the assignment is not loaded or saved
+			self._replace_worker()
 
-		assignment.flags.ignore_permissions = True
-		assignment.save()
 		frappe.msgprint(
 			_(f"Change applied to Task Work Assignment {self.task_work_assignment}."),
 			indicator="green"
@@ -123,7 +126,7 @@ class TWEmployeeChangeRequest(Document):
 		if not rows_added:
 			frappe.throw(_("No remaining work to assign — all tasks are already fully allocated."))
 
-	def _replace_worker(self, assignment):
+	def _replace_worker(self):
 		"""Swap old_employee → new_employee on rows that have no actual work."""
 		# Parse specific row selection from the dialog (if provided)
 		selected_names = None
@@ -134,22 +137,19 @@ class TWEmployeeChangeRequest(Document):
 				pass
 
 		filters = {
-			"parent": assignment.name,
+			"parent": self.task_work_assignment,
+			"parenttype": "Task Work Assignment",
 			"employee_name": self.old_employee,
 			"actual_quantity": ["in", [0, None]],
 		}
 		if self.task:
 			filters["task"] = self.task
 
-		all_rows = frappe.db.get_all(
-			"Worker Assignments", filters=filters,
-			fields=["name", "task", "uom", "rate", "daily_target",
-			        "quantity_assigned", "days", "location", "assignment_date"]
-		)
+		all_rows = frappe.db.get_all("Worker Assignments", filters=filters, pluck="name")
 
 		# Narrow to only the days the requester selected, if specified
 		old_row_names = (
-			[r for r in all_rows if r["name"] in selected_names]
+			[r for r in all_rows if r in selected_names]
 			if selected_names else all_rows
 		)
 
@@ -158,27 +158,10 @@ class TWEmployeeChangeRequest(Document):
 				"No replaceable rows found for {0} — rows with recorded actual work cannot be replaced."
 			).format(self.old_employee))
 
-		# Build replacement rows
-		for r in old_row_names:
-			assignment.append("worker_assignments", {
-				"employee_name":     self.new_employee,
-				"task":              r["task"],
-				"uom":               r["uom"],
-				"rate":              r["rate"],
-				"daily_target":      r["daily_target"],
-				"quantity_assigned": r["quantity_assigned"],
-				"total_assigned_cost": flt(flt(r["rate"]) * flt(r["quantity_assigned"]), 2),
-				"days":              r["days"],
-				"location":          r["location"],
-				"assignment_date":   r["assignment_date"],
-			})
-
-		# Drop old rows
-		old_names = {r["name"] for r in old_row_names}
-		assignment.worker_assignments = [
-			row for row in assignment.worker_assignments
-			if row.name not in old_names
-		]
+		swap_worker_rows(
+			self.task_work_assignment, old_row_names, self.old_employee, self.new_employee,
+			reason=_("Employee Change Request {0}").format(self.name),
+		)
 
 
 @frappe.whitelist()
@@ -0,0 +1,170 @@
+# Copyright (c) 2026, Upande and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from kaitet_taskwork.kaitet_taskwork import onboarding
+from kaitet_taskwork.kaitet_taskwork.doctype.tw_payroll_number.tw_payroll_number import (
+	LAST_NUMBER,
+	SERIES_KEY,
+	_free_numbers,
+	_reserve,
+	allocate_payroll_numbers,
+	claim_employee_number,
+	claim_payroll_number,
+	claim_payroll_numbers,
+	release_employee_number,
+)
+
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+# Numbers the tests work in; cleared before each test
+TEST_RANGE = (97000, 97099)
+
+
+def _set_counter(current):
+	"""Point the allocator's counter at *current* (the last number handed out)."""
+	frappe.db.sql("INSERT IGNORE INTO `tabSeries` (name, current) VALUES (%s, 0)", SERIES_KEY)
+	frappe.db.sql("UPDATE `tabSeries` SET current = %s WHERE name = %s", (current, SERIES_KEY))
+
+
+def _row(number):
+	return frappe.db.get_value(
+		"TW Payroll Number", str(number), ["status", "holder_doctype", "holder", "reservation"], as_dict=True
+	)
+
+
+class FakeEmployee(frappe._dict):
+	"""The Employee fields the doc_events read, without an HR setup."""
+
+	def get_doc_before_save(self):
+		return self.before
+
+
+class IntegrationTestTWPayrollNumber(IntegrationTestCase):
+	"""
+	Integration tests for the payroll number allocator.
+	"""
+
+	def setUp(self):
+		first, last = TEST_RANGE
+		frappe.db.sql(
+			"DELETE FROM `tabTW Payroll Number` WHERE name BETWEEN %s AND %s", (str(first), str(last))
+		)
+		_set_counter(first - 1)
+
+	def test_allocations_get_disjoint_ranges(self):
+		first = allocate_payroll_numbers(3)
+		second = allocate_payroll_numbers(2)
+
+		self.assertEqual(first, ["97000", "97001", "97002"])
+		self.assertEqual(second, ["97003", "97004"])
+		self.assertEqual({_row(n).status for n in first + second}, {"Reserved"})
+		# Each allocation marks its rows with its own token
+		self.assertNotEqual(_row(first[0]).reservation, _row(second[0]).reservation)
+
+	def test_allocation_skips_claimed_numbers(self):
+		claim_payroll_number("97001", "Employee", "EMP-TEST-1")
+		claim_payroll_number("97002", "Task Worker", "97002")
+
+		self.assertEqual(allocate_payroll_numbers(2), ["97000", "97003"])
+		self.assertEqual(_row("97001").holder, "EMP-TEST-1")
+
+	def test_exhausted_counter_falls_back_to_lowest_free(self):
+		_set_counter(LAST_NUMBER)
+		expected = _free_numbers(2)
+
+		self.assertEqual(allocate_payroll_numbers(2), expected)
+		# Now reserved, so the next caller gets the following free number
+		self.assertNotIn(allocate_payroll_numbers(1)[0], expected)
+
+	def test_fallback_does_not_share_a_number_with_a_concurrent_caller(self):
+		# Another caller reserved the number first; its row is not ours
+		self.assertEqual(_reserve(["97010"], "other-caller"), ["97010"])
+		self.assertEqual(_reserve(["97010"], "this-caller"), [])
+
+		with patch(
+			"kaitet_taskwork.kaitet_taskwork.doctype.tw_payroll_number.tw_payroll_number._free_numbers",
+			side_effect=lambda count, exclude=(): [
+				str(n) for n in range(97010, 97020) if str(n) not in exclude
+			][:count],
+		):
+			_set_counter(LAST_NUMBER)
+			self.assertEqual(allocate_payroll_numbers(1), ["97011"])
+
+	def test_exhausted_range_raises(self):
+		_set_counter(LAST_NUMBER)
+		with patch(
+			"kaitet_taskwork.kaitet_taskwork.doctype.tw_payroll_number.tw_payroll_number._free_numbers",
+			return_value=[],
+		):
+			self.assertRaises(frappe.ValidationError, allocate_payroll_numbers, 1)
+
+	def test_claims_take_free_and_reserved_numbers_only(self):
+		reserved = allocate_payroll_numbers(1)[0]
+		claim_payroll_number("97050", "Employee", "EMP-TEST-1")
+
+		claimed = claim_payroll_numbers(
+			{reserved: reserved, "97051": "97051", "97050": "97050"}, "Task Worker"
+		)
+
+		self.assertEqual(claimed, {reserved, "97051"})
+		self.assertEqual(_row(reserved).status, "Assigned")
+		self.assertEqual(_row("97050").holder_doctype, "Employee")
+		self.assertRaises(frappe.ValidationError, claim_payroll_number, "97050", "Task Worker", "97050")
+
+	def test_employee_hooks_claim_and_release_numbers(self):
+		employee = FakeEmployee(name="EMP-TEST-2", employee_number="97060", before=None)
+		claim_employee_number(employee)
+		self.assertEqual((_row("97060").holder_doctype, _row("97060").holder), ("Employee", "EMP-TEST-2"))
+
+		# Changing the number frees the old one
+		employee.before = FakeEmployee(employee_number="97060")
+		employee.employee_number = "97061"
+		claim_employee_number(employee)
+		self.assertIsNone(_row("97060"))
+		self.assertEqual(_row("97061").holder, "EMP-TEST-2")
+
+		# Deleting the Employee frees its number
+		release_employee_number(employee)
+		self.assertIsNone(_row("97061"))
+
+		# A number held by a Task Worker cannot be taken
+		claim_payroll_number("97062", "Task Worker", "97062")
+		other = FakeEmployee(name="EMP-TEST-3", employee_number="97062", before=None)
+		self.assertRaises(frappe.ValidationError, claim_employee_number, other)
+		self.assertEqual(_row("97062").holder_doctype, "Task Worker")
+
+	def test_onboarding_reports_numbers_taken_during_the_import(self):
+		def worker(number, first_name):
+			return {
+				"payroll_number": number,
+				"first_name":     first_name,
+				"last_name":      "Onboarded",
+				"id_number":      f"ID{number}",
+				"payment_method": "M-Pesa",
+				"mpesa_phone":    "0712345678",
+			}
+
+		def claim_after_a_rival(holders, holder_doctype):
+			# Another import takes 97071 between the checks and the claim
+			claim_payroll_number("97071", "Employee", "EMP-RIVAL")
+			return claim_payroll_numbers(holders, holder_doctype)
+
+		with patch.object(onboarding, "claim_payroll_numbers", side_effect=claim_after_a_rival):
+			result = onboarding.onboard_workers([worker("97070", "First"), worker("97071", "Second")])
+
+		self.assertEqual(result["workers"], ["97070"])
+		self.assertEqual(result["errors"], [
+			{"line": 2, "message": "Payroll Number 97071 was taken during the import."},
+		])
+		self.assertTrue(frappe.db.exists("Task Worker", "97070"))
+		self.assertFalse(frappe.db.exists("Task Worker", "97071"))
@@ -0,0 +1,214 @@
+# Copyright (c) 2025, Upande and contributors
+# For license information, please see license.txt
+
+"""
+Allocator for the 5-digit payroll numbers shared by Task Workers and
+Employees.
+
+Every number in use or reserved has a TW Payroll Number row named after it,
+so claiming a number is an atomic INSERT IGNORE on the primary key. New
+numbers are handed out from a counter in ``tabSeries`` that is advanced
+atomically by the size of the request, so concurrent allocations get
+disjoint ranges; numbers in a range that were already claimed (imported
+workers, Employees) are skipped with one range lookup. Each allocation
+marks the rows it reserves with its own token, so when the counter is
+exhausted and callers fall back to the lowest free numbers, a number
+reserved by a concurrent caller is never handed out twice.
+"""
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import cint, cstr, now
+
+FIRST_NUMBER = 10000
+LAST_NUMBER = 99999
+# tabSeries row holding the last number handed out by the counter
+SERIES_KEY = "TW-PAYROLL-NUMBER"
+# Largest block reserve_payroll_numbers hands out at once
+MAX_BLOCK = 5000
+# Numbers per claim statement
+CLAIM_BATCH = 1000
+
+
+class TWPayrollNumber(Document):
+	"""
+	One row per payroll number taken by a Task Worker or an Employee, or
+	reserved for a bulk import. Written by the allocator only.
+	"""
+	pass
+
+
+def is_payroll_number(value):
+	value = cstr(value).strip()
+	return len(value) == 5 and value.isdigit()
+
+
+def _insert_numbers(numbers, status, holder_doctype=None, holders=None, reservation=None):
+	"""INSERT IGNORE *numbers*; *holders* maps a number to its holder."""
+	if not numbers:
+		return
+	holders = holders or {}
+	timestamp, user = now(), frappe.session.user
+	placeholders = ", ".join(["(%s, %s, %s, %s, %s, 0, 0, %s, %s, %s, %s)"] * len(numbers))
+	values = []
+	for number in numbers:
+		values += [
+			number, user, timestamp, timestamp, user, status, reservation, holder_doctype, holders.get(number)
+		]
+	frappe.db.sql(f"""
+		INSERT IGNORE INTO `tabTW Payroll Number`
+			(name, owner, creation, modified, modified_by, docstatus, idx,
+			 status, reservation, holder_doctype, holder)
+		VALUES {placeholders}
+	""", values)
+
+
+def _take_range(count):
+	"""Advance the counter by *count*; returns the (first, last) numbers taken."""
+	frappe.db.sql(
+		"INSERT IGNORE INTO `tabSeries` (name, current) VALUES (%s, %s)",
+		(SERIES_KEY, FIRST_NUMBER - 1),
+	)
+	frappe.db.sql(
+		"UPDATE `tabSeries` SET current = LAST_INSERT_ID(current + %s) WHERE name = %s",
+		(count, SERIES_KEY),
+	)
+	last = cint(frappe.db.sql("SELECT LAST_INSERT_ID()")[0][0])
+	return last - count + 1, last
+
+
+def _reserve(numbers, reservation):
+	"""Reserve *numbers* under the *reservation* token, returning those it got."""
+	taken = set(frappe.db.sql_list(
+		"SELECT name FROM `tabTW Payroll Number` WHERE name IN %s", (tuple(numbers),)
+	))
+	free = [n for n in numbers if n not in taken]
+	_insert_numbers(free, "Reserved", reservation=reservation)
+	# Numbers inserted first by another caller, or claimed since, are not ours
+	return frappe.db.sql_list("""
+		SELECT name FROM `tabTW Payroll Number`
+		WHERE name IN %s AND status = 'Reserved' AND holder IS NULL AND reservation = %s
+		ORDER BY name
+	""", (tuple(free) or ("",), reservation))
+
+
+def _free_numbers(count, exclude=()):
+	"""
+	Lowest unused numbers not in *exclude*, for when the counter has passed
+	the end of the range.
+	"""
+	taken = set(frappe.db.sql_list("SELECT name FROM `tabTW Payroll Number`"))
+	taken.update(exclude)
+	free = []
+	for n in range(FIRST_NUMBER, LAST_NUMBER + 1):
+		if str(n) not in taken:
+			free.append(str(n))
+			if len(free) == count:
+				break
+	return free
+
+
+def allocate_payroll_numbers(count=1):
+	"""
+	Reserve *count* unused payroll numbers and return them in order. They
+	stay reserved (for any holder) until claimed with claim_payroll_number.
+	"""
+	count = cint(count)
+	reservation = frappe.generate_hash(length=16)
+	numbers, tried = [], set()
+	while len(numbers) < count:
+		needed = count - len(numbers)
+		first, last = _take_range(needed)
+		if first > LAST_NUMBER:
+			# Numbers tried already went to another caller; the snapshot may not show them yet
+			candidates = _free_numbers(needed, exclude=tried)
+			if not candidates:
+				frappe.throw(frappe._("All payroll numbers from {0} to {1} are in use.").format(FIRST_NUMBER, LAST_NUMBER))
+		else:
+			candidates = [str(n) for n in range(first, min(last, LAST_NUMBER) + 1)]
+		tried.update(candidates)
+		numbers += _reserve(candidates, reservation)
+	return numbers
+
+
+def claim_payroll_numbers(holders, holder_doctype):
+	"""
+	Take numbers for their holders in batches: *holders* maps number to
+	holder. Free and reserved numbers are claimed; returns the set of
+	numbers now held as asked, so the others belong to someone else.
+	"""
+	numbers = sorted({cstr(n).strip() for n in holders})
+	holders = {cstr(n).strip(): holder for n, holder in holders.items()}
+	claimed = set()
+	for i in range(0, len(numbers), CLAIM_BATCH):
+		batch = numbers[i:i + CLAIM_BATCH]
+		_insert_numbers(batch, "Assigned", holder_doctype, holders)
+
+		cases, values = [], []
+		for number in batch:
+			cases.append("WHEN %s THEN %s")
+			values += [number, holders[number]]
+		frappe.db.sql(f"""
+			UPDATE `tabTW Payroll Number`
+			SET status = 'Assigned', holder_doctype = %s, modified = %s,
+			    holder = CASE name {" ".join(cases)} END
+			WHERE name IN %s AND status = 'Reserved' AND holder IS NULL
+		""", [holder_doctype, now()] + values + [tuple(batch)])
+
+		for number, doctype, holder in frappe.db.sql("""
+			SELECT name, holder_doctype, holder FROM `tabTW Payroll Number` WHERE name IN %s
+		""", (tuple(batch),)):
+			if (doctype, holder) == (holder_doctype, holders[number]):
+				claimed.add(number)
+	return claimed
+
+
+def claim_payroll_number(number, holder_doctype, holder):
+	"""
+	Take *number* for *holder*. Free and reserved numbers can be claimed;
+	a number held by another document raises.
+	"""
+	number = cstr(number).strip()
+	if not claim_payroll_numbers({number: holder}, holder_doctype):
+		current = frappe.db.get_value("TW Payroll Number", number, ["holder_doctype", "holder"], as_dict=True)
+		frappe.throw(frappe._("Payroll Number {0} is already in use by {1} {2}.").format(
+			number, current.holder_doctype, current.holder
+		))
+
+
+def release_payroll_number(number, holder_doctype, holder):
+	"""Free *number* if *holder* holds it."""
+	frappe.db.delete("TW Payroll Number", {
+		"name": cstr(number).strip(),
+		"holder_doctype": holder_doctype,
+		"holder": holder,
+	})
+
+
+@frappe.whitelist(methods=["POST"])
+def reserve_payroll_numbers(count):
+	"""Reserve a block of payroll numbers for a bulk import of Task Workers."""
+	frappe.has_permission("Task Worker", "create", throw=True)
+	count = cint(count)
+	if not 0 < count <= MAX_BLOCK:
+		frappe.throw(frappe._("Reserve between 1 and {0} payroll numbers at a time.").format(MAX_BLOCK))
+	return allocate_payroll_numbers(count)
+
+
+# Employee doc_events: Employee numbers share the payroll number space
+
+def claim_employee_number(doc, method=None):
+	"""Claim a new or changed Employee number (existing ones are seeded by a patch)."""
+	before = doc.get_doc_before_save()
+	old = before.employee_number if before else None
+	if before and old == doc.employee_number:
+		return
+	if is_payroll_number(old):
+		release_payroll_number(old, "Employee", doc.name)
+	if is_payroll_number(doc.employee_number):
+		claim_payroll_number(doc.employee_number, "Employee", doc.name)
+
+
+def release_employee_number(doc, method=None):
+	if is_payroll_number(doc.employee_number):
+		release_payroll_number(doc.employee_number, "Employee", doc.name)
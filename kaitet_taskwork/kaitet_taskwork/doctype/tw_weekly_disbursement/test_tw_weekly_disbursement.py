@@ -0,0 +1,106 @@
+# Copyright (c) 2026, Upande and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import flt, today
+
+from kaitet_taskwork.kaitet_taskwork.doctype.tw_weekly_disbursement.tw_weekly_disbursement import (
+	_partition_accounts,
+)
+
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+COMPANY = "_Test Company"
+
+
+def _ledger(account_name, root_type, account_type=None):
+	"""A ledger account of the test company, created on first use."""
+	name = frappe.db.get_value("Account", {"company": COMPANY, "account_name": account_name})
+	if name:
+		return name
+	parent = frappe.db.get_value(
+		"Account", {"company": COMPANY, "root_type": root_type, "is_group": 1}, "name", order_by="lft desc"
+	)
+	return frappe.get_doc({
+		"doctype": "Account",
+		"account_name": account_name,
+		"company": COMPANY,
+		"parent_account": parent,
+		"account_type": account_type,
+		"is_group": 0,
+	}).insert(ignore_permissions=True).name
+
+
+class IntegrationTestTWWeeklyDisbursement(IntegrationTestCase):
+	"""
+	Integration tests for TWWeeklyDisbursement.
+	Use this class for testing interactions between multiple components.
+	"""
+
+	def setUp(self):
+		self.wages_account = _ledger("_Test TW Wages", "Expense")
+		self.payment_account = _ledger("_Test TW Wages Bank", "Asset", "Bank")
+		self.deductions_account = _ledger("_Test TW Deductions Payable", "Liability")
+		self.cost_center = frappe.get_cached_value("Company", COMPANY, "cost_center")
+
+	def _submitted_disbursement(self, **values):
+		doc = frappe.get_doc(dict({
+			"doctype": "TW Weekly Disbursement",
+			"year": 2026,
+			"week_number": 40,
+			"posting_date": today(),
+			"company": COMPANY,
+			"wages_account": self.wages_account,
+			"payment_account": self.payment_account,
+			"deductions_account": self.deductions_account,
+			"disbursement_entries": [
+				{"task_worker": "TW-DED-1", "worker_name": "Worker One", "gross_amount": 1000, "deductions": 150},
+				{"task_worker": "TW-DED-2", "worker_name": "Worker Two", "gross_amount": 500, "deductions": 50},
+			],
+			"task_breakdown": [
+				{"task_name": "Harvest", "work_date": today(), "cost_centre": self.cost_center, "amount": 1000},
+				{"task_name": "Weeding", "work_date": today(), "cost_centre": self.cost_center, "amount": 500},
+			],
+		}, **values))
+		# Entries point at workers that do not exist in the test site
+		doc.flags.ignore_links = True
+		doc.insert(ignore_permissions=True)
+		doc.submit()
+		return doc
+
+	def test_mark_as_paid_credits_deductions(self):
+		doc = self._submitted_disbursement()
+		self.assertEqual((flt(doc.total_net), flt(doc.total_deductions)), (1300, 200))
+
+		doc.mark_as_paid()
+		doc.reload()
+		self.assertEqual(doc.status, "Paid")
+
+		je = frappe.get_doc("Journal Entry", doc.journal_entry)
+		self.assertEqual(je.docstatus, 1)
+		debit = sum(flt(row.debit_in_account_currency) for row in je.accounts if row.account == self.wages_account)
+		credits = {row.account: flt(row.credit_in_account_currency) for row in je.accounts if row.credit_in_account_currency}
+		self.assertEqual(debit, 1500)
+		self.assertEqual(credits, {self.payment_account: 1300, self.deductions_account: 200})
+		self.assertTrue(all(
+			flt(row.paid) for row in frappe.get_all(
+				"TW Disbursement Entry", filters={"parent": doc.name}, fields=["paid"]
+			)
+		))
+
+	def test_deductions_need_a_payable_account(self):
+		doc = self._submitted_disbursement(deductions_account=None)
+		self.assertRaises(frappe.ValidationError, doc.mark_as_paid)
+		self.assertNotEqual(frappe.db.get_value(doc.doctype, doc.name, "status"), "Paid")
+
+	def test_partition_accounts_given_per_company(self):
+		accounts = _partition_accounts(COMPANY, {
+			COMPANY: {"wages_account": self.wages_account, "payment_account": self.payment_account},
+		})
+		self.assertEqual(accounts, {"wages_account": self.wages_account, "payment_account": self.payment_account})
@@ -8,6 +8,38 @@ frappe.ui.form.on('TW Weekly Disbursement', {
             frm.add_custom_button(__('Load Worker Payments'), function() {
                 load_worker_payments(frm);
             }, __('Actions'));
+
+            if (!frm.is_new() && frm.doc.disbursement_entries && frm.doc.disbursement_entries.length) {
+                frm.add_custom_button(__('Apply Deductions'), function() {
+                    if (frm.is_dirty()) {
+                        frappe.msgprint(__('Save the disbursement before applying deductions.'));
+                        return;
+                    }
+                    frappe.call({
+                        method: 'apply_deductions',
+                        doc: frm.doc,
+                        freeze: true,
+                        freeze_message: __('Applying deductions…'),
+                        callback: function() { frm.reload_doc(); }
+                    });
+                }, __('Actions'));
+            }
+
+            if (!frm.is_new() && frm.doc.last_loaded_on) {
+                frm.add_custom_button(__('Refresh Changed Payments'), function() {
+                    if (frm.is_dirty()) {
+                        frappe.msgprint(__('Save the disbursement before refreshing.'));
+                        return;
+                    }
+                    frappe.call({
+                        method: 'refresh_worker_payments',
+                        doc: frm.doc,
+                        freeze: true,
+                        freeze_message: __('Refreshing changed payments…'),
+                        callback: function() { frm.reload_doc(); }
+                    });
+                }, __('Actions'));
+            }
         }
 
         // ── Submitted + Pending: Approve ────────────────────────────────
@@ -44,6 +76,28 @@ frappe.ui.form.on('TW Weekly Disbursement', {
             }, __('Actions'));
         }
 
+        // ── Submitted: payout files for the bank / M-Pesa upload ──────────
+        if (frm.doc.docstatus === 1) {
+            frm.add_custom_button(__('Bank CSV'), function() {
+                export_payout_file(frm, 'bank');
+            }, __('Payout File'));
+            frm.add_custom_button(__('M-Pesa Bulk File'), function() {
+                export_payout_file(frm, 'mpesa');
+            }, __('Payout File'));
+        }
+
+        // ── Paid: push payouts through the gateway ───────────────────────
+        if (frm.doc.docstatus === 1 && frm.doc.status === 'Paid') {
+            frm.add_custom_button(__('Send Payouts'), function() {
+                frappe.confirm(
+                    __('Send a payout to every worker not yet paid out? Failed payouts are retried.'),
+                    function() {
+                        frappe.call({ method: 'send_payouts', doc: frm.doc });
+                    }
+                );
+            }, __('Actions'));
+        }
+
         // ── Paid: info banner (save still enabled for references/attachments) ─
         if (frm.doc.status === 'Paid') {
             let paid_on = frappe.datetime.str_to_user(frm.doc.paid_on);
@@ -90,6 +144,7 @@ frappe.ui.form.on('TW Weekly Disbursement', {
 
     onload: function(frm) {
         set_account_filters(frm);
+        bind_load_progress(frm);
     }
 });
 
@@ -113,6 +168,15 @@ function set_account_filters(frm) {
             }
         };
     });
+    frm.set_query('deductions_account', function() {
+        return {
+            filters: {
+                company: company,
+                root_type: 'Liability',
+                is_group: 0
+            }
+        };
+    });
 }
 
 /* ── Shared: load worker payments ─────────────────────────────────────── */
@@ -121,6 +185,17 @@ function load_worker_payments(frm) {
         frappe.msgprint(__('Please set Year and Week Number first.'));
         return;
     }
+    // Saved drafts load in a background job so peak weeks don't time out.
+    if (!frm.is_new() && !frm.is_dirty()) {
+        frappe.call({
+            method: 'enqueue_worker_payments',
+            doc: frm.doc,
+            callback: function() {
+                frm.dashboard.show_progress(__('Loading worker payments'), 0, __('Queued…'));
+            }
+        });
+        return;
+    }
     frappe.call({
         method: 'get_worker_payments',
         doc: frm.doc,
@@ -141,6 +216,46 @@ function load_worker_payments(frm) {
     });
 }
 
+/* ── Payout file export ──────────────────────────────────────────────── */
+function export_payout_file(frm, file_format) {
+    frappe.call({
+        method: 'kaitet_taskwork.kaitet_taskwork.payout_export.export_payout_file',
+        args: { disbursement: frm.doc.name, file_format: file_format },
+        freeze: true,
+        freeze_message: __('Generating payout file…'),
+        callback: function(r) {
+            if (!r.message) return;
+            if (!r.message.rows) {
+                frappe.msgprint(__('No entries to pay by this method.'));
+                return;
+            }
+            window.open(r.message.file_url);
+            frm.reload_doc();
+        }
+    });
+}
+
+/* ── Background load / settlement: progress + reload on completion ──── */
+function bind_load_progress(frm) {
+    if (frm._load_progress_bound) return;
+    frm._load_progress_bound = true;
+
+    frappe.realtime.on('tw_disbursement_progress', function(data) {
+        if (!data || data.disbursement !== frm.doc.name) return;
+        let title = __('Loading worker payments');
+        if (data.status === 'Completed' || data.status === 'Failed') {
+            frm.dashboard.hide_progress(title);
+            frappe.show_alert({
+                message: data.message,
+                indicator: data.status === 'Completed' ? 'green' : 'red'
+            }, 7);
+            frm.reload_doc();
+            return;
+        }
+        frm.dashboard.show_progress(title, data.percent, data.message);
+    });
+}
+
 /* ── ISO week → Monday / Sunday dates ─────────────────────────────────── */
 function calculate_week_dates(frm) {
     let year = frm.doc.year;
@@ -1,6 +1,29 @@
+from datetime import date, timedelta
+
 import frappe
 from frappe.model.document import Document
-from frappe.utils import getdate, nowdate, date_diff, flt
+from frappe.utils import cint, getdate, nowdate, now_datetime, date_diff, flt
+
+from kaitet_taskwork.kaitet_taskwork.bulk import (
+	delete_rows,
+	insert_child_rows,
+	replace_child_rows,
+	update_rows,
+)
+from kaitet_taskwork.kaitet_taskwork.deductions import apply_deduction_rules
+
+# Loading a peak week can take several minutes; the lock outlives the job
+# timeout so it is never released while a load is still writing rows.
+LOAD_LOCK_TIMEOUT = 30 * 60
+# Weeks with more entries than this are settled in a background job
+SETTLEMENT_ENQUEUE_THRESHOLD = 1000
+PROGRESS_EVENT = "tw_disbursement_progress"
+# Assignment fields each batch-generated disbursement is split by
+PARTITION_FIELDS = {
+	"Company":       ("company",),
+	"Unit/Division": ("company", "unitdivision"),
+	"Cost Centre":   ("company", "cost_centre"),
+}
 
 
 @frappe.whitelist()
@@ -24,47 +47,455 @@ def _get_worker_details(wid):
 	Return name and payment details for a worker ID.
 	Supports both new Task Worker records and historical Employee records.
 	"""
-	if frappe.db.exists("Task Worker", wid):
-		tw = frappe.get_doc("Task Worker", wid)
+	return _get_worker_details_bulk([wid])[wid]
+
+
+def _get_worker_details_bulk(worker_ids):
+	"""
+	Return ``{worker ID: {worker_name, payment_method, bank_or_mpesa}}`` for
+	every ID in *worker_ids*.
+
+	Task Workers are resolved first; IDs that are not Task Workers are looked up
+	as historical Employee records, with payment details taken from the
+	employee's Bank Account or, failing that, their phone number. Each source is
+	read with a single ``IN (...)`` query over only the columns needed.
+	"""
+	worker_ids = list(dict.fromkeys(wid for wid in worker_ids if wid))
+	details = {}
+	if not worker_ids:
+		return details
+
+	task_workers = frappe.get_all(
+		"Task Worker",
+		filters={"name": ["in", worker_ids]},
+		fields=["name", "full_name", "payment_method", "bank_name", "account_number", "mpesa_phone"],
+	)
+	for tw in task_workers:
 		if tw.payment_method == "Bank Transfer":
 			bank_or_mpesa = f"{tw.bank_name or ''} – {tw.account_number or ''}".strip(" –")
 		else:
 			bank_or_mpesa = tw.mpesa_phone or ""
-		return {
+		details[tw.name] = {
 			"worker_name":    tw.full_name,
 			"payment_method": tw.payment_method or "M-Pesa",
 			"bank_or_mpesa":  bank_or_mpesa,
 		}
 
-	if frappe.db.exists("Employee", wid):
-		emp = frappe.get_doc("Employee", wid)
+	remaining = [wid for wid in worker_ids if wid not in details]
+	if remaining:
+		# custom_mpesa_phone is a site customisation and may not exist
+		emp_meta = frappe.get_meta("Employee")
+		phone_fields = [f for f in ("custom_mpesa_phone", "cell_number") if emp_meta.has_field(f)]
 
-		bank_acc = frappe.db.get_value(
-			"Bank Account",
-			{"party_type": "Employee", "party": wid},
-			["bank", "bank_account_no"],
-			as_dict=True,
+		employees = frappe.get_all(
+			"Employee",
+			filters={"name": ["in", remaining]},
+			fields=["name", "employee_name"] + phone_fields,
 		)
 
-		if bank_acc and bank_acc.bank_account_no:
-			payment_method = "Bank Transfer"
-			bank_or_mpesa = f"{bank_acc.bank or ''} – {bank_acc.bank_account_no}".strip(" –")
-		else:
-			phone = (
-				getattr(emp, "custom_mpesa_phone", None)
-				or getattr(emp, "cell_number", None)
-				or ""
-			)
-			payment_method = "M-Pesa" if phone else ""
-			bank_or_mpesa  = phone
+		bank_accounts = {}
+		if employees:
+			for acc in frappe.get_all(
+				"Bank Account",
+				filters={
+					"party_type": "Employee",
+					"party": ["in", [emp.name for emp in employees]],
+					"bank_account_no": ["is", "set"],
+				},
+				fields=["party", "bank", "bank_account_no"],
+				order_by="creation asc",
+			):
+				bank_accounts.setdefault(acc.party, acc)
 
-		return {
-			"worker_name":    emp.employee_name,
-			"payment_method": payment_method,
-			"bank_or_mpesa":  bank_or_mpesa,
-		}
+		for emp in employees:
+			bank_acc = bank_accounts.get(emp.name)
+			if bank_acc:
+				payment_method = "Bank Transfer"
+				bank_or_mpesa = f"{bank_acc.bank or ''} – {bank_acc.bank_account_no}".strip(" –")
+			else:
+				phone = next((emp.get(f) for f in phone_fields if emp.get(f)), "")
+				payment_method = "M-Pesa" if phone else ""
+				bank_or_mpesa  = phone
+
+			details[emp.name] = {
+				"worker_name":    emp.employee_name,
+				"payment_method": payment_method,
+				"bank_or_mpesa":  bank_or_mpesa,
+			}
+
+	for wid in worker_ids:
+		details.setdefault(wid, {"worker_name": wid, "payment_method": "", "bank_or_mpesa": ""})
+
+	return details
+
+
+def get_disbursement_payment_details(doc):
+	"""
+	Jinja helper for the bank / M-Pesa print formats.
+
+	Resolves payment details, in one batch, for entries that were loaded
+	without a payment method or account so they still land on the right sheet.
+	"""
+	missing = [
+		row.task_worker for row in (doc.disbursement_entries or [])
+		if not (row.payment_method and row.bank_or_mpesa)
+	]
+	return _get_worker_details_bulk(missing)
+
+
+def _scope_conditions(scope, alias=""):
+	"""
+	SQL conditions and values restricting Task Work Assignments to *scope*
+	(``{company, unitdivision, cost_centre}``, blank keys ignored).
+	"""
+	conditions, values = [], {}
+	for field in ("company", "unitdivision", "cost_centre"):
+		if scope and scope.get(field):
+			conditions.append(f"{alias}{field} = %(scope_{field})s")
+			values[f"scope_{field}"] = scope[field]
+	return conditions, values
+
+
+def _get_week_assignments(week_start, week_end, scope=None):
+	"""
+	Return non-cancelled Task Work Assignments overlapping the week, each
+	annotated with the first day of the overlap (``overlap_start``).
+	*scope* limits them to one company / unit / cost centre.
+	"""
+	conditions, values = _scope_conditions(scope)
+	values.update({"start": week_start, "end": week_end})
+	scope_sql = "".join(f" AND {c}" for c in conditions)
+
+	assignments = frappe.db.sql(f"""
+		SELECT name, start_date, completion_date,
+		       expected_start_date, expected_end_date,
+		       task_work_request, task_work_plan, company, unitdivision, cost_centre
+		FROM `tabTask Work Assignment`
+		WHERE docstatus != 2
+		  AND (
+		      (start_date IS NOT NULL
+		         AND start_date <= %(end)s
+		         AND COALESCE(completion_date, %(end)s) >= %(start)s)
+		   OR (start_date IS NULL
+		         AND expected_start_date <= %(end)s
+		         AND expected_end_date >= %(start)s)
+		  ){scope_sql}
+		ORDER BY name
+	""", values, as_dict=True)
+
+	overlapping = []
+	for asgn in assignments:
+		asgn_start = getdate(asgn.start_date or asgn.expected_start_date)
+		asgn_end   = getdate(asgn.completion_date or asgn.expected_end_date)
+
+		overlap_start = max(asgn_start, week_start)
+		overlap_end   = min(asgn_end, week_end)
+		if date_diff(overlap_end, overlap_start) + 1 < 1:
+			continue
+
+		asgn.overlap_start = overlap_start
+		overlapping.append(asgn)
+
+	return overlapping
+
+
+def _breakdown_row(asgn):
+	"""One TW Task Breakdown row per assignment (not per worker)."""
+	return {
+		"daily_form_ref": asgn.name,
+		"task_name":      asgn.task_work_request or asgn.name,
+		"work_date":      str(asgn.overlap_start),
+		"work_location":  asgn.unitdivision or "",
+		"cost_centre":    asgn.cost_centre or "",
+		"amount":         0,
+	}
+
+
+def _week_pay_rows(assignment_names, workers=None):
+	"""
+	Return pay summed per (assignment, worker) from the TW Earnings Ledger,
+	optionally limited to *workers*.
+	"""
+	if not assignment_names:
+		return []
+
+	conditions = ["el.task_work_assignment IN %(assignments)s"]
+	values = {"assignments": tuple(assignment_names)}
+	if workers is not None:
+		if not workers:
+			return []
+		conditions.append("el.worker IN %(workers)s")
+		values["workers"] = tuple(workers)
+
+	return frappe.db.sql(f"""
+		SELECT el.task_work_assignment, el.worker, SUM(el.amount) AS amount
+		FROM `tabTW Earnings Ledger` el
+		WHERE {" AND ".join(conditions)}
+		GROUP BY el.task_work_assignment, el.worker
+		ORDER BY el.task_work_assignment, el.worker
+	""", values, as_dict=True)
+
+
+def _fold_worker_pay(pay_rows):
+	"""Fold (assignment, worker) pay rows into ``{worker: {gross, assignments}}``."""
+	worker_pay = {}
+	for row in pay_rows:
+		pay = worker_pay.setdefault(row.worker, {"gross": 0, "assignments": []})
+		pay["gross"] += flt(row.amount)
+		pay["assignments"].append(row.task_work_assignment)
+	return worker_pay
+
+
+def _aggregate_week_payments(week_start, week_end, scope=None):
+	"""
+	Set-based payroll aggregation for one week.
+
+	Returns ``(assignments, worker_pay, assignment_index)``:
+	  - assignments:      overlapping assignments (see _get_week_assignments)
+	  - worker_pay:       {worker ID: {"gross": pay, "assignments": [names]}}
+	  - assignment_index: {assignment: TW Task Breakdown row}
 
-	return {"worker_name": wid, "payment_method": "", "bank_or_mpesa": ""}
+	Pay is summed per (assignment, worker) in a single grouped query over
+	the TW Earnings Ledger, so the number of queries does not grow with
+	headcount.
+	"""
+	assignments = _get_week_assignments(week_start, week_end, scope)
+	if not assignments:
+		return [], {}, {}
+
+	assignment_index = {asgn.name: _breakdown_row(asgn) for asgn in assignments}
+
+	pay_rows = _week_pay_rows(list(assignment_index))
+	for row in pay_rows:
+		assignment_index[row.task_work_assignment]["amount"] += flt(row.amount)
+
+	return assignments, _fold_worker_pay(pay_rows), assignment_index
+
+
+def _entry_row(wid, pay, details):
+	"""Build a TW Disbursement Entry row for one worker."""
+	return {
+		"task_worker":        wid,
+		"worker_name":        details["worker_name"],
+		"payment_method":     details["payment_method"],
+		"bank_or_mpesa":      details["bank_or_mpesa"],
+		"gross_amount":       pay["gross"],
+		"deductions":         0,
+		# gross_amount already accumulated from actual_cost; compute net
+		"net_amount":         pay["gross"],
+		"paid":               0,
+		"source_assignments": "\n".join(pay["assignments"]),
+	}
+
+
+def _build_disbursement_rows(week_start, week_end, progress=None, scope=None):
+	"""
+	Return ``(assignments, entries, breakdown)`` for the week, where *entries*
+	are TW Disbursement Entry rows and *breakdown* TW Task Breakdown rows.
+
+	*progress*, when given, is called as ``progress(percent, message)``.
+	*scope* is passed on to _get_week_assignments.
+	"""
+	progress = progress or (lambda percent, message: None)
+
+	progress(5, "Aggregating worker assignments…")
+	assignments, worker_pay, assignment_index = _aggregate_week_payments(week_start, week_end, scope)
+	if not assignments:
+		return [], [], []
+
+	progress(40, f"Resolving payment details for {len(worker_pay)} workers…")
+	worker_details = _get_worker_details_bulk(worker_pay)
+
+	entries = [_entry_row(wid, pay, worker_details[wid]) for wid, pay in worker_pay.items()]
+	return assignments, entries, list(assignment_index.values())
+
+
+def _scopes_overlap(a, b):
+	"""True if disbursements *a* and *b* (same week) could pay for the same assignment."""
+	if not (a.get("scope_by_company") and b.get("scope_by_company")):
+		return True
+	if a.company != b.company:
+		return False
+	for field in ("unitdivision", "cost_centre"):
+		if a.get(field) and b.get(field) and a.get(field) != b.get(field):
+			return False
+	return True
+
+
+def _acquire_lock(key, timeout):
+	"""Take a Redis lock; return False if someone else already holds it."""
+	cache = frappe.cache()
+	return bool(cache.set(cache.make_key(key), frappe.session.user, nx=True, ex=timeout))
+
+
+def _release_lock(key):
+	frappe.cache().delete_value(key)
+
+
+def _publish_progress(disbursement, percent, message, status="Running"):
+	frappe.publish_realtime(
+		PROGRESS_EVENT,
+		{"disbursement": disbursement, "percent": percent, "message": message, "status": status},
+		doctype="TW Weekly Disbursement",
+		docname=disbursement,
+	)
+
+
+def load_worker_payments_job(disbursement, lock_key):
+	"""Background job behind TWWeeklyDisbursement.enqueue_worker_payments."""
+	try:
+		doc = frappe.get_doc("TW Weekly Disbursement", disbursement)
+		message = doc._load_worker_payments_in_bulk()
+		frappe.db.commit()
+		_publish_progress(disbursement, 100, message, status="Completed")
+	except Exception:
+		frappe.db.rollback()
+		frappe.log_error(frappe.get_traceback(), f"TW Disbursement load failed: {disbursement}")
+		_publish_progress(
+			disbursement, 100,
+			"Loading worker payments failed. See the Error Log for details.", status="Failed",
+		)
+	finally:
+		_release_lock(lock_key)
+
+
+def settle_disbursement_job(disbursement, lock_key, paid_by):
+	"""Background job behind TWWeeklyDisbursement.mark_as_paid for very large weeks."""
+	try:
+		doc = frappe.get_doc("TW Weekly Disbursement", disbursement)
+		if doc.status == "Paid":
+			return
+		je_name = doc._settle(paid_by)
+		frappe.db.commit()
+		_publish_progress(
+			disbursement, 100,
+			f"Disbursement marked as Paid. Journal Entry {je_name} created.", status="Completed",
+		)
+	except Exception:
+		frappe.db.rollback()
+		frappe.log_error(frappe.get_traceback(), f"TW Disbursement settlement failed: {disbursement}")
+		_publish_progress(
+			disbursement, 100,
+			"Marking the disbursement as paid failed. Nothing was posted; see the Error Log.",
+			status="Failed",
+		)
+	finally:
+		_release_lock(lock_key)
+
+
+def _week_partitions(week_start, week_end, fields, companies=None):
+	"""Return ``{partition key: assignment count}`` for the week's assignments."""
+	partitions = {}
+	for asgn in _get_week_assignments(week_start, week_end):
+		if companies and asgn.company not in companies:
+			continue
+		key = tuple(asgn.get(field) or "" for field in fields)
+		partitions[key] = partitions.get(key, 0) + 1
+	return partitions
+
+
+def _partition_accounts(company, accounts):
+	"""
+	Wages and payment accounts for a generated disbursement of *company*:
+	those given in *accounts* for it, else the defaults of
+	get_default_accounts, else the company's default bank account for
+	payment.
+	"""
+	given = frappe._dict((accounts or {}).get(company) or {})
+	defaults = get_default_accounts(company)
+	return frappe._dict(
+		wages_account=given.wages_account or defaults["wages_account"],
+		payment_account=(
+			given.payment_account
+			or defaults["payment_account"]
+			or frappe.get_cached_value("Company", company, "default_bank_account")
+		),
+	)
+
+
+@frappe.whitelist()
+def generate_weekly_disbursements(year, week_number, partition_by="Company", companies=None, accounts=None):
+	"""
+	Create one draft disbursement per company (optionally per unit/division
+	or cost centre as well) for an ISO week and load each one in its own
+	background job, so the partitions are built in parallel by the workers
+	of the long queue. *accounts* may give
+	``{company: {wages_account, payment_account}}`` for companies without
+	the default accounts. Partitions that already have a disbursement for
+	the week, or whose company has no wages or payment account, are
+	skipped and reported.
+	"""
+	frappe.has_permission("TW Weekly Disbursement", "create", throw=True)
+	if partition_by not in PARTITION_FIELDS:
+		frappe.throw(f"Partition by must be one of: {', '.join(PARTITION_FIELDS)}.")
+
+	try:
+		week_start = date.fromisocalendar(cint(year), cint(week_number), 1)
+	except ValueError:
+		frappe.throw(f"Week {week_number} of {year} is not a valid ISO week.")
+	week_end = week_start + timedelta(days=6)
+
+	companies = frappe.parse_json(companies) if isinstance(companies, str) else companies
+	accounts = frappe.parse_json(accounts) if isinstance(accounts, str) else accounts
+	fields = PARTITION_FIELDS[partition_by]
+	partitions = _week_partitions(week_start, week_end, fields, companies)
+
+	existing = frappe.get_all("TW Weekly Disbursement", filters={
+		"week_start_date": week_start,
+		"week_end_date": week_end,
+		"docstatus": ["<", 2],
+	}, fields=["name", "company", "scope_by_company", "unitdivision", "cost_centre"])
+
+	created, skipped = [], []
+	for key in sorted(partitions):
+		scope = frappe._dict(zip(fields, key), scope_by_company=1)
+		label = " / ".join(value for value in key if value) or "(no company)"
+		if not scope.company:
+			skipped.append(f"{label}: {partitions[key]} assignment(s) without a company")
+			continue
+		clash = next((d.name for d in existing if _scopes_overlap(scope, d)), None)
+		if clash:
+			skipped.append(f"{label}: already covered by {clash}")
+			continue
+		company_accounts = _partition_accounts(scope.company, accounts)
+		missing = [
+			name for field, name in (("wages_account", "wages"), ("payment_account", "payment"))
+			if not company_accounts[field]
+		]
+		if missing:
+			skipped.append(f"{label}: no {' or '.join(missing)} account for {scope.company}")
+			continue
+
+		doc = frappe.new_doc("TW Weekly Disbursement")
+		doc.update({
+			"year":             cint(year),
+			"week_number":      cint(week_number),
+			"company":          scope.company,
+			"posting_date":     nowdate(),
+			"week_start_date":  week_start,
+			"week_end_date":    week_end,
+			"scope_by_company": 1,
+			"unitdivision":     scope.get("unitdivision") or "",
+			"cost_centre":      scope.get("cost_centre") or None,
+			"wages_account":    company_accounts.wages_account,
+			"payment_account":  company_accounts.payment_account,
+		})
+		doc.insert()
+		existing.append(doc)
+
+		lock_key = doc._load_lock_key()
+		if _acquire_lock(lock_key, LOAD_LOCK_TIMEOUT):
+			frappe.enqueue(
+				"kaitet_taskwork.kaitet_taskwork.doctype.tw_weekly_disbursement.tw_weekly_disbursement.load_worker_payments_job",
+				queue="long",
+				timeout=LOAD_LOCK_TIMEOUT,
+				enqueue_after_commit=True,
+				disbursement=doc.name,
+				lock_key=lock_key,
+			)
+		created.append(doc.name)
+
+	return {"created": created, "skipped": skipped}
 
 
 class TWWeeklyDisbursement(Document):
@@ -76,12 +507,13 @@ class TWWeeklyDisbursement(Document):
 	def validate_not_already_paid(self):
 		if self.status == "Paid":
 			return
-		existing = frappe.db.exists("TW Weekly Disbursement", {
+		paid = frappe.get_all("TW Weekly Disbursement", filters={
 			"week_start_date": self.week_start_date,
 			"week_end_date": self.week_end_date,
 			"status": "Paid",
 			"name": ["!=", self.name or ""]
-		})
+		}, fields=["name", "company", "scope_by_company", "unitdivision", "cost_centre"])
+		existing = next((d.name for d in paid if _scopes_overlap(self, d)), None)
 		if existing:
 			frappe.throw(
 				f"A paid disbursement already exists for this week: <b>{existing}</b>. "
@@ -111,25 +543,16 @@ class TWWeeklyDisbursement(Document):
 		if not self.week_start_date or not self.week_end_date:
 			frappe.throw("Please set Year and Week Number first.")
 
-		week_start = getdate(self.week_start_date)
-		week_end = getdate(self.week_end_date)
-
-		# Assignments overlapping the week (not cancelled)
-		assignments = frappe.db.sql("""
-			SELECT name, start_date, completion_date,
-			       expected_start_date, expected_end_date,
-			       task_work_request, task_work_plan, unitdivision, cost_centre
-			FROM `tabTask Work Assignment`
-			WHERE docstatus != 2
-			  AND (
-			      (start_date IS NOT NULL
-			         AND start_date <= %(end)s
-			         AND COALESCE(completion_date, %(end)s) >= %(start)s)
-			   OR (start_date IS NULL
-			         AND expected_start_date <= %(end)s
-			         AND expected_end_date >= %(start)s)
-			  )
-		""", {"start": week_start, "end": week_end}, as_dict=True)
+		lock_key = self._load_lock_key()
+		if not _acquire_lock(lock_key, LOAD_LOCK_TIMEOUT):
+			self._throw_load_in_progress()
+		try:
+			loaded_on = now_datetime()
+			assignments, entries, breakdown = _build_disbursement_rows(
+				getdate(self.week_start_date), getdate(self.week_end_date), scope=self._scope()
+			)
+		finally:
+			_release_lock(lock_key)
 
 		if not assignments:
 			frappe.msgprint(
@@ -138,88 +561,284 @@ class TWWeeklyDisbursement(Document):
 			)
 			return
 
-		worker_totals    = {}   # keyed by worker ID
-		assignment_index = {}   # one row per assignment
-
-		for asgn in assignments:
-			asgn_start = getdate(asgn.start_date or asgn.expected_start_date)
-			asgn_end   = getdate(asgn.completion_date or asgn.expected_end_date)
-
-			overlap_start = max(asgn_start, week_start)
-			overlap_end   = min(asgn_end, week_end)
-			days_in_week  = date_diff(overlap_end, overlap_start) + 1
-			if days_in_week < 1:
-				continue
-
-			workers = frappe.db.get_all(
-				"Worker Assignments",
-				filters={"parent": asgn.name, "parenttype": "Task Work Assignment"},
-				fields=["employee_name", "rate", "actual_quantity", "actual_cost", "location"]
-			)
-
-			asgn_amount = 0
-
-			for w in workers:
-				if not w.employee_name:
-					continue
-
-				wid = w.employee_name
-				actual_qty  = flt(w.actual_quantity)
-				actual_cost = flt(w.actual_cost) if w.actual_cost else actual_qty * flt(w.rate)
-
-				if wid not in worker_totals:
-					details = _get_worker_details(wid)
-					worker_totals[wid] = {
-						"task_worker":    wid,
-						"worker_name":    details["worker_name"],
-						"payment_method": details["payment_method"],
-						"bank_or_mpesa":  details["bank_or_mpesa"],
-						"gross_amount":   0,
-						"deductions":     0,
-						"net_amount":     0,
-						"paid":           0,
-					}
-
-				worker_totals[wid]["gross_amount"]  += actual_cost
-				asgn_amount += actual_cost
-
-			# One summary row per assignment (not per worker)
-			if asgn.name not in assignment_index:
-				assignment_index[asgn.name] = {
-					"daily_form_ref": asgn.name,
-					"task_name":      asgn.task_work_request or asgn.name,
-					"work_date":      str(overlap_start),
-					"work_location":  asgn.unitdivision or "",
-					"cost_centre":    asgn.cost_centre or "",
-					"amount":         0,
-				}
-			assignment_index[asgn.name]["amount"] += asgn_amount
-
-		if not worker_totals:
+		if not entries:
 			frappe.msgprint("No active workers found in the matching assignments.")
 			return
 
-		for data in worker_totals.values():
-			# gross_amount already accumulated from actual_cost; compute net
-			data["net_amount"] = data["gross_amount"] - data["deductions"]
+		apply_deduction_rules(entries, self.company, self.year)
 
 		self.disbursement_entries = []
 		self.task_breakdown = []
 
-		for data in worker_totals.values():
+		for data in entries:
 			self.append("disbursement_entries", data)
 
-		for row in assignment_index.values():
+		for row in breakdown:
 			self.append("task_breakdown", row)
 
+		self.last_loaded_on = loaded_on
 		self.calculate_totals()
 
 		frappe.msgprint(
-			f"Loaded <b>{len(worker_totals)}</b> workers from "
+			f"Loaded <b>{len(entries)}</b> workers from "
 			f"<b>{len(assignments)}</b> assignment(s).",
 			title="Disbursement Loaded", indicator="green"
 		)
 
+	@frappe.whitelist()
+	def enqueue_worker_payments(self):
+		"""
+		Load worker payments in a background job instead of the web request.
+		Progress is published to the open form; the rows are written in bulk.
+		"""
+		if self.docstatus != 0:
+			frappe.throw("Worker payments can only be loaded on a draft disbursement.")
+		if self.is_new():
+			frappe.throw("Save the disbursement before loading worker payments in the background.")
+		if not self.week_start_date or not self.week_end_date:
+			frappe.throw("Please set Year and Week Number first.")
+
+		lock_key = self._load_lock_key()
+		if not _acquire_lock(lock_key, LOAD_LOCK_TIMEOUT):
+			self._throw_load_in_progress()
+
+		frappe.enqueue(
+			"kaitet_taskwork.kaitet_taskwork.doctype.tw_weekly_disbursement.tw_weekly_disbursement.load_worker_payments_job",
+			queue="long",
+			timeout=LOAD_LOCK_TIMEOUT,
+			enqueue_after_commit=True,
+			disbursement=self.name,
+			lock_key=lock_key,
+		)
+		_publish_progress(self.name, 0, "Queued…", status="Queued")
+		return {"queued": True}
+
+	def _load_worker_payments_in_bulk(self):
+		"""
+		Rebuild both child tables of this draft with batched INSERTs.
+		Returns a summary message for the form.
+		"""
+		if self.docstatus != 0:
+			frappe.throw("Worker payments can only be loaded on a draft disbursement.")
+
+		def progress(percent, message):
+			_publish_progress(self.name, percent, message)
+
+		loaded_on = now_datetime()
+		assignments, entries, breakdown = _build_disbursement_rows(
+			getdate(self.week_start_date), getdate(self.week_end_date), progress, scope=self._scope()
+		)
+		if not assignments:
+			return "No Task Work Assignments found overlapping with the selected week."
+		if not entries:
+			return "No active workers found in the matching assignments."
+
+		apply_deduction_rules(entries, self.company, self.year)
+
+		progress(70, f"Writing {len(entries)} worker payments…")
+		replace_child_rows(self.doctype, self.name, "disbursement_entries", "TW Disbursement Entry", entries)
+		replace_child_rows(self.doctype, self.name, "task_breakdown", "TW Task Breakdown", breakdown)
+
+		progress(95, "Updating totals…")
+		self._update_totals_from_rows(last_loaded_on=loaded_on)
+		return f"Loaded {len(entries)} workers from {len(assignments)} assignment(s)."
+
+	@frappe.whitelist()
+	def refresh_worker_payments(self):
+		"""
+		Patch a loaded draft with only what changed since it was last loaded,
+		instead of rebuilding every row.
+		"""
+		if self.docstatus != 0:
+			frappe.throw("Only draft disbursements can be refreshed.")
+		if self.is_new() or not self.get("last_loaded_on"):
+			frappe.throw("Load worker payments before refreshing them.")
+
+		lock_key = self._load_lock_key()
+		if not _acquire_lock(lock_key, LOAD_LOCK_TIMEOUT):
+			self._throw_load_in_progress()
+		try:
+			message = self._refresh_changed_payments()
+		finally:
+			_release_lock(lock_key)
+
+		frappe.msgprint(message, title="Disbursement Refreshed", indicator="green")
+
+	def _refresh_changed_payments(self):
+		"""
+		Re-aggregate the assignments modified after ``last_loaded_on`` (by their
+		own or their Worker Assignments rows' ``modified`` timestamp). Every
+		worker they touch, now or at the last load, gets their weekly total
+		recomputed across all of the week's assignments; all other rows are
+		left untouched.
+		"""
+		refreshed_on = now_datetime()
+
+		week_index = {
+			asgn.name: asgn
+			for asgn in _get_week_assignments(
+				getdate(self.week_start_date), getdate(self.week_end_date), self._scope()
+			)
+		}
+		breakdown_by_asgn = {row.daily_form_ref: row for row in self.task_breakdown}
+
+		changed = set(frappe.db.sql_list("""
+			SELECT name FROM `tabTask Work Assignment`
+			WHERE modified > %(since)s
+			UNION
+			SELECT DISTINCT parent FROM `tabWorker Assignments`
+			WHERE parenttype = 'Task Work Assignment' AND modified > %(since)s
+		""", {"since": self.last_loaded_on}))
+		changed &= set(week_index) | set(breakdown_by_asgn)
+
+		if not changed:
+			frappe.db.set_value(self.doctype, self.name, "last_loaded_on", refreshed_on)
+			return "No assignment changes since the last load."
+
+		# ── Breakdown rows of the changed assignments ──────────────────────
+		changed_pay = _week_pay_rows([name for name in changed if name in week_index])
+		amounts = {}
+		for row in changed_pay:
+			amounts[row.task_work_assignment] = amounts.get(row.task_work_assignment, 0) + flt(row.amount)
+
+		breakdown_updates, breakdown_inserts, breakdown_deletes = {}, [], []
+		for name in sorted(changed):
+			existing = breakdown_by_asgn.get(name)
+			if name not in week_index:
+				if existing:
+					breakdown_deletes.append(existing.name)
+				continue
+			row = _breakdown_row(week_index[name])
+			row["amount"] = amounts.get(name, 0)
+			if existing:
+				breakdown_updates[existing.name] = row
+			else:
+				breakdown_inserts.append(row)
+
+		# ── Worker entries touched by the changed assignments ──────────────
+		affected = {row.worker for row in changed_pay}
+		for entry in self.disbursement_entries:
+			if changed.intersection((entry.source_assignments or "").split("\n")):
+				affected.add(entry.task_worker)
+
+		worker_pay = _fold_worker_pay(_week_pay_rows(list(week_index), workers=list(affected)))
+		entries_by_worker = {entry.task_worker: entry for entry in self.disbursement_entries}
+
+		entry_updates, entry_deletes = {}, []
+		for wid in affected:
+			entry = entries_by_worker.get(wid)
+			if not entry:
+				continue
+			pay = worker_pay.get(wid)
+			if not pay:
+				entry_deletes.append(entry.name)
+				continue
+			entry_updates[entry.name] = {
+				"gross_amount":       pay["gross"],
+				"payment_method":     entry.payment_method,
+				"source_assignments": "\n".join(pay["assignments"]),
+			}
+
+		new_workers = [wid for wid in worker_pay if wid not in entries_by_worker]
+		details = _get_worker_details_bulk(new_workers)
+		entry_inserts = [_entry_row(wid, worker_pay[wid], details[wid]) for wid in new_workers]
+		apply_deduction_rules(list(entry_updates.values()) + entry_inserts, self.company, self.year)
+		for row in entry_updates.values():
+			del row["payment_method"]
+
+		# ── Write only the affected rows ───────────────────────────────────
+		update_rows("TW Disbursement Entry", entry_updates)
+		delete_rows("TW Disbursement Entry", entry_deletes)
+		insert_child_rows(
+			self.doctype, self.name, "disbursement_entries", "TW Disbursement Entry", entry_inserts,
+			start_idx=len(self.disbursement_entries) + 1,
+		)
+		update_rows("TW Task Breakdown", breakdown_updates)
+		delete_rows("TW Task Breakdown", breakdown_deletes)
+		insert_child_rows(
+			self.doctype, self.name, "task_breakdown", "TW Task Breakdown", breakdown_inserts,
+			start_idx=len(self.task_breakdown) + 1,
+		)
+
+		self._update_totals_from_rows(last_loaded_on=refreshed_on)
+
+		return (
+			f"Refreshed <b>{len(changed)}</b> changed assignment(s): "
+			f"{len(entry_updates)} worker(s) updated, {len(entry_inserts)} added, "
+			f"{len(entry_deletes)} removed."
+		)
+
+	@frappe.whitelist()
+	def apply_deductions(self):
+		"""Recalculate every entry's deductions from the TW Deduction Rules in force."""
+		if self.docstatus != 0:
+			frappe.throw("Deductions can only be recalculated on a draft disbursement.")
+		if self.is_new():
+			frappe.throw("Save the disbursement before applying deductions.")
+
+		rows = frappe.db.sql("""
+			SELECT name, gross_amount, payment_method, deductions, net_amount
+			FROM `tabTW Disbursement Entry`
+			WHERE parent = %s AND parenttype = %s AND parentfield = 'disbursement_entries'
+		""", (self.name, self.doctype), as_dict=True)
+		before = {row.name: (flt(row.deductions), flt(row.net_amount)) for row in rows}
+		apply_deduction_rules(rows, self.company, self.year)
+
+		updates = {
+			row.name: {"deductions": row.deductions, "net_amount": row.net_amount}
+			for row in rows
+			if before[row.name] != (flt(row.deductions), flt(row.net_amount))
+		}
+		update_rows("TW Disbursement Entry", updates)
+		self._update_totals_from_rows()
+
+		frappe.msgprint(
+			f"Deductions recalculated for <b>{len(rows)}</b> workers; {len(updates)} changed. "
+			f"Total deductions: <b>{frappe.format(self.total_deductions, {'fieldtype': 'Currency'})}</b>.",
+			title="Deductions Applied", indicator="green"
+		)
+
+	def _update_totals_from_rows(self, **values):
+		"""Recompute header totals from the stored entry rows and write them with *values*."""
+		totals = frappe.db.sql("""
+			SELECT COUNT(*) AS workers,
+			       IFNULL(SUM(gross_amount), 0) AS gross,
+			       IFNULL(SUM(deductions), 0) AS deductions
+			FROM `tabTW Disbursement Entry`
+			WHERE parent = %s AND parenttype = %s AND parentfield = 'disbursement_entries'
+		""", (self.name, self.doctype), as_dict=True)[0]
+
+		values.update({
+			"total_workers":    totals.workers,
+			"total_gross":      flt(totals.gross),
+			"total_deductions": flt(totals.deductions),
+			"total_net":        flt(totals.gross) - flt(totals.deductions),
+		})
+		frappe.db.set_value(self.doctype, self.name, values)
+		self.update(values)
+
+	def _scope(self):
+		"""The company / unit / cost centre this disbursement is limited to, or None for all."""
+		if not self.get("scope_by_company"):
+			return None
+		return {
+			"company":      self.company,
+			"unitdivision": self.get("unitdivision") or "",
+			"cost_centre":  self.get("cost_centre") or "",
+		}
+
+	def _load_lock_key(self):
+		scope = self._scope()
+		suffix = f":{scope['company']}:{scope['unitdivision']}:{scope['cost_centre']}" if scope else ""
+		return f"tw_disbursement_load:{self.week_start_date}:{self.week_end_date}{suffix}"
+
+	def _throw_load_in_progress(self):
+		frappe.throw(
+			"Worker payments for this week are already being loaded. "
+			"Please wait for that load to finish and try again.",
+			title="Load In Progress",
+		)
+
 	def on_submit(self):
 		self.db_set("status", "Pending")
 
@@ -238,18 +857,31 @@ class TWWeeklyDisbursement(Document):
 		if self.docstatus != 1:
 			frappe.throw("Please submit the disbursement before marking as paid.")
 
-		je = self._create_wages_journal_entry()
-		je_name = je.name
+		lock_key = f"tw_disbursement_settle:{self.name}"
+		if not _acquire_lock(lock_key, LOAD_LOCK_TIMEOUT):
+			frappe.throw("This disbursement is already being marked as paid.")
 
-		# Update parent fields directly — self.save() is blocked on submitted docs
-		self.db_set("status",        "Paid",                 update_modified=False)
-		self.db_set("paid_on",       nowdate(),               update_modified=False)
-		self.db_set("paid_by",       frappe.session.user,     update_modified=False)
-		self.db_set("journal_entry", je_name,                 update_modified=False)
+		if len(self.disbursement_entries) > SETTLEMENT_ENQUEUE_THRESHOLD:
+			frappe.enqueue(
+				"kaitet_taskwork.kaitet_taskwork.doctype.tw_weekly_disbursement.tw_weekly_disbursement.settle_disbursement_job",
+				queue="long",
+				timeout=LOAD_LOCK_TIMEOUT,
+				enqueue_after_commit=True,
+				disbursement=self.name,
+				lock_key=lock_key,
+				paid_by=frappe.session.user,
+			)
+			frappe.msgprint(
+				f"{len(self.disbursement_entries)} entries are being marked as paid in the background. "
+				"The form will refresh when the Journal Entry has been posted.",
+				title="Payment Queued", indicator="blue"
+			)
+			return
 
-		# Mark each disbursement row as paid
-		for entry in self.disbursement_entries:
-			frappe.db.set_value("TW Disbursement Entry", entry.name, "paid", 1)
+		try:
+			je_name = self._settle(frappe.session.user)
+		finally:
+			_release_lock(lock_key)
 
 		frappe.msgprint(
 			f"Disbursement marked as <b>Paid</b>. "
@@ -257,37 +889,90 @@ class TWWeeklyDisbursement(Document):
 			title="Payment Recorded", indicator="green"
 		)
 
+	@frappe.whitelist()
+	def send_payouts(self, retry_failed=1):
+		"""Queue the bank / M-Pesa payouts of a paid disbursement."""
+		if self.status != "Paid":
+			frappe.throw("Payouts can only be sent once the disbursement is marked as Paid.")
+
+		lock_key = f"tw_disbursement_payout:{self.name}"
+		if not _acquire_lock(lock_key, LOAD_LOCK_TIMEOUT):
+			frappe.throw("Payouts for this disbursement are already being sent.")
+
+		frappe.enqueue(
+			"kaitet_taskwork.kaitet_taskwork.payouts.dispatch_payouts_job",
+			queue="long",
+			timeout=LOAD_LOCK_TIMEOUT,
+			disbursement=self.name,
+			lock_key=lock_key,
+			retry_failed=bool(cint(retry_failed)),
+		)
+		_publish_progress(self.name, 0, "Payouts queued…", status="Queued")
+		return {"queued": True}
+
+	def _settle(self, paid_by):
+		"""
+		Post the wages Journal Entry and flag the disbursement and every entry
+		as paid, as one unit: if any step fails, nothing is kept.
+		Returns the Journal Entry name.
+		"""
+		frappe.db.savepoint("tw_settlement")
+		try:
+			je = self._create_wages_journal_entry()
+
+			# Flag every disbursement row in one statement
+			frappe.db.sql("""
+				UPDATE `tabTW Disbursement Entry`
+				SET paid = 1
+				WHERE parent = %s AND parenttype = %s AND parentfield = 'disbursement_entries'
+			""", (self.name, self.doctype))
+
+			# Update parent fields directly — self.save() is blocked on submitted docs
+			frappe.db.set_value(self.doctype, self.name, {
+				"status":        "Paid",
+				"paid_on":       nowdate(),
+				"paid_by":       paid_by,
+				"journal_entry": je.name,
+			}, update_modified=False)
+		except Exception:
+			frappe.db.rollback(save_point="tw_settlement")
+			raise
+
+		return je.name
+
 	def _create_wages_journal_entry(self):
 		"""
-		DR: wages_account  — expense account (e.g. Daily Rate Wages)
-		CR: payment_account — bank/cash account the wages are paid from
+		DR: wages_account      — expense account (e.g. Daily Rate Wages), the gross pay
+		CR: payment_account    — bank/cash account the net wages are paid from
+		CR: deductions_account — liability account holding the deductions until remitted
 		"""
 		wages_account   = getattr(self, "wages_account", None)
 		payment_account = getattr(self, "payment_account", None)
+		deductions_account = self.get("deductions_account")
 
-		# Fall back to known defaults for Karen Roses
-		company_for_lookup = self.company or "Karen Roses"
-		if not wages_account:
-			wages_account = frappe.db.get_value(
-				"Account",
-				{"company": company_for_lookup, "account_name": "Daily Rate Wages", "is_group": 0},
-				"name",
-			)
-		if not payment_account:
-			payment_account = frappe.db.get_value(
-				"Account",
-				{"company": company_for_lookup, "account_number": "1310262053257", "is_group": 0},
-				"name",
-			)
+		# Fall back to the defaults of this disbursement's own company
+		if not (wages_account and payment_account):
+			defaults = get_default_accounts(self.company)
+			wages_account = wages_account or defaults["wages_account"]
+			payment_account = payment_account or defaults["payment_account"]
+
+		total_net = flt(self.total_net, 2)
+		total_deductions = flt(self.total_deductions, 2)
 
 		if not wages_account:
 			frappe.throw("Please set the <b>Wages Expense Account</b> before marking as paid.")
 		if not payment_account:
 			frappe.throw("Please set the <b>Payment Bank Account</b> before marking as paid.")
+		if total_deductions and not deductions_account:
+			frappe.throw("Please set the <b>Deductions Payable Account</b> before marking as paid.")
 
 		# Validate accounts are ledger accounts (not group)
-		for acc, label in [(wages_account, "Wages Expense Account"), (payment_account, "Payment Bank Account")]:
-			if frappe.db.get_value("Account", acc, "is_group"):
+		for acc, label in [
+			(wages_account, "Wages Expense Account"),
+			(payment_account, "Payment Bank Account"),
+			(deductions_account, "Deductions Payable Account"),
+		]:
+			if acc and frappe.db.get_value("Account", acc, "is_group"):
 				frappe.throw(f"<b>{label}</b> ({acc}) is a group account. Please select a ledger account.")
 
 		# Derive company from wages_account
@@ -309,28 +994,37 @@ class TWWeeklyDisbursement(Document):
 			f"(Week {self.week_number}/{self.year})"
 		)
 
-		accounts = []
-
-		if cc_amounts:
-			for cc, amount in cc_amounts.items():
-				if flt(amount) <= 0:
-					continue
-				accounts.append({
-					"account":                   wages_account,
-					"debit_in_account_currency": flt(amount),
-					"cost_center":               cc or None,
-				})
+		# Debits carry the gross pay, split by cost centre
+		gross = flt(total_net + total_deductions, 2)
+		debits = [
+			{"account": wages_account, "debit_in_account_currency": flt(amount, 2), "cost_center": cc or None}
+			for cc, amount in cc_amounts.items()
+			if flt(amount, 2) > 0
+		]
+		if debits:
+			difference = flt(gross - sum(d["debit_in_account_currency"] for d in debits), 2)
+			if abs(difference) > 0.01 * len(debits):
+				frappe.throw(
+					f"The task breakdown ({frappe.format(gross - difference, {'fieldtype': 'Currency'})}) "
+					f"does not match the workers' gross pay ({frappe.format(gross, {'fieldtype': 'Currency'})}). "
+					"Cancel and amend the disbursement to reload the worker payments."
+				)
+			# Breakdown amounts are rounded per cost centre; settle the rounding
+			# on the largest line so the entry balances
+			largest = max(debits, key=lambda d: d["debit_in_account_currency"])
+			largest["debit_in_account_currency"] = flt(largest["debit_in_account_currency"] + difference, 2)
 		else:
-			accounts.append({
-				"account":                   wages_account,
-				"debit_in_account_currency": flt(self.total_net),
-			})
+			debits = [{"account": wages_account, "debit_in_account_currency": gross}]
 
-		# Single credit to wages accruals
-		accounts.append({
+		accounts = debits + [{
 			"account":                    payment_account,
-			"credit_in_account_currency": flt(self.total_net),
-		})
+			"credit_in_account_currency": total_net,
+		}]
+		if total_deductions:
+			accounts.append({
+				"account":                    deductions_account,
+				"credit_in_account_currency": total_deductions,
+			})
 
 		je.set("accounts", accounts)
 		je.insert(ignore_permissions=True)
@@ -0,0 +1,30 @@
+frappe.listview_settings['TW Weekly Disbursement'] = {
+	onload: function(listview) {
+		listview.page.add_inner_button(__('Generate for Week'), function() {
+			frappe.prompt([
+				{ fieldname: 'year', fieldtype: 'Int', label: __('Year'), reqd: 1,
+				  default: new Date().getFullYear() },
+				{ fieldname: 'week_number', fieldtype: 'Int', label: __('Week No.'), reqd: 1 },
+				{ fieldname: 'partition_by', fieldtype: 'Select', label: __('One Disbursement per'),
+				  options: 'Company\nUnit/Division\nCost Centre', default: 'Company' }
+			], function(values) {
+				frappe.call({
+					method: 'kaitet_taskwork.kaitet_taskwork.doctype.tw_weekly_disbursement.tw_weekly_disbursement.generate_weekly_disbursements',
+					args: values,
+					freeze: true,
+					freeze_message: __('Creating disbursements…'),
+					callback: function(r) {
+						if (!r.message) return;
+						let msg = __('{0} disbursement(s) created; payments are loading in the background.',
+							[r.message.created.length]);
+						if (r.message.skipped.length) {
+							msg += '<br><br>' + __('Skipped:') + '<br>' + r.message.skipped.join('<br>');
+						}
+						frappe.msgprint(msg, __('Weekly Disbursements'));
+						listview.refresh();
+					}
+				});
+			}, __('Generate Weekly Disbursements'), __('Generate'));
+		});
+	}
+};
@@ -0,0 +1,93 @@
+# Copyright (c) 2026, Upande and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import add_days, getdate
+
+from kaitet_taskwork.kaitet_taskwork.doctype.tw_worker_occupancy.tw_worker_occupancy import (
+	check_double_booking,
+	find_bookings,
+)
+
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+START = getdate("2026-03-02")
+
+
+def _assignment(rows):
+	"""A draft Task Work Assignment with *rows* of ``(worker, day offset)``."""
+	doc = frappe.get_doc({
+		"doctype": "Task Work Assignment",
+		"title": "Occupancy test",
+		"start_date": START,
+		"expected_end_date": add_days(START, 6),
+		"worker_assignments": [
+			{"employee_name": worker, "assignment_date": add_days(START, day), "quantity_assigned": 10}
+			for worker, day in rows
+		],
+	})
+	# Rows point at workers that do not exist in the test site
+	doc.flags.ignore_links = True
+	doc.insert(ignore_permissions=True)
+	return doc
+
+
+def _occupancy(assignment):
+	return sorted(
+		(row.worker, getdate(row.work_date))
+		for row in frappe.get_all(
+			"TW Worker Occupancy",
+			filters={"task_work_assignment": assignment},
+			fields=["worker", "work_date"],
+		)
+	)
+
+
+class IntegrationTestTWWorkerOccupancy(IntegrationTestCase):
+	"""
+	Integration tests for the worker occupancy index.
+	"""
+
+	def test_submit_and_cancel_maintain_occupancy(self):
+		doc = _assignment([("TW-OCC-A", 0), ("TW-OCC-A", 1), ("TW-OCC-B", 0)])
+		self.assertEqual(_occupancy(doc.name), [])
+
+		doc.submit()
+		self.assertEqual(_occupancy(doc.name), [
+			("TW-OCC-A", START),
+			("TW-OCC-A", add_days(START, 1)),
+			("TW-OCC-B", START),
+		])
+
+		doc.cancel()
+		self.assertEqual(_occupancy(doc.name), [])
+
+	def test_check_double_booking_rejects_an_overlapping_submitted_assignment(self):
+		booked = _assignment([("TW-OCC-C", 2), ("TW-OCC-D", 3)])
+		booked.submit()
+		draft = _assignment([("TW-OCC-C", 2), ("TW-OCC-D", 4)])
+
+		result = check_double_booking(
+			[["TW-OCC-C", str(add_days(START, 2))], {"worker": "TW-OCC-D", "date": str(add_days(START, 4))}],
+			exclude_assignment=draft.name,
+		)
+		self.assertTrue(result["has_conflict"])
+		self.assertEqual(
+			[(c["worker"], c["date"], c["assignment"]) for c in result["conflicts"]],
+			[("TW-OCC-C", str(add_days(START, 2)), booked.name)],
+		)
+
+		# An assignment does not conflict with itself
+		self.assertEqual(find_bookings([("TW-OCC-C", add_days(START, 2))], exclude_assignment=booked.name), [])
+
+	def test_drafts_do_not_book_workers(self):
+		_assignment([("TW-OCC-E", 5)])
+
+		result = check_double_booking([["TW-OCC-E", str(add_days(START, 5))]])
+		self.assertFalse(result["has_conflict"])
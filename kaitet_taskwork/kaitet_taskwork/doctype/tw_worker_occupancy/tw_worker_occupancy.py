@@ -0,0 +1,113 @@
+# Copyright (c) 2025, Upande and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import flt, getdate, now
+
+# Worker IDs per lookup statement
+LOOKUP_BATCH = 1000
+
+
+class TWWorkerOccupancy(Document):
+	"""
+	One row per (worker, day, submitted Task Work Assignment): the index used
+	to find double bookings across assignments. Rewritten by
+	sync_assignment_occupancy — never edit it by hand.
+	"""
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("TW Worker Occupancy", ["worker", "work_date"])
+
+
+def _insert_occupancy_rows(condition, values):
+	"""Fold submitted Worker Assignments rows into occupancy rows in one statement."""
+	values = dict(values, now=now(), user=frappe.session.user)
+	frappe.db.sql(f"""
+		INSERT INTO `tabTW Worker Occupancy`
+			(name, owner, creation, modified, modified_by, docstatus,
+			 worker, work_date, task_work_assignment, unitdivision, tasks, quantity)
+		SELECT CONCAT(twa.name, ':', wa.employee_name, ':', wa.assignment_date),
+		       %(user)s, %(now)s, %(now)s, %(user)s, 0,
+		       wa.employee_name, wa.assignment_date, twa.name, twa.unitdivision,
+		       GROUP_CONCAT(DISTINCT wa.task ORDER BY wa.task SEPARATOR ', '),
+		       SUM(IFNULL(wa.quantity_assigned, 0))
+		FROM `tabWorker Assignments` wa
+		INNER JOIN `tabTask Work Assignment` twa ON twa.name = wa.parent
+		WHERE wa.parenttype = 'Task Work Assignment'
+		  AND twa.docstatus = 1
+		  AND IFNULL(wa.employee_name, '') != ''
+		  AND wa.assignment_date IS NOT NULL
+		  AND {condition}
+		GROUP BY twa.name, wa.employee_name, wa.assignment_date
+	""", values)
+
+
+def sync_assignment_occupancy(assignment_name):
+	"""
+	Rewrite the occupancy rows of one Task Work Assignment. Only submitted
+	assignments occupy workers; drafts and cancelled ones end up with none.
+	"""
+	frappe.db.delete("TW Worker Occupancy", {"task_work_assignment": assignment_name})
+	_insert_occupancy_rows("twa.name = %(assignment)s", {"assignment": assignment_name})
+
+
+def rebuild_worker_occupancy():
+	"""Rebuild the whole index from Worker Assignments (used by the backfill patch)."""
+	frappe.db.delete("TW Worker Occupancy")
+	_insert_occupancy_rows("1 = 1", {})
+
+
+def find_bookings(pairs, exclude_assignment=None):
+	"""
+	Return occupancy rows matching any of the (worker, date) *pairs*, other
+	than those of *exclude_assignment*. Uses the (worker, work_date) index:
+	one range lookup per batch of workers.
+	"""
+	wanted = {(worker, getdate(day)) for worker, day in pairs if worker and day}
+	if not wanted:
+		return []
+
+	workers = sorted({worker for worker, _ in wanted})
+	dates = [day for _, day in wanted]
+	found = []
+	for i in range(0, len(workers), LOOKUP_BATCH):
+		rows = frappe.db.sql("""
+			SELECT worker, work_date, task_work_assignment, unitdivision, tasks, quantity
+			FROM `tabTW Worker Occupancy`
+			WHERE worker IN %(workers)s
+			  AND work_date BETWEEN %(from_date)s AND %(to_date)s
+			  AND task_work_assignment != %(exclude)s
+			ORDER BY worker, work_date
+		""", {
+			"workers": tuple(workers[i:i + LOOKUP_BATCH]),
+			"from_date": min(dates),
+			"to_date": max(dates),
+			"exclude": exclude_assignment or "",
+		}, as_dict=True)
+		found.extend(row for row in rows if (row.worker, getdate(row.work_date)) in wanted)
+	return found
+
+
+@frappe.whitelist()
+def check_double_booking(pairs, exclude_assignment=None):
+	"""
+	Check proposed (worker, date) *pairs* — a list of ``[worker, date]`` or
+	``{"worker", "date"}`` — against every submitted assignment.
+	"""
+	frappe.has_permission("Task Work Assignment", "read", throw=True)
+	pairs = frappe.parse_json(pairs) if isinstance(pairs, str) else pairs
+	pairs = [(p["worker"], p["date"]) if isinstance(p, dict) else tuple(p) for p in pairs or []]
+
+	conflicts = [{
+		"worker":     row.worker,
+		"date":       str(row.work_date),
+		"assignment": row.task_work_assignment,
+		"unit":       row.unitdivision,
+		"tasks":      row.tasks,
+		"quantity":   flt(row.quantity),
+	} for row in find_bookings(pairs, exclude_assignment)]
+
+	return {"has_conflict": bool(conflicts), "conflicts": conflicts}
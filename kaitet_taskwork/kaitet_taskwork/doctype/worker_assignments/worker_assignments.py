@@ -3,3 +3,12 @@ from frappe.model.document import Document
 
 class WorkerAssignments(Document):
 	pass
+
+
+def on_doctype_update():
+	# Worker availability and booking lookups filter on worker and date
+	frappe.db.add_index("Worker Assignments", ["employee_name", "assignment_date"])
+	# Dashboard schedules page through one assignment by date
+	frappe.db.add_index("Worker Assignments", ["parent", "assignment_date"])
+	# Worker performance groups and pages one assignment by worker
+	frappe.db.add_index("Worker Assignments", ["parent", "employee_name"])
@@ -0,0 +1,243 @@
+# Copyright (c) 2025, Upande and contributors
+# For license information, please see license.txt
+
+"""
+Bulk capture of daily field output (actual quantities) for Task Work Assignments.
+
+Records are matched to Worker Assignments rows with one query, checked
+against each task's total work per assignment in one pass, and written with
+batched UPDATEs. The ledger rows of the written rows and the rollups of
+the touched assignments are then resynced, instead of saving every
+assignment form.
+
+Actuals are captured on draft assignments; submission requires them.
+"""
+
+import frappe
+from frappe.utils import flt, getdate, now
+
+from kaitet_taskwork.kaitet_taskwork.bulk import update_rows
+from kaitet_taskwork.kaitet_taskwork.doctype.task_details.task_details import refresh_progress_rollups
+from kaitet_taskwork.kaitet_taskwork.doctype.tw_earnings_ledger.tw_earnings_ledger import sync_row_earnings
+
+# Accepted spellings of each import column, lower-cased
+COLUMN_ALIASES = {
+	"assignment":      ("assignment", "task work assignment", "task_work_assignment"),
+	"worker":          ("worker", "task worker", "employee_name", "task_worker"),
+	"date":            ("date", "assignment date", "assignment_date", "work date"),
+	"task":            ("task",),
+	"actual_quantity": ("actual_quantity", "actual quantity", "quantity", "actual"),
+}
+
+
+def _normalise_records(records):
+	"""Return ``[(line, record)]`` with parsed dates and quantities, and a list of errors."""
+	parsed, errors = [], []
+	for line, record in enumerate(records, start=1):
+		try:
+			record = frappe._dict(record)
+			parsed.append((line, frappe._dict(
+				assignment=str(record.assignment or "").strip(),
+				worker=str(record.worker or "").strip(),
+				date=getdate(record.date) if record.date else None,
+				task=str(record.task or "").strip(),
+				actual_quantity=flt(record.actual_quantity),
+			)))
+		except Exception:
+			errors.append({"line": line, "message": f"Invalid record: {record}"})
+			continue
+		rec = parsed[-1][1]
+		if not (rec.assignment and rec.worker and rec.date):
+			parsed.pop()
+			errors.append({"line": line, "message": "Assignment, worker and date are required."})
+		elif rec.actual_quantity < 0:
+			parsed.pop()
+			errors.append({"line": line, "message": "Actual quantity cannot be negative."})
+	return parsed, errors
+
+
+def _load_rows(assignments):
+	"""Worker rows and task totals of the given draft assignments, two queries."""
+	rows = frappe.db.sql("""
+		SELECT wa.name, wa.parent, wa.employee_name, wa.assignment_date, wa.task,
+		       wa.quantity_assigned, wa.rate, wa.actual_quantity
+		FROM `tabWorker Assignments` wa
+		WHERE wa.parent IN %(assignments)s
+		  AND wa.parenttype = 'Task Work Assignment'
+		  AND wa.parentfield = 'worker_assignments'
+	""", {"assignments": tuple(assignments)}, as_dict=True)
+
+	totals = {}
+	for row in frappe.db.sql("""
+		SELECT parent, task, SUM(total_work) AS total_work
+		FROM `tabTask Details`
+		WHERE parent IN %(assignments)s AND parenttype = 'Task Work Assignment'
+		GROUP BY parent, task
+	""", {"assignments": tuple(assignments)}, as_dict=True):
+		totals[(row.parent, row.task)] = flt(row.total_work)
+	return rows, totals
+
+
+def save_actuals(records):
+	"""
+	Apply ``{assignment, worker, date, task, actual_quantity}`` *records*.
+
+	Records are grouped by assignment; an assignment with any invalid record
+	(unknown row, ambiguous task, task total exceeded, not a draft) is left
+	unchanged and its errors reported. Returns
+	``{"updated": rows, "assignments": [updated], "failed": [left unchanged],
+	"errors": [{line, message}]}``.
+	"""
+	parsed, errors = _normalise_records(records)
+	if not parsed:
+		return {"updated": 0, "assignments": [], "failed": [], "errors": errors}
+
+	by_assignment = {}
+	for line, rec in parsed:
+		by_assignment.setdefault(rec.assignment, []).append((line, rec))
+
+	states = dict(frappe.get_all(
+		"Task Work Assignment",
+		filters={"name": ["in", list(by_assignment)]},
+		fields=["name", "docstatus"],
+		as_list=True,
+	))
+	failed = set()
+	for name, items in by_assignment.items():
+		if name not in states:
+			message = f"Task Work Assignment {name} not found."
+		elif states[name] != 0:
+			message = f"Task Work Assignment {name} is not a draft; actuals can only be captured before submission."
+		elif not frappe.has_permission("Task Work Assignment", "write", name):
+			message = f"Not permitted to update {name}."
+		else:
+			continue
+		failed.add(name)
+		errors.extend({"line": line, "message": message} for line, _ in items)
+
+	drafts = [name for name in by_assignment if name not in failed]
+	rows, totals = _load_rows(drafts) if drafts else ([], {})
+
+	index = {}
+	for row in rows:
+		key = (row.parent, row.employee_name, getdate(row.assignment_date) if row.assignment_date else None)
+		index.setdefault(key, []).append(row)
+
+	# Resolve every record to one row; later records for the same row win
+	actual = {row.name: flt(row.actual_quantity) for row in rows}
+	updates = {}
+	for name in drafts:
+		for line, rec in by_assignment[name]:
+			candidates = index.get((name, rec.worker, rec.date), [])
+			if rec.task:
+				candidates = [row for row in candidates if row.task == rec.task]
+			if len(candidates) != 1:
+				failed.add(name)
+				errors.append({"line": line, "message": (
+					f"No worker row for {rec.worker} on {rec.date} in {name}."
+					if not candidates else
+					f"{rec.worker} has several tasks on {rec.date} in {name}; give the task."
+				)})
+				continue
+			row = candidates[0]
+			actual[row.name] = rec.actual_quantity
+			updates[row.name] = row
+
+	# Task totals, one pass over the rows of the affected assignments
+	sums = {}
+	for row in rows:
+		if row.parent not in failed and row.task:
+			key = (row.parent, row.task)
+			sums[key] = sums.get(key, 0) + actual[row.name]
+	for (name, task), total in sums.items():
+		limit = totals.get((name, task), 0)
+		if limit > 0 and total > limit + 1e-9:
+			failed.add(name)
+			errors.append({"line": None, "message": (
+				f"{name}: total actual quantity for task {task} ({total:.2f}) "
+				f"would exceed its total work ({limit:.2f})."
+			)})
+
+	values = {}
+	for row_name, row in updates.items():
+		if row.parent in failed:
+			continue
+		qty = actual[row_name]
+		assigned = flt(row.quantity_assigned)
+		values[row_name] = {
+			"actual_quantity": qty,
+			"actual_cost":     round(qty * flt(row.rate), 2),
+			"achievement":     round(qty / assigned * 100, 1) if assigned > 0 else 0,
+		}
+
+	update_rows("Worker Assignments", values)
+
+	touched = sorted({updates[row_name].parent for row_name in values})
+	if touched:
+		frappe.db.sql("""
+			UPDATE `tabTask Work Assignment`
+			SET modified = %(now)s, modified_by = %(user)s
+			WHERE name IN %(names)s
+		""", {"now": now(), "user": frappe.session.user, "names": tuple(touched)})
+		sync_row_earnings(list(values))
+		refresh_progress_rollups(touched, {updates[row_name].task for row_name in values} - {None, ""})
+
+	return {"updated": len(values), "assignments": touched, "failed": sorted(failed), "errors": errors}
+
+
+@frappe.whitelist(methods=["POST"])
+def capture_actuals(records):
+	"""Whitelisted entry point for save_actuals; *records* may be a JSON string."""
+	records = frappe.parse_json(records) if isinstance(records, str) else records
+	if not isinstance(records, list):
+		frappe.throw("Records must be a list.")
+	return save_actuals(records)
+
+
+def _read_sheet(file_url):
+	"""Rows (lists of cells) of an uploaded CSV or XLSX file."""
+	file_doc = frappe.get_doc("File", {"file_url": file_url})
+	file_doc.check_permission("read")
+	content = file_doc.get_content()
+	extension = (file_doc.file_name or file_url).rsplit(".", 1)[-1].lower()
+
+	if extension == "xlsx":
+		from frappe.utils.xlsxutils import read_xlsx_file_from_attached_file
+		return read_xlsx_file_from_attached_file(fcontent=content)
+	if extension == "csv":
+		from frappe.utils.csvutils import read_csv_content
+		return read_csv_content(content)
+	frappe.throw("Upload a .csv or .xlsx file.")
+
+
+@frappe.whitelist(methods=["POST"])
+def import_actuals(file_url):
+	"""
+	Capture actuals from an uploaded CSV/XLSX file whose header row names
+	the assignment, worker, date, task and actual quantity columns.
+	"""
+	sheet = _read_sheet(file_url)
+	if not sheet:
+		frappe.throw("The file is empty.")
+
+	header = [str(cell or "").strip().lower() for cell in sheet[0]]
+	positions = {}
+	for key, aliases in COLUMN_ALIASES.items():
+		position = next((i for i, name in enumerate(header) if name in aliases), None)
+		if position is not None:
+			positions[key] = position
+	missing = [key for key in ("assignment", "worker", "date", "actual_quantity") if key not in positions]
+	if missing:
+		frappe.throw(f"Missing column(s): {', '.join(missing)}.")
+
+	records = [
+		{key: (row[i] if i < len(row) else None) for key, i in positions.items()}
+		for row in sheet[1:]
+		if any(cell not in (None, "") for cell in row)
+	]
+	result = save_actuals(records)
+	# Report file line numbers, counting the header
+	for error in result["errors"]:
+		if error["line"]:
+			error["line"] += 1
+	return result
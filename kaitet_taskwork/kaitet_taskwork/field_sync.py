@@ -0,0 +1,202 @@
+# Copyright (c) 2025, Upande and contributors
+# For license information, please see license.txt
+
+"""
+Delta sync for the offline field data-capture app.
+
+get_changes returns only the Task Work Assignments and Worker Assignments
+rows modified after a client watermark, as column lists plus value arrays,
+optionally gzipped. Only assignments the user may read are returned, and
+rows modified in the last SYNC_LAG_SECONDS are held back to the next pull.
+
+push_changes applies batched actual-quantity edits made offline, rejecting
+any row modified on the server since the client last pulled it. Only
+get_changes advances the client's watermark.
+"""
+
+import gzip
+import json
+
+import frappe
+from frappe.model.db_query import DatabaseQuery
+from frappe.utils import add_to_date, cint, get_datetime, now_datetime
+
+from kaitet_taskwork.kaitet_taskwork.field_capture import save_actuals
+
+ASSIGNMENT_COLUMNS = [
+	"name", "title", "docstatus", "stage", "unitdivision", "company",
+	"start_date", "expected_end_date", "completion_date", "modified",
+]
+ROW_COLUMNS = [
+	"name", "parent", "idx", "employee_name", "worker_full_name", "task",
+	"assignment_date", "uom", "daily_target", "quantity_assigned", "rate",
+	"actual_quantity", "achievement", "location", "modified",
+]
+# Rows per response; the client pulls again with the returned watermark
+MAX_ROWS = 20000
+# A row's modified is set when it is written but it is only visible once its
+# transaction commits. Rows newer than this are left for the next pull, so a
+# slow commit cannot land behind a watermark that was already handed out.
+SYNC_LAG_SECONDS = 300
+
+
+def _table(columns, rows):
+	return {"columns": columns, "data": [[row[c] for c in columns] for row in rows]}
+
+
+@frappe.whitelist()
+def get_changes(since=None, since_name=None, unitdivision=None, gzip_response=0):
+	"""
+	Return records changed after the watermark (omit *since* for a full pull):
+	assignments, their worker rows, the current row names of every changed
+	assignment (so the client can drop deleted rows) and deleted assignments.
+
+	Pass the returned ``watermark`` / ``watermark_name`` as *since* /
+	*since_name* on the next call; when ``more`` is set, call again straight
+	away. Rows are paged on (modified, name), so rows sharing one timestamp
+	after a bulk write are never skipped. Assignments are filtered by the
+	user's permissions (user permissions and permission query conditions)
+	as in the list view.
+	"""
+	frappe.has_permission("Task Work Assignment", "read", throw=True)
+
+	since = str(get_datetime(since)) if since else "1900-01-01 00:00:00"
+	cutoff = str(add_to_date(now_datetime(), seconds=-SYNC_LAG_SECONDS))
+	values = {
+		"since": since,
+		"since_name": since_name or "",
+		"cutoff": cutoff,
+		"unit": unitdivision or "",
+		"limit": MAX_ROWS,
+	}
+	# Match conditions refer to the table by name, so it is not aliased here
+	conditions = ["`tabTask Work Assignment`.unitdivision = %(unit)s"] if unitdivision else []
+	match = DatabaseQuery("Task Work Assignment").build_match_conditions()
+	if match:
+		# The query is run with named parameters
+		conditions.append("({})".format(match.replace("%", "%%")))
+	condition = "".join(f" AND {c}" for c in conditions)
+
+	rows = frappe.db.sql(f"""
+		SELECT {", ".join(f"wa.{c}" for c in ROW_COLUMNS)}
+		FROM `tabWorker Assignments` wa
+		INNER JOIN `tabTask Work Assignment` ON `tabTask Work Assignment`.name = wa.parent
+		WHERE wa.parenttype = 'Task Work Assignment'
+		  AND (wa.modified > %(since)s OR (wa.modified = %(since)s AND wa.name > %(since_name)s))
+		  AND wa.modified <= %(cutoff)s
+		  {condition}
+		ORDER BY wa.modified, wa.name
+		LIMIT %(limit)s
+	""", values, as_dict=True)
+	more = len(rows) == MAX_ROWS
+
+	values["until"] = str(rows[-1].modified) if more else cutoff
+	assignments = frappe.db.sql(f"""
+		SELECT {", ".join(f"`tabTask Work Assignment`.{c}" for c in ASSIGNMENT_COLUMNS)}
+		FROM `tabTask Work Assignment`
+		WHERE `tabTask Work Assignment`.modified > %(since)s
+		  AND `tabTask Work Assignment`.modified <= %(until)s
+		  {condition}
+		ORDER BY `tabTask Work Assignment`.modified
+	""", values, as_dict=True)
+
+	watermark = max([get_datetime(since)] + [get_datetime(r.modified) for r in rows[-1:] + assignments])
+	watermark_name = rows[-1].name if rows and get_datetime(rows[-1].modified) == watermark else ""
+
+	row_names = {}
+	if assignments:
+		for parent, name in frappe.db.sql("""
+			SELECT parent, name FROM `tabWorker Assignments`
+			WHERE parent IN %(parents)s AND parenttype = 'Task Work Assignment'
+			ORDER BY parent, idx
+		""", {"parents": tuple(a.name for a in assignments)}):
+			row_names.setdefault(parent, []).append(name)
+
+	deleted = frappe.db.sql_list("""
+		SELECT deleted_name FROM `tabDeleted Document`
+		WHERE deleted_doctype = 'Task Work Assignment' AND creation > %(since)s
+	""", values)
+
+	payload = {
+		"watermark":      str(watermark),
+		"watermark_name": watermark_name,
+		"more":           more,
+		"assignments": _table(ASSIGNMENT_COLUMNS, assignments),
+		"rows":        _table(ROW_COLUMNS, rows),
+		"row_names":   row_names,
+		"deleted":     deleted,
+	}
+
+	if cint(gzip_response):
+		frappe.local.response.filename = "tw_changes.json.gz"
+		frappe.local.response.filecontent = gzip.compress(
+			json.dumps(payload, default=str, separators=(",", ":")).encode()
+		)
+		frappe.local.response.type = "download"
+		return
+
+	return payload
+
+
+@frappe.whitelist(methods=["POST"])
+def push_changes(changes):
+	"""
+	Apply offline edits: a list of ``{"name": row, "modified": as last pulled,
+	"actual_quantity": value}``. Rows changed on the server since then are
+	returned as conflicts with the server's values and are not applied;
+	rows of assignments the user cannot read are reported as not found.
+	Pull with get_changes afterwards to pick up the applied values.
+	"""
+	changes = frappe.parse_json(changes) if isinstance(changes, str) else changes
+	if not isinstance(changes, list):
+		frappe.throw("Changes must be a list.")
+
+	names = [change.get("name") for change in changes if change.get("name")]
+	current = {
+		row.name: row
+		for row in frappe.db.sql(f"""
+			SELECT {", ".join(ROW_COLUMNS)}
+			FROM `tabWorker Assignments`
+			WHERE name IN %(names)s AND parenttype = 'Task Work Assignment'
+		""", {"names": tuple(names) or ("",)}, as_dict=True)
+	}
+
+	readable = {}
+	conflicts, errors, records, record_names = [], [], [], []
+	for change in changes:
+		row = current.get(change.get("name"))
+		if row and row.parent not in readable:
+			readable[row.parent] = frappe.has_permission("Task Work Assignment", "read", row.parent)
+		if not row or not readable[row.parent]:
+			# Rows of assignments the user cannot read are not disclosed
+			errors.append({"name": change.get("name"), "message": "Row not found."})
+			continue
+		if not change.get("modified") or get_datetime(change["modified"]) != get_datetime(row.modified):
+			conflicts.append({"name": row.name, "server": {c: row[c] for c in ROW_COLUMNS}})
+			continue
+		records.append({
+			"assignment":      row.parent,
+			"worker":          row.employee_name,
+			"date":            row.assignment_date,
+			"task":            row.task,
+			"actual_quantity": change.get("actual_quantity"),
+		})
+		record_names.append(row.name)
+
+	result = save_actuals(records) if records else {"errors": [], "failed": []}
+	for error in result["errors"]:
+		name = record_names[error["line"] - 1] if error.get("line") else None
+		errors.append({"name": name, "message": error["message"]})
+
+	# save_actuals leaves an assignment untouched if any of its records fails
+	failed = set(result["failed"])
+	applied = [name for name in record_names if current[name].parent not in failed]
+	modified = dict(frappe.db.sql("""
+		SELECT name, modified FROM `tabWorker Assignments` WHERE name IN %(names)s
+	""", {"names": tuple(applied)})) if applied else {}
+
+	return {
+		"applied":   [{"name": name, "modified": str(modified.get(name))} for name in applied],
+		"conflicts": conflicts,
+		"errors":    errors,
+	}
@@ -0,0 +1,212 @@
+# Copyright (c) 2025, Upande and contributors
+# For license information, please see license.txt
+
+"""
+Bulk onboarding of Task Workers from a CSV/XLSX sheet.
+
+Rows are checked in memory (required fields, options, dates, payment
+details), supplied payroll numbers and banks are checked against Task
+Worker, Employee and Bank with a few set-based queries, missing numbers
+are allocated in one block, and the workers are written with multi-row
+INSERTs. Rows that fail are skipped and reported with their line numbers;
+the others are created.
+"""
+
+import frappe
+from frappe.utils import getdate, now
+
+from kaitet_taskwork.kaitet_taskwork.doctype.task_worker.task_worker import (
+	build_full_name,
+	payment_method_errors,
+)
+from kaitet_taskwork.kaitet_taskwork.doctype.tw_payroll_number.tw_payroll_number import (
+	allocate_payroll_numbers,
+	claim_payroll_numbers,
+	is_payroll_number,
+)
+from kaitet_taskwork.kaitet_taskwork.field_capture import _read_sheet
+
+# Task Worker field -> accepted header spellings, lower-cased
+COLUMN_ALIASES = {
+	"payroll_number": ("payroll_number", "payroll number", "payroll no"),
+	"first_name":     ("first_name", "first name"),
+	"second_name":    ("second_name", "second name", "middle name"),
+	"last_name":      ("last_name", "last name", "surname"),
+	"id_number":      ("id_number", "id number", "national id"),
+	"date_of_birth":  ("date_of_birth", "date of birth", "dob"),
+	"gender":         ("gender",),
+	"phone":          ("phone", "phone number"),
+	"status":         ("status",),
+	"payment_method": ("payment_method", "payment method"),
+	"bank_name":      ("bank_name", "bank name", "bank"),
+	"branch_name":    ("branch_name", "branch name", "branch"),
+	"account_number": ("account_number", "account number"),
+	"account_name":   ("account_name", "account name"),
+	"mpesa_phone":    ("mpesa_phone", "m-pesa phone", "mpesa phone"),
+	"mpesa_name":     ("mpesa_name", "m-pesa name", "mpesa name"),
+}
+REQUIRED = ("first_name", "last_name", "id_number")
+# Workers per INSERT statement
+INSERT_BATCH = 500
+
+
+def _select_options(fieldname):
+	return [o for o in (frappe.get_meta("Task Worker").get_field(fieldname).options or "").split("\n") if o]
+
+
+def _check_rows(records):
+	"""Clean *records* in memory; returns ``[(line, worker)]`` and the errors."""
+	options = {f: _select_options(f) for f in ("gender", "status", "payment_method")}
+	valid, errors = [], []
+
+	for line, record in enumerate(records, start=1):
+		worker = frappe._dict({
+			field: str(record.get(field)).strip() if record.get(field) not in (None, "") else None
+			for field in COLUMN_ALIASES
+		})
+		worker.status = worker.status or "Active"
+		worker.payment_method = worker.payment_method or "Bank Transfer"
+
+		messages = [f"{field.replace('_', ' ').title()} is required." for field in REQUIRED if not worker[field]]
+		for field, allowed in options.items():
+			if worker[field] and worker[field] not in allowed:
+				messages.append(f"{worker[field]} is not a valid {field.replace('_', ' ')}.")
+		if worker.date_of_birth:
+			try:
+				worker.date_of_birth = getdate(worker.date_of_birth)
+			except Exception:
+				messages.append(f"Invalid date of birth: {worker.date_of_birth}")
+		if worker.payroll_number and not is_payroll_number(worker.payroll_number):
+			messages.append("Payroll Number must be exactly 5 digits (e.g. 45677).")
+		messages += payment_method_errors(worker)
+
+		if messages:
+			errors.extend({"line": line, "message": message} for message in messages)
+		else:
+			worker.full_name = build_full_name(worker.first_name, worker.second_name, worker.last_name)
+			valid.append((line, worker))
+	return valid, errors
+
+
+def _check_references(rows, errors):
+	"""Set-based payroll number and bank checks; returns the rows that pass."""
+	supplied = {}
+	for line, worker in rows:
+		if worker.payroll_number:
+			supplied.setdefault(worker.payroll_number, []).append(line)
+
+	taken = {}
+	if supplied:
+		numbers = tuple(supplied)
+		for name in frappe.db.sql_list("SELECT name FROM `tabTask Worker` WHERE name IN %s", (numbers,)):
+			taken[name] = f"Task Worker {name}"
+		for number, employee in frappe.db.sql("""
+			SELECT TRIM(employee_number), name FROM `tabEmployee` WHERE TRIM(employee_number) IN %s
+		""", (numbers,)):
+			taken.setdefault(number, f"Employee {employee}")
+		# Reserved numbers without a holder may be used
+		for number, doctype, holder in frappe.db.sql("""
+			SELECT name, holder_doctype, holder FROM `tabTW Payroll Number`
+			WHERE name IN %s AND holder IS NOT NULL
+		""", (numbers,)):
+			taken.setdefault(number, f"{doctype} {holder}")
+
+	banks = {worker.bank_name for _, worker in rows if worker.bank_name}
+	known_banks = set(frappe.get_all("Bank", filters={"name": ["in", list(banks)]}, pluck="name")) if banks else set()
+
+	passed = []
+	for line, worker in rows:
+		messages = []
+		number = worker.payroll_number
+		if number and number in taken:
+			messages.append(f"Payroll Number {number} is already in use by {taken[number]}.")
+		elif number and len(supplied[number]) > 1:
+			messages.append(f"Payroll Number {number} appears on several lines.")
+		if worker.bank_name and worker.bank_name not in known_banks:
+			messages.append(f"Bank {worker.bank_name} not found.")
+		if messages:
+			errors.extend({"line": line, "message": message} for message in messages)
+		else:
+			passed.append((line, worker))
+	return passed
+
+
+def _insert_workers(workers):
+	fields = ["name", "owner", "creation", "modified", "modified_by", "docstatus", "idx",
+	          "active_assignments"] + list(COLUMN_ALIASES) + ["full_name"]
+	timestamp, user = now(), frappe.session.user
+	for i in range(0, len(workers), INSERT_BATCH):
+		frappe.db.bulk_insert("Task Worker", fields, [
+			[w.payroll_number, user, timestamp, timestamp, user, 0, 0, 0]
+			+ [w[field] for field in COLUMN_ALIASES] + [w.full_name]
+			for w in workers[i:i + INSERT_BATCH]
+		])
+
+
+def onboard_workers(records):
+	"""
+	Create Task Workers from *records* (dicts keyed by Task Worker field).
+	Returns ``{"created": count, "workers": [names], "errors": [{line, message}]}``.
+	"""
+	rows, errors = _check_rows(records)
+	rows = _check_references(rows, errors)
+
+	missing = [worker for _, worker in rows if not worker.payroll_number]
+	for worker, number in zip(missing, allocate_payroll_numbers(len(missing)) if missing else []):
+		worker.payroll_number = number
+
+	# A supplied number taken since the checks is reported, not inserted
+	claimed = claim_payroll_numbers(
+		{worker.payroll_number: worker.payroll_number for _, worker in rows}, "Task Worker"
+	) if rows else set()
+	created = []
+	for line, worker in rows:
+		if worker.payroll_number in claimed:
+			created.append(worker)
+		else:
+			errors.append({"line": line, "message": f"Payroll Number {worker.payroll_number} was taken during the import."})
+
+	_insert_workers(created)
+	errors.sort(key=lambda e: e["line"])
+	return {"created": len(created), "workers": [w.payroll_number for w in created], "errors": errors}
+
+
+@frappe.whitelist(methods=["POST"])
+def onboard_task_workers(records):
+	"""Whitelisted entry point for onboard_workers; *records* may be a JSON string."""
+	frappe.has_permission("Task Worker", "create", throw=True)
+	records = frappe.parse_json(records) if isinstance(records, str) else records
+	if not isinstance(records, list):
+		frappe.throw("Records must be a list.")
+	return onboard_workers(records)
+
+
+@frappe.whitelist(methods=["POST"])
+def import_task_workers(file_url):
+	"""Onboard Task Workers from an uploaded CSV/XLSX file with a header row."""
+	frappe.has_permission("Task Worker", "create", throw=True)
+
+	sheet = _read_sheet(file_url)
+	if not sheet:
+		frappe.throw("The file is empty.")
+
+	header = [str(cell or "").strip().lower() for cell in sheet[0]]
+	positions = {}
+	for field, aliases in COLUMN_ALIASES.items():
+		position = next((i for i, name in enumerate(header) if name in aliases), None)
+		if position is not None:
+			positions[field] = position
+	missing = [field for field in REQUIRED if field not in positions]
+	if missing:
+		frappe.throw(f"Missing column(s): {', '.join(missing)}.")
+
+	records = [
+		{field: (row[i] if i < len(row) else None) for field, i in positions.items()}
+		for row in sheet[1:]
+		if any(cell not in (None, "") for cell in row)
+	]
+	result = onboard_workers(records)
+	# Report file line numbers, counting the header
+	for error in result["errors"]:
+		error["line"] += 1
+	return result
@@ -0,0 +1,188 @@
+# Copyright (c) 2025, Upande and contributors
+# For license information, please see license.txt
+
+"""
+Bank and M-Pesa payout files for TW Weekly Disbursement.
+
+The bank / M-Pesa print formats render the whole disbursement to HTML, which
+does not scale past a few thousand rows. The export here reads entries from
+the database in keyset batches and writes CSV rows to disk as they are
+generated, so memory use stays flat whatever the size of the week.
+
+The file is saved as a private File attached to the disbursement and its URL
+returned. Frappe closes the database connection before a streamed HTTP body
+is iterated, so the rows cannot be read lazily while the response is sent.
+"""
+
+import csv
+import os
+
+import frappe
+from frappe.utils import flt, get_files_path
+
+from kaitet_taskwork.kaitet_taskwork.bulk import BATCH_SIZE
+
+BANK_HEADER = ["Beneficiary Name", "Bank", "Account Number", "Debit Account", "Amount", "Reference", "Narration"]
+MPESA_HEADER = ["Phone Number", "Amount", "Name", "ID Number", "Reference"]
+
+# Payout channel -> payment method test; same matching as the bank / M-Pesa
+# print formats, and shared with the payout dispatch
+PAYOUT_FORMATS = {
+	"bank":  lambda method: "Bank" in method,
+	"mpesa": lambda method: "pesa" in method.lower(),
+}
+
+
+class _Echo:
+	"""File-like object whose write() hands back the formatted line."""
+
+	def write(self, value):
+		return value
+
+
+def _iter_entries(disbursement):
+	"""Yield the disbursement's entries in idx order, one keyset batch at a time."""
+	from kaitet_taskwork.kaitet_taskwork.doctype.tw_weekly_disbursement.tw_weekly_disbursement import (
+		_get_worker_details_bulk,
+	)
+
+	last_idx = 0
+	while True:
+		rows = frappe.db.sql("""
+			SELECT e.idx, e.name, e.task_worker, e.worker_name, e.payment_method,
+			       e.bank_or_mpesa, e.net_amount, tw.id_number
+			FROM `tabTW Disbursement Entry` e
+			LEFT JOIN `tabTask Worker` tw ON tw.name = e.task_worker
+			WHERE e.parent = %s
+			  AND e.parenttype = 'TW Weekly Disbursement'
+			  AND e.parentfield = 'disbursement_entries'
+			  AND e.idx > %s
+			ORDER BY e.idx
+			LIMIT %s
+		""", (disbursement, last_idx, BATCH_SIZE), as_dict=True)
+		if not rows:
+			return
+
+		# Older entries may have been saved before payment details were resolved
+		missing = [r.task_worker for r in rows if not (r.payment_method and r.bank_or_mpesa)]
+		details = _get_worker_details_bulk(missing) if missing else {}
+		for row in rows:
+			info = details.get(row.task_worker) or {}
+			row.payment_method = row.payment_method or info.get("payment_method") or ""
+			row.bank_or_mpesa = row.bank_or_mpesa or info.get("bank_or_mpesa") or ""
+			row.worker_name = row.worker_name or info.get("worker_name") or row.task_worker
+			yield row
+
+		last_idx = rows[-1].idx
+
+
+def split_bank_account(bank_or_mpesa):
+	"""Split the ``"Bank – Account"`` string stored on entries into its two parts."""
+	bank, sep, account = (bank_or_mpesa or "").rpartition(" – ")
+	if not sep:
+		return "", bank_or_mpesa or ""
+	return bank.strip(), account.strip()
+
+
+def normalise_msisdn(phone):
+	"""Return *phone* in the 2547XXXXXXXX form expected by the B2C bulk file."""
+	digits = "".join(ch for ch in str(phone or "") if ch.isdigit())
+	if digits.startswith("0"):
+		digits = "254" + digits[1:]
+	elif len(digits) == 9:
+		digits = "254" + digits
+	return digits
+
+
+def _bank_rows(doc, entries):
+	debit_account = (
+		frappe.db.get_value("Bank Account", {"account": doc.payment_account}, "bank_account_no")
+		or (doc.payment_account or "").split(" - ")[0]
+	)
+	narration = f"Wages Week {doc.week_number} {doc.year}"
+	for row in entries:
+		bank, account = split_bank_account(row.bank_or_mpesa)
+		yield [row.worker_name, bank, account, debit_account, f"{flt(row.net_amount, 2):.2f}", row.name, narration]
+
+
+def _mpesa_rows(doc, entries):
+	for row in entries:
+		yield [
+			normalise_msisdn(row.bank_or_mpesa),
+			f"{flt(row.net_amount, 2):.2f}",
+			row.worker_name,
+			row.id_number or "",
+			row.name,
+		]
+
+
+def iter_payout_csv(doc, file_format):
+	"""
+	Yield the payout file for *doc* (the disbursement header: name,
+	payment_account, week_number and year) line by line. *file_format* is
+	``"bank"`` or ``"mpesa"``; entries paid by other methods, or with
+	nothing to pay, are left out.
+	"""
+	matches = PAYOUT_FORMATS[file_format]
+	entries = (
+		row for row in _iter_entries(doc.name)
+		if matches(row.payment_method) and flt(row.net_amount) > 0
+	)
+	header, rows = (BANK_HEADER, _bank_rows) if file_format == "bank" else (MPESA_HEADER, _mpesa_rows)
+
+	writer = csv.writer(_Echo())
+	yield writer.writerow(header)
+	for row in rows(doc, entries):
+		yield writer.writerow(row)
+
+
+@frappe.whitelist()
+def export_payout_file(disbursement, file_format):
+	"""
+	Write the bank or M-Pesa payout file for a submitted disbursement and
+	return the URL of the private File it was saved to.
+	"""
+	if file_format not in PAYOUT_FORMATS:
+		frappe.throw("File format must be 'bank' or 'mpesa'.")
+
+	# Header fields only; the entries are paged from the database
+	doc = frappe.db.get_value(
+		"TW Weekly Disbursement", disbursement,
+		["name", "docstatus", "payment_account", "week_number", "year"],
+		as_dict=True,
+	)
+	if not doc:
+		frappe.throw(f"TW Weekly Disbursement {disbursement} not found.")
+	frappe.has_permission("TW Weekly Disbursement", "read", doc.name, throw=True)
+	if doc.docstatus != 1:
+		frappe.throw("Payout files can only be exported from a submitted disbursement.")
+
+	file_name = f"{doc.name}-{file_format}.csv"
+	path = os.path.join(get_files_path(is_private=True), file_name)
+
+	lines = 0
+	with open(path, "w", newline="", encoding="utf-8") as f:
+		for line in iter_payout_csv(doc, file_format):
+			f.write(line)
+			lines += 1
+
+	file_url = f"/private/files/{file_name}"
+	existing = frappe.db.get_value("File", {
+		"file_url": file_url,
+		"attached_to_doctype": "TW Weekly Disbursement",
+		"attached_to_name": doc.name,
+	})
+	if existing:
+		# Same name on disk, so the existing File record already points at the new content
+		frappe.db.set_value("File", existing, "file_size", os.path.getsize(path))
+	else:
+		frappe.get_doc({
+			"doctype": "File",
+			"file_name": file_name,
+			"file_url": file_url,
+			"is_private": 1,
+			"attached_to_doctype": "TW Weekly Disbursement",
+			"attached_to_name": doc.name,
+		}).insert(ignore_permissions=True)
+
+	return {"file_url": file_url, "rows": max(lines - 1, 0)}
@@ -0,0 +1,296 @@
+# Copyright (c) 2025, Upande and contributors
+# For license information, please see license.txt
+
+"""
+Payout dispatch for paid TW Weekly Disbursements.
+
+One payout is sent per TW Disbursement Entry through a gateway client, from a
+thread pool bounded by a concurrency limit and a token-bucket rate limit.
+Gateway calls run in worker threads and never touch the database; results
+are written back from the job's own thread in batches.
+
+The entry name is sent as the idempotency key, so re-running the dispatch
+after a crash or for failed entries cannot pay a worker twice on a gateway
+that honours it. Entries already marked Sent are never resent.
+
+Site config:
+	tw_payout_gateway       dotted path of the gateway class
+	                        (MockPayoutGateway is used in developer mode if unset)
+	tw_payout_concurrency   parallel gateway calls (default 8)
+	tw_payout_rate_per_sec  gateway calls per second (default 20)
+	tw_payout_max_attempts  attempts per entry before it is marked Failed (default 3)
+"""
+
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import frappe
+from frappe.utils import cint, flt
+
+from kaitet_taskwork.kaitet_taskwork.bulk import update_rows
+from kaitet_taskwork.kaitet_taskwork.payout_export import (
+	PAYOUT_FORMATS,
+	normalise_msisdn,
+	split_bank_account,
+)
+
+MOCK_GATEWAY = "kaitet_taskwork.kaitet_taskwork.payouts.MockPayoutGateway"
+# Results are written back once this many entries have finished
+WRITE_BATCH = 200
+
+
+class PayoutRejected(Exception):
+	"""The gateway refused the payout; retrying will not help."""
+
+
+class GatewayBusy(Exception):
+	"""The gateway is throttling or temporarily unavailable; retry later."""
+
+
+class PayoutGateway:
+	"""Interface for payout gateways. ``send`` must be safe to call from several threads."""
+
+	def send(self, payout):
+		"""
+		Send one payout and return the gateway receipt. *payout* is a dict with
+		``reference`` (idempotency key), ``channel`` ("bank" or "mpesa"),
+		``destination``, ``bank``, ``name`` and ``amount``.
+		"""
+		raise NotImplementedError
+
+
+class MockPayoutGateway(PayoutGateway):
+	"""
+	Local stand-in gateway. It simulates latency, a capacity limit (raising
+	GatewayBusy when more than *capacity* calls are in flight) and random
+	transient failures, and returns the same receipt for a repeated reference.
+	"""
+
+	def __init__(self, latency=0.05, capacity=16, failure_rate=0.0, seed=None):
+		self.latency = latency
+		self.capacity = capacity
+		self.failure_rate = failure_rate
+		self._random = random.Random(seed)
+		self._lock = threading.Lock()
+		self._in_flight = 0
+		self.receipts = {}
+
+	def send(self, payout):
+		if not payout.get("destination"):
+			raise PayoutRejected("No account or phone number.")
+
+		with self._lock:
+			if payout["reference"] in self.receipts:
+				return self.receipts[payout["reference"]]
+			if self._in_flight >= self.capacity:
+				raise GatewayBusy("Too many requests in flight.")
+			self._in_flight += 1
+			fail = self._random.random() < self.failure_rate
+
+		try:
+			time.sleep(self.latency)
+			if fail:
+				raise GatewayBusy("Simulated gateway timeout.")
+			receipt = "MOCK" + uuid.uuid4().hex[:10].upper()
+			with self._lock:
+				receipt = self.receipts.setdefault(payout["reference"], receipt)
+			return receipt
+		finally:
+			with self._lock:
+				self._in_flight -= 1
+
+
+class RateLimiter:
+	"""Thread-safe token bucket allowing *rate* calls per second with bursts up to *burst*."""
+
+	def __init__(self, rate, burst=None):
+		self.rate = float(rate)
+		self.capacity = float(burst or max(rate, 1))
+		self._tokens = self.capacity
+		self._updated = time.monotonic()
+		self._lock = threading.Lock()
+
+	def acquire(self):
+		while True:
+			with self._lock:
+				now = time.monotonic()
+				self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+				self._updated = now
+				if self._tokens >= 1:
+					self._tokens -= 1
+					return
+				wait_for = (1 - self._tokens) / self.rate
+			time.sleep(wait_for)
+
+
+def get_gateway():
+	"""Instantiate the gateway named in site config."""
+	path = frappe.conf.get("tw_payout_gateway")
+	if not path:
+		if not frappe.conf.get("developer_mode"):
+			frappe.throw("No payout gateway is configured (site config key tw_payout_gateway).")
+		path = MOCK_GATEWAY
+	return frappe.get_attr(path)()
+
+
+def _send_with_retry(gateway, limiter, payout, max_attempts):
+	"""
+	Runs in a worker thread: send one payout, backing off on GatewayBusy.
+	Returns ``(status, receipt or error, attempts)``.
+	"""
+	for attempt in range(1, max_attempts + 1):
+		limiter.acquire()
+		try:
+			return "Sent", gateway.send(payout), attempt
+		except PayoutRejected as e:
+			return "Failed", str(e) or "Rejected by gateway", attempt
+		except GatewayBusy as e:
+			error = str(e) or "Gateway busy"
+		except Exception as e:
+			error = f"{type(e).__name__}: {e}"
+		if attempt < max_attempts:
+			time.sleep(min(0.2 * 2 ** attempt, 5) * (1 + random.random()))
+	return "Failed", error, max_attempts
+
+
+def _pending_payouts(disbursement, retry_failed):
+	statuses = ["", "Queued", "Failed"] if retry_failed else ["", "Queued"]
+	rows = frappe.db.sql("""
+		SELECT name, worker_name, payment_method, bank_or_mpesa, net_amount,
+		       IFNULL(payout_attempts, 0) AS payout_attempts
+		FROM `tabTW Disbursement Entry`
+		WHERE parent = %s
+		  AND parenttype = 'TW Weekly Disbursement'
+		  AND parentfield = 'disbursement_entries'
+		  AND paid = 1
+		  AND net_amount > 0
+		  AND IFNULL(payout_status, '') IN %s
+		ORDER BY idx
+	""", (disbursement, tuple(statuses)), as_dict=True)
+
+	payouts = []
+	unsupported = {}
+	for row in rows:
+		channel = next((c for c, matches in PAYOUT_FORMATS.items() if matches(row.payment_method or "")), None)
+		if not channel:
+			unsupported[row.name] = {
+				"payout_status": "Failed",
+				"payout_error": f"Unsupported payment method: {row.payment_method or 'not set'}",
+			}
+			continue
+		if channel == "mpesa":
+			bank, destination = "", normalise_msisdn(row.bank_or_mpesa)
+		else:
+			bank, destination = split_bank_account(row.bank_or_mpesa)
+		payouts.append({
+			"reference":   row.name,
+			"channel":     channel,
+			"destination": destination,
+			"bank":        bank,
+			"name":        row.worker_name,
+			"amount":      flt(row.net_amount, 2),
+			"attempts":    row.payout_attempts,
+		})
+	return payouts, unsupported
+
+
+def dispatch_payouts(disbursement, retry_failed=True, gateway=None, progress=None):
+	"""
+	Send every unsent payout of a paid disbursement. Returns counts of
+	``sent`` and ``failed`` entries. *progress* is called with
+	``(percent, message)`` as results come back.
+	"""
+	status = frappe.db.get_value("TW Weekly Disbursement", disbursement, "status")
+	if status != "Paid":
+		frappe.throw("Payouts can only be sent for a disbursement that has been marked as Paid.")
+
+	payouts, unsupported = _pending_payouts(disbursement, retry_failed)
+	update_rows("TW Disbursement Entry", unsupported)
+	update_rows("TW Disbursement Entry", {p["reference"]: {"payout_status": "Queued"} for p in payouts})
+	frappe.db.commit()
+
+	gateway = gateway or get_gateway()
+	concurrency = cint(frappe.conf.get("tw_payout_concurrency")) or 8
+	limiter = RateLimiter(flt(frappe.conf.get("tw_payout_rate_per_sec")) or 20)
+	max_attempts = cint(frappe.conf.get("tw_payout_max_attempts")) or 3
+
+	counts = {"sent": 0, "failed": len(unsupported)}
+	results = {}
+	done = 0
+
+	def flush():
+		update_rows("TW Disbursement Entry", results)
+		frappe.db.commit()
+		results.clear()
+
+	with ThreadPoolExecutor(max_workers=concurrency) as executor:
+		# Keep at most a few batches in flight so a very large week does not
+		# queue every payout up front
+		queue = iter(payouts)
+		in_flight = {}
+
+		def submit_next():
+			payout = next(queue, None)
+			if payout:
+				future = executor.submit(_send_with_retry, gateway, limiter, payout, max_attempts)
+				in_flight[future] = payout
+
+		for _ in range(concurrency * 4):
+			submit_next()
+
+		while in_flight:
+			finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+			for future in finished:
+				payout = in_flight.pop(future)
+				outcome, detail, attempts = future.result()
+				row = {"payout_status": outcome, "payout_attempts": payout["attempts"] + attempts}
+				if outcome == "Sent":
+					row.update(payment_reference=detail, payout_error="")
+					counts["sent"] += 1
+				else:
+					row["payout_error"] = detail
+					counts["failed"] += 1
+				results[payout["reference"]] = row
+				done += 1
+				submit_next()
+
+			if len(results) >= WRITE_BATCH:
+				flush()
+				if progress:
+					progress(int(done * 100 / len(payouts)), f"{done} of {len(payouts)} payouts processed…")
+
+	flush()
+	return counts
+
+
+def dispatch_payouts_job(disbursement, lock_key, retry_failed=True):
+	"""Background job behind TWWeeklyDisbursement.send_payouts."""
+	from kaitet_taskwork.kaitet_taskwork.doctype.tw_weekly_disbursement.tw_weekly_disbursement import (
+		_publish_progress,
+		_release_lock,
+	)
+
+	try:
+		counts = dispatch_payouts(
+			disbursement,
+			retry_failed=retry_failed,
+			progress=lambda percent, message: _publish_progress(disbursement, percent, message),
+		)
+		_publish_progress(
+			disbursement, 100,
+			f"Payouts sent: {counts['sent']}, failed: {counts['failed']}.",
+			status="Completed" if not counts["failed"] else "Failed",
+		)
+	except Exception:
+		frappe.db.rollback()
+		frappe.log_error(frappe.get_traceback(), f"TW payout dispatch failed: {disbursement}")
+		_publish_progress(
+			disbursement, 100,
+			"Sending payouts stopped with an error. See the Error Log; sent payouts are kept.",
+			status="Failed",
+		)
+	finally:
+		_release_lock(lock_key)
@@ -0,0 +1,100 @@
+# Copyright (c) 2026, Upande and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import today
+
+from kaitet_taskwork.kaitet_taskwork.bulk import (
+	delete_rows,
+	insert_child_rows,
+	save_child_table,
+	update_rows,
+)
+
+PARENT = "TW Weekly Disbursement"
+CHILD = "TW Disbursement Entry"
+FIELD = "disbursement_entries"
+
+
+def _stored(parent):
+	"""``{row name: row}`` of the parent's entries as stored."""
+	return {
+		row.name: row
+		for row in frappe.get_all(
+			CHILD,
+			filters={"parent": parent, "parenttype": PARENT, "parentfield": FIELD},
+			fields=["name", "idx", "task_worker", "gross_amount", "deductions", "paid", "modified"],
+		)
+	}
+
+
+class TestBulkWrites(IntegrationTestCase):
+	def setUp(self):
+		self.doc = frappe.get_doc({
+			"doctype": PARENT,
+			"year": 2026,
+			"week_number": 2,
+			"posting_date": today(),
+			"company": "_Test Company",
+			"wages_account": "_Test Wages",
+			"payment_account": "_Test Bank",
+			FIELD: [
+				{"task_worker": "TW-BULK-A", "gross_amount": 100},
+				{"task_worker": "TW-BULK-B", "gross_amount": 200},
+				{"task_worker": "TW-BULK-C", "gross_amount": 300},
+			],
+		})
+		# Entries point at workers that do not exist in the test site
+		self.doc.flags.ignore_links = True
+		self.doc.insert(ignore_permissions=True)
+		self.doc.reload()
+
+	def test_save_child_table_writes_only_the_diff(self):
+		a, b, c = self.doc.get(FIELD)
+		b.gross_amount = 250
+		self.doc.remove(c)
+		self.doc.append(FIELD, {"task_worker": "TW-BULK-D", "gross_amount": 400})
+		d = self.doc.get(FIELD)[-1]
+		before = _stored(self.doc.name)
+
+		written, deleted = save_child_table(self.doc, FIELD)
+
+		self.assertCountEqual(written, [b.name, d.name])
+		self.assertEqual(deleted, [c.name])
+		stored = _stored(self.doc.name)
+		self.assertCountEqual(stored, [a.name, b.name, d.name])
+		self.assertEqual(stored[b.name].gross_amount, 250)
+		self.assertEqual(stored[d.name].task_worker, "TW-BULK-D")
+		# The unchanged row was not rewritten
+		self.assertEqual(stored[a.name].modified, before[a.name].modified)
+
+	def test_save_child_table_without_changes_writes_nothing(self):
+		before = _stored(self.doc.name)
+
+		self.assertEqual(save_child_table(self.doc, FIELD), ([], []))
+		self.assertEqual(_stored(self.doc.name), before)
+
+	def test_insert_child_rows_defaults_missing_numbers(self):
+		names = insert_child_rows(
+			PARENT, self.doc.name, FIELD, CHILD, [{"task_worker": "TW-BULK-E"}], start_idx=4
+		)
+
+		row = _stored(self.doc.name)[names[0]]
+		self.assertEqual((row.idx, row.gross_amount, row.deductions, row.paid), (4, 0, 0, 0))
+
+	def test_update_rows_sets_different_fields_per_row(self):
+		a, b, _ = self.doc.get(FIELD)
+
+		update_rows(CHILD, {a.name: {"gross_amount": 150}, b.name: {"paid": 1}})
+
+		stored = _stored(self.doc.name)
+		self.assertEqual((stored[a.name].gross_amount, stored[a.name].paid), (150, 0))
+		self.assertEqual((stored[b.name].gross_amount, stored[b.name].paid), (200, 1))
+
+	def test_delete_rows(self):
+		a, b, c = self.doc.get(FIELD)
+
+		delete_rows(CHILD, [a.name, c.name])
+
+		self.assertEqual(list(_stored(self.doc.name)), [b.name])
@@ -0,0 +1,171 @@
+# Copyright (c) 2025, Upande and Contributors
+# See license.txt
+
+import time
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import today
+
+from kaitet_taskwork.kaitet_taskwork.payouts import (
+	GatewayBusy,
+	MockPayoutGateway,
+	PayoutRejected,
+	RateLimiter,
+	_send_with_retry,
+	dispatch_payouts,
+)
+
+
+class FlakyGateway(MockPayoutGateway):
+	"""Mock gateway that is busy for the first *busy_calls* calls."""
+
+	def __init__(self, busy_calls):
+		super().__init__(latency=0)
+		self.busy_calls = busy_calls
+		self.calls = 0
+
+	def send(self, payout):
+		self.calls += 1
+		if self.calls <= self.busy_calls:
+			raise GatewayBusy("Throttled.")
+		return super().send(payout)
+
+
+class CountingGateway(MockPayoutGateway):
+	"""Mock gateway recording the reference of every call."""
+
+	def __init__(self):
+		super().__init__(latency=0)
+		self.sent = []
+
+	def send(self, payout):
+		self.sent.append(payout["reference"])
+		return super().send(payout)
+
+
+def _payout(reference="TEST-ENTRY"):
+	return {
+		"reference":   reference,
+		"channel":     "mpesa",
+		"destination": "254712345678",
+		"bank":        "",
+		"name":        "Test Worker",
+		"amount":      100.0,
+	}
+
+
+class TestRateLimiter(IntegrationTestCase):
+	def test_calls_beyond_the_burst_wait_for_tokens(self):
+		limiter = RateLimiter(rate=50, burst=1)
+		started = time.monotonic()
+		for _ in range(11):
+			limiter.acquire()
+		# One call from the burst, then ten at 50 per second
+		self.assertGreaterEqual(time.monotonic() - started, 0.18)
+
+	def test_burst_is_not_throttled(self):
+		limiter = RateLimiter(rate=1, burst=5)
+		started = time.monotonic()
+		for _ in range(5):
+			limiter.acquire()
+		self.assertLess(time.monotonic() - started, 0.1)
+
+
+class TestSendWithRetry(IntegrationTestCase):
+	def setUp(self):
+		self.limiter = RateLimiter(rate=1000, burst=10)
+
+	def test_busy_gateway_is_retried_with_growing_backoff(self):
+		gateway = FlakyGateway(busy_calls=2)
+		with patch("kaitet_taskwork.kaitet_taskwork.payouts.time.sleep") as sleep:
+			status, receipt, attempts = _send_with_retry(gateway, self.limiter, _payout(), max_attempts=3)
+
+		self.assertEqual((status, attempts), ("Sent", 3))
+		self.assertEqual(receipt, gateway.receipts["TEST-ENTRY"])
+		delays = [call.args[0] for call in sleep.call_args_list]
+		self.assertEqual(len(delays), 2)
+		self.assertTrue(0.4 <= delays[0] < 0.8)
+		self.assertTrue(0.8 <= delays[1] < 1.6)
+
+	def test_busy_after_max_attempts_fails(self):
+		gateway = MockPayoutGateway(latency=0, capacity=0)
+		with patch("kaitet_taskwork.kaitet_taskwork.payouts.time.sleep") as sleep:
+			status, error, attempts = _send_with_retry(gateway, self.limiter, _payout(), max_attempts=3)
+
+		self.assertEqual((status, attempts), ("Failed", 3))
+		self.assertIn("in flight", error)
+		self.assertEqual(sleep.call_count, 2)
+
+	def test_rejected_payout_is_not_retried(self):
+		payout = dict(_payout(), destination="")
+		with patch("kaitet_taskwork.kaitet_taskwork.payouts.time.sleep") as sleep:
+			status, _, attempts = _send_with_retry(MockPayoutGateway(latency=0), self.limiter, payout, 3)
+
+		self.assertEqual((status, attempts), ("Failed", 1))
+		sleep.assert_not_called()
+		self.assertRaises(PayoutRejected, MockPayoutGateway(latency=0).send, payout)
+
+
+class TestDispatchPayouts(IntegrationTestCase):
+	def _paid_disbursement(self, entries):
+		doc = frappe.get_doc({
+			"doctype": "TW Weekly Disbursement",
+			"year": 2026,
+			"week_number": 1,
+			"posting_date": today(),
+			"company": "_Test Company",
+			"wages_account": "_Test Wages",
+			"payment_account": "_Test Bank",
+			"disbursement_entries": entries,
+		})
+		doc.flags.ignore_links = True
+		doc.insert(ignore_permissions=True)
+		frappe.db.set_value(doc.doctype, doc.name, "status", "Paid", update_modified=False)
+		frappe.db.sql("UPDATE `tabTW Disbursement Entry` SET paid = 1 WHERE parent = %s", doc.name)
+		return doc
+
+	def _entry(self, worker, **values):
+		return dict({
+			"task_worker":    worker,
+			"worker_name":    worker,
+			"payment_method": "M-Pesa",
+			"bank_or_mpesa":  "0712345678",
+			"gross_amount":   500,
+		}, **values)
+
+	def test_queued_entries_are_resent_idempotently_after_a_crash(self):
+		doc = self._paid_disbursement([
+			# Sent to the gateway, but the job died before the result was written
+			self._entry("TW-A", payout_status="Queued"),
+			# Queued but never sent
+			self._entry("TW-B", payout_status="Queued"),
+			self._entry("TW-C", payout_status="Sent", payment_reference="MOCKC"),
+		])
+		entries = {row.task_worker: row.name for row in doc.disbursement_entries}
+
+		gateway = CountingGateway()
+		gateway.receipts[entries["TW-A"]] = "MOCKPRIOR"
+
+		with patch.object(frappe.db, "commit"):
+			counts = dispatch_payouts(doc.name, gateway=gateway)
+			self.assertEqual(counts, {"sent": 2, "failed": 0})
+			self.assertCountEqual(gateway.sent, [entries["TW-A"], entries["TW-B"]])
+
+			stored = {
+				row.name: row
+				for row in frappe.get_all(
+					"TW Disbursement Entry",
+					filters={"parent": doc.name},
+					fields=["name", "payout_status", "payment_reference"],
+				)
+			}
+			self.assertEqual(stored[entries["TW-A"]].payment_reference, "MOCKPRIOR")
+			self.assertEqual(stored[entries["TW-B"]].payout_status, "Sent")
+			self.assertEqual(stored[entries["TW-C"]].payment_reference, "MOCKC")
+
+			# Running again sends nothing
+			gateway.sent.clear()
+			self.assertEqual(dispatch_payouts(doc.name, gateway=gateway), {"sent": 0, "failed": 0})
+			self.assertEqual(gateway.sent, [])
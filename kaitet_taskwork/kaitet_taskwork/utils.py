@@ -231,6 +231,73 @@ def _update_weekly_offs_to_current_year(current_year):
 	frappe.db.commit()
 
 
+# ─── Weekly Offs Lookup ──────────────────────────────────────────────────────
+
+def get_weekly_off_dates(workers, from_date, to_date):
+	"""
+	Return ``{worker: set of dates}`` of days off between *from_date* and
+	*to_date* for *workers*, from the holiday lists on their Weekly Offs rows
+	in submitted Employee Weekly Off Plans. Two queries in total.
+	"""
+	if not workers:
+		return {}
+
+	rows = frappe.db.sql("""
+		SELECT IFNULL(NULLIF(wo.employee_name, ''), wo.employee) AS worker, wo.holiday_list
+		FROM `tabWeekly Offs` wo
+		INNER JOIN `tabEmployee Weekly Off Plan` p ON p.name = wo.parent
+		WHERE p.docstatus = 1
+		  AND IFNULL(p.reverted, 0) = 0
+		  AND IFNULL(wo.holiday_list, '') != ''
+		  AND (wo.employee_name IN %(workers)s OR wo.employee IN %(workers)s)
+		  AND (p.start_date IS NULL OR p.start_date <= %(to_date)s)
+		  AND (p.end_date IS NULL OR p.end_date >= %(from_date)s)
+	""", {"workers": tuple(workers), "from_date": from_date, "to_date": to_date}, as_dict=True)
+	if not rows:
+		return {}
+
+	holidays = {}
+	for hol in frappe.db.sql("""
+		SELECT parent, holiday_date
+		FROM `tabHoliday`
+		WHERE parenttype = 'Holiday List'
+		  AND parent IN %(lists)s
+		  AND holiday_date BETWEEN %(from_date)s AND %(to_date)s
+	""", {"lists": tuple({r.holiday_list for r in rows}), "from_date": from_date, "to_date": to_date}, as_dict=True):
+		holidays.setdefault(hol.parent, set()).add(getdate(hol.holiday_date))
+
+	off = {}
+	for row in rows:
+		off.setdefault(row.worker, set()).update(holidays.get(row.holiday_list, ()))
+	return off
+
+
+# ─── Task Worker Unit ────────────────────────────────────────────────────────
+
+# Task Worker does not ship a unit field; sites add one as a custom field.
+# Fields checked, in order of preference.
+WORKER_UNIT_FIELDS = ("custom_unit", "unitdivision", "custom_unitdivision")
+
+
+def get_worker_unit_field(unit=None):
+	"""
+	Return the Task Worker field to filter *unit* on, or None. When a unit
+	is given but the site has no unit field, the user is told that workers
+	of every unit are listed.
+	"""
+	if not unit:
+		return None
+	meta = frappe.get_meta("Task Worker")
+	field = next((f for f in WORKER_UNIT_FIELDS if meta.has_field(f)), None)
+	if not field:
+		frappe.msgprint(
+			f"Task Worker has no unit field, so workers are not filtered by unit {unit}.",
+			indicator="orange",
+			alert=True,
+		)
+	return field
+
+
 # ─── Security Guard 60-hr Weekly Attendance ──────────────────────────────────
 
 def process_security_guard_attendance():
@@ -0,0 +1,10 @@
+import frappe
+
+from kaitet_taskwork.kaitet_taskwork.doctype.task_details.task_details import refresh_progress_rollups
+
+
+def execute():
+	"""Populate the Task Details progress rollups and assignment totals."""
+	names = frappe.get_all("Task Work Assignment", pluck="name")
+	for i in range(0, len(names), 500):
+		refresh_progress_rollups(names[i:i + 500])
@@ -0,0 +1,8 @@
+import frappe
+
+from kaitet_taskwork.kaitet_taskwork.doctype.task_worker.task_worker import refresh_busy_state
+
+
+def execute():
+	"""Set active_assignments (and a valid current_assignment) on every Task Worker."""
+	refresh_busy_state(frappe.get_all("Task Worker", pluck="name"))
@@ -0,0 +1,8 @@
+from kaitet_taskwork.kaitet_taskwork.doctype.tw_earnings_ledger.tw_earnings_ledger import (
+	rebuild_earnings_ledger,
+)
+
+
+def execute():
+	"""Populate the TW Earnings Ledger from existing Task Work Assignments."""
+	rebuild_earnings_ledger()
@@ -0,0 +1,8 @@
+from kaitet_taskwork.kaitet_taskwork.doctype.tw_worker_occupancy.tw_worker_occupancy import (
+	rebuild_worker_occupancy,
+)
+
+
+def execute():
+	"""Populate the TW Worker Occupancy index from submitted Task Work Assignments."""
+	rebuild_worker_occupancy()
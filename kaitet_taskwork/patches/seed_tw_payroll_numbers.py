@@ -0,0 +1,25 @@
+import frappe
+from frappe.utils import now
+
+
+def execute():
+	"""Register the payroll numbers already held by Task Workers and Employees."""
+	values = {"now": now()}
+	frappe.db.sql("""
+		INSERT IGNORE INTO `tabTW Payroll Number`
+			(name, owner, creation, modified, modified_by, docstatus, idx,
+			 status, holder_doctype, holder)
+		SELECT name, 'Administrator', %(now)s, %(now)s, 'Administrator', 0, 0,
+		       'Assigned', 'Task Worker', name
+		FROM `tabTask Worker`
+		WHERE name REGEXP '^[0-9]{5}$'
+	""", values)
+	frappe.db.sql("""
+		INSERT IGNORE INTO `tabTW Payroll Number`
+			(name, owner, creation, modified, modified_by, docstatus, idx,
+			 status, holder_doctype, holder)
+		SELECT TRIM(employee_number), 'Administrator', %(now)s, %(now)s, 'Administrator', 0, 0,
+		       'Assigned', 'Employee', name
+		FROM `tabEmployee`
+		WHERE TRIM(employee_number) REGEXP '^[0-9]{5}$'
+	""", values)